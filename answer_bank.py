@@ -0,0 +1,284 @@
+"""Answers generated ahead of time for the questions the data files already anticipate.
+
+Usage: python answer_bank.py [--app main] [--workers 4] [--out PATH]
+
+Every FAQ question in Data/*.json that the FAQ short-circuit does not answer
+already, and every menu leaf with a label of its own, is run through the
+app's own prompt pipeline and model pool (rate limits included) at
+background priority, --workers at a time. Questions that several services
+answer differently ("What are the pricing options?") get one answer per
+menu branch holding them, generated with that branch's context.
+
+Each answer is reviewed automatically (not empty, not a refusal, not too
+long, and sharing enough terms with the stored answer or menu message it
+stands in for) and the results go to one JSON file, keyed by a hash of the
+data files' contents, for people to read over: set "approved" to change
+what is served. The apps serve approved answers for exact (normalized)
+matches, after the FAQ short-circuit and before the menu router, the
+response cache and the model, and ignore a file built from other data or
+for the other app (each has its own, answer_bank_<app>.json). It needs GEMINI_API_KEY
+and FIREBASE_CREDENTIALS_JSON, like the apps.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import importlib
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from llm_pool import LLMOverloaded, BACKGROUND
+from conversation import estimate_tokens
+from menu_index import path_key
+from retrieval import normalize, tokenize
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+# Longest answer approved automatically; the chat UI is not the place for essays
+MAX_ANSWER_CHARS = 1500
+# Share of terms an answer must have in common with the text it stands in for
+MIN_GROUNDING = 0.2
+# Start of the reply the prompt asks for when the data does not answer the question
+REFUSAL = "sorry i can t answer this question"
+
+
+@dataclass(frozen=True)
+class Question:
+    text: str
+    # Menu branch the answer is generated and served in; () for everywhere
+    scope: tuple
+    source: str
+    # Stored answer or menu message the generated answer should agree with
+    reference: str
+
+
+def content_hash(data_dir, suffix='.json'):
+    """Version of the data files by content, so a bank built on one checkout is valid on every other"""
+    digest = hashlib.sha1()
+    for name in sorted(n for n in os.listdir(data_dir) if n.endswith(suffix)):
+        with open(os.path.join(data_dir, name), 'rb') as f:
+            digest.update(f"{name}:".encode() + f.read() + b";")
+    return digest.hexdigest()[:12]
+
+
+def likely_questions(data):
+    """Questions worth answering ahead of time for a DataSnapshot, in data file order"""
+    questions = {}
+    faq = data.faq_matcher
+
+    def answered_by_faq(text):
+        return faq.best_match(text)[0] >= faq.threshold
+
+    def add(question):
+        questions.setdefault((question.scope, normalize(question.text)), question)
+
+    by_question = defaultdict(list)
+    for position, passage in enumerate(data.passages):
+        if passage.question:
+            by_question[normalize(passage.question)].append((position, passage))
+    for norm, entries in by_question.items():
+        if answered_by_faq(norm):
+            continue
+        if len({passage.topic for _, passage in entries}) == 1:
+            _, passage = entries[0]
+            add(Question(passage.question, (), f"{passage.source}#{passage.id}", passage.answer))
+            continue
+        for position, passage in entries:
+            for branch, shard in data.shards.shards.items():
+                if position in shard.positions:
+                    add(Question(passage.question, branch, f"{passage.source}#{passage.id}", passage.answer))
+
+    labels = Counter(path[-1] for path in data.menu_index.nodes if path)
+    for path, entry in data.menu_index.nodes.items():
+        label = path[-1] if path else ''
+        # Leaves shared by many branches ("Buy Service") are actions, not topics
+        if entry['options'] or labels[label] != 1 or not tokenize(label):
+            continue
+        text = label if label.rstrip().endswith('?') else f"Tell me about {label}"
+        if not answered_by_faq(text):
+            add(Question(text, (), f"menu:{path_key(path)}", entry['message']))
+    return list(questions.values())
+
+
+def grounding(answer, reference):
+    """Share of the shorter text's terms that the other one has too; 1.0 without a reference"""
+    a, b = set(tokenize(answer)), set(tokenize(reference))
+    if not b:
+        return 1.0
+    if not a:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def review(answer, reference):
+    """Reason an answer should not be served, or None to approve it"""
+    if not answer:
+        return 'empty'
+    if normalize(answer).startswith(REFUSAL):
+        return 'refusal'
+    if len(answer) > MAX_ANSWER_CHARS:
+        return 'too long'
+    if grounding(answer, reference) < MIN_GROUNDING:
+        return 'ungrounded'
+    return None
+
+
+def generate_entries(questions, prompt_for, generate, workers=4, retries=3):
+    """Answer questions concurrently through generate(prompt_for(question)); returns (entries, stats).
+
+    Calls the pool sheds or rate-limits are retried after the delay they
+    carry, other failures after an exponential backoff, up to `retries`
+    times; a question that still fails is left out of the bank.
+    """
+    stats = Counter()
+    lock = threading.Lock()
+
+    def answer(question):
+        for attempt in range(retries + 1):
+            try:
+                return (generate(prompt_for(question)) or "").strip()
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                with lock:
+                    stats['retries'] += 1
+                time.sleep(e.retry_after if isinstance(e, LLMOverloaded) else 2 ** attempt)
+
+    entries = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='answer-bank') as pool:
+        futures = {pool.submit(answer, question): question for question in questions}
+        for future in as_completed(futures):
+            question = futures[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                stats['failed'] += 1
+                logger.warning("No answer for %r: %s", question.text, e)
+                continue
+            reason = review(text, question.reference)
+            stats['approved' if reason is None else 'rejected'] += 1
+            entries.append({'question': question.text, 'scope': list(question.scope), 'source': question.source,
+                            'answer': text, 'approved': reason is None, 'review': reason})
+    stats['seconds'] = time.perf_counter() - start
+    entries.sort(key=lambda entry: (entry['scope'], entry['question']))
+    return entries, dict(stats, questions=len(questions))
+
+
+def save(path, entries, data_hash, **meta):
+    """Write a bank file atomically, so serving workers never read half of one"""
+    bank = dict({'format': FORMAT, 'data_hash': data_hash,
+                 'created_at': datetime.now(timezone.utc).isoformat()}, **meta, entries=entries)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(bank, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class AnswerBank:
+    """The approved answers of a bank file, looked up by normalized question and menu branch"""
+
+    def __init__(self, entries=(), data_hash=None):
+        self.data_hash = data_hash
+        self.answers = {}
+        for entry in entries:
+            if entry.get('approved') and entry.get('answer'):
+                self.answers[(tuple(entry.get('scope') or ()), normalize(entry['question']))] = entry['answer']
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, data_hash, app=None):
+        """The bank at path if it was built for this app from data with this content hash, otherwise an empty one"""
+        try:
+            with open(path) as f:
+                bank = json.load(f)
+        except FileNotFoundError:
+            logger.info("No answer bank at %s", path)
+            return cls(data_hash=data_hash)
+        except (OSError, ValueError) as e:
+            logger.warning("Answer bank %s unreadable, not serving from it: %s", path, e)
+            return cls(data_hash=data_hash)
+        if bank.get('format') != FORMAT or bank.get('data_hash') != data_hash:
+            logger.warning("Answer bank %s was built for data %s, not %s; run answer_bank.py to rebuild it",
+                           path, bank.get('data_hash'), data_hash)
+            return cls(data_hash=data_hash)
+        # The apps build different prompts, so one app's answers are not the other's
+        if app is not None and bank.get('app') != app:
+            logger.warning("Answer bank %s was built for %s.py, not %s.py; not serving from it",
+                           path, bank.get('app'), app)
+            return cls(data_hash=data_hash)
+        return cls(bank.get('entries', ()), data_hash)
+
+    def _lookup(self, query, branch):
+        norm = normalize(query)
+        answer = self.answers.get((tuple(branch or ()), norm))
+        if answer is None and branch:
+            answer = self.answers.get(((), norm))
+        return answer
+
+    def has(self, query, branch=None):
+        """Whether answer() would serve query in this menu branch, without counting a lookup"""
+        return bool(self.answers) and self._lookup(query, branch) is not None
+
+    def answer(self, query, branch=None):
+        """Banked answer for query in this menu branch (or anywhere), else None"""
+        if not self.answers:
+            return None
+        answer = self._lookup(query, branch)
+        with self._lock:
+            self.lookups += 1
+            if answer is not None:
+                self.hits += 1
+        if answer is not None:
+            logger.info("Answer bank hit for %r", query)
+        return answer
+
+    def stats(self):
+        return {
+            'entries': len(self.answers),
+            'lookups': self.lookups,
+            'hits': self.hits
+        }
+
+
+def build_for_app(app, workers=4, retries=3):
+    """Generate the bank for an imported app module's current data, through its prompt builder and model pool"""
+    data = app.data_store.current
+
+    def generate(prompt):
+        return app.llm_pool.call(lambda: app.generate_content(prompt).text, timeout=app.GEMINI_DEADLINE,
+                                 priority=BACKGROUND, cost=estimate_tokens(prompt))
+
+    return generate_entries(likely_questions(data), lambda q: app.bank_prompt(q.text, data, q.scope or None),
+                            generate, workers, retries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate answers ahead of time for the questions in Data/*.json")
+    parser.add_argument('--app', default='main', choices=('main', 'test'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--out', help="bank file to write (default: the app's ANSWER_BANK_PATH)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # Enough pool threads for the job's workers; the host-wide rate limits still apply
+    os.environ.setdefault('LLM_WORKERS', str(args.workers))
+    os.environ.setdefault('DATA_RELOAD_INTERVAL', '0')
+    app = importlib.import_module(args.app)
+    if not app.model:
+        sys.exit("GEMINI_API_KEY is not set")
+    out = args.out or app.ANSWER_BANK_PATH
+    entries, stats = build_for_app(app, args.workers, args.retries)
+    save(out, entries, content_hash(app.DATA_DIR), app=args.app, model=app.model.model_name)
+    logger.info("%d questions in %.1fs (%.2f/s): %d approved, %d rejected, %d failed, %d retries -> %s",
+                stats['questions'], stats['seconds'], stats['questions'] / stats['seconds'] if stats['seconds'] else 0,
+                stats.get('approved', 0), stats.get('rejected', 0), stats.get('failed', 0), stats.get('retries', 0), out)
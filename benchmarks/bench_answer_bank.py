@@ -0,0 +1,110 @@
+"""Answer bank build throughput and serving, offline.
+
+Imports the app against the in-memory Firestore stand-in and a stub model
+that answers with the first passage of its prompt after --model-ms of
+latency, then:
+
+  1. builds the bank with 1, 4 and 16 job workers through the app's own
+     prompt builder and model pool, and reports questions/second and how
+     many answers the automatic review approved;
+  2. loads the last bank into the app and asks each of its questions
+     through POST /process_custom_input in a new chat, as the chat page does, checking
+     that the bank answers it (not the FAQ, the menu router or the model),
+     inside and outside menu branches.
+
+The host-wide call limit is off unless --qps is given, so the numbers show
+the job's own concurrency rather than the quota.
+
+    python benchmarks/bench_answer_bank.py [--app main|test] [--model-ms 400] [--qps 0]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import importlib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeFirestore, FakeModel, Latency, install_fake_firebase
+from answer_bank import build_for_app, content_hash, save
+
+WORKERS = (1, 4, 16)
+PASSAGE_RE = re.compile(r"^\[[^\]\n]+\]\n(.+?)(?:\n\n|\Z)", re.MULTILINE | re.DOTALL)
+
+
+class GroundedModel(FakeModel):
+    """Stub model that answers with the first passage of the prompt's data block"""
+
+    def _words(self, prompt):
+        match = PASSAGE_RE.search(prompt)
+        return [match.group(1)[:800] if match else "Sorry, I can't answer this question."]
+
+
+def load_app(name, args):
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    os.environ.pop('GEMINI_API_KEY', None)
+    scratch = tempfile.mkdtemp(prefix='bizowl_bench_')
+    os.environ['RESPONSE_CACHE_PATH'] = os.path.join(scratch, 'cache.sqlite3')
+    os.environ['LLM_LIMITS_PATH'] = os.path.join(scratch, 'limits.sqlite3')
+    os.environ['ANSWER_BANK_PATH'] = os.path.join(scratch, 'answer_bank.json')
+    os.environ['LLM_GLOBAL_QPS'] = str(args.qps)
+    os.environ['LLM_WORKERS'] = str(max(WORKERS))
+    os.environ['DATA_RELOAD_INTERVAL'] = '0'
+    install_fake_firebase(FakeFirestore())
+    module = importlib.import_module(name)
+    module.model = GroundedModel(Latency(args.model_ms, seed=2), chunks=1)
+    return module
+
+
+def ask(module, question, branch=None):
+    """The app's reply to question typed into a new chat in a menu branch, and the model calls it took"""
+    calls = module.model.latency.calls
+    client = module.app.test_client()
+    client.get('/')
+    with client.session_transaction() as session:
+        session['menu_path'] = list(branch) if branch else None
+    reply = client.post('/process_custom_input', json={'input': question}).get_json()
+    return reply, module.model.latency.calls - calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--app', default='main', choices=('main', 'test'))
+    parser.add_argument('--model-ms', type=float, default=400)
+    parser.add_argument('--qps', type=float, default=0)
+    args = parser.parse_args()
+    module = load_app(args.app, args)
+
+    print(f"{args.app}: {args.model_ms:g}ms per model call, host limit "
+          f"{f'{args.qps:g} calls/s' if args.qps else 'off'}")
+    print(f"{'workers':>7} {'questions':>9} {'seconds':>8} {'q/s':>6} {'approved':>8} {'rejected':>8} {'failed':>6}")
+    for workers in WORKERS:
+        entries, stats = build_for_app(module, workers)
+        print(f"{workers:>7} {stats['questions']:>9} {stats['seconds']:8.1f} "
+              f"{stats['questions'] / stats['seconds']:6.1f} {stats.get('approved', 0):>8} "
+              f"{stats.get('rejected', 0):>8} {stats.get('failed', 0):>6}")
+
+    save(module.ANSWER_BANK_PATH, entries, content_hash(module.DATA_DIR), app=args.app, model='stub')
+    module.data_store.reload(force=True)
+    bank = module.data_store.current.answer_bank
+    served = calls = routed = 0
+    approved = [entry for entry in entries if entry['approved']]
+    start = time.perf_counter()
+    for entry in approved:
+        reply, used = ask(module, entry['question'], entry['scope'])
+        served += reply['response'] == entry['answer']
+        routed += 'path' in reply
+        calls += used
+    elapsed = time.perf_counter() - start
+    scoped = sum(1 for entry in approved if entry['scope'])
+    print(f"serving: {len(bank.answers)} entries loaded; {served} of {len(approved)} approved questions "
+          f"({scoped} in menu branches) answered from the bank, {routed} by the menu router, with {calls} model calls, "
+          f"{elapsed / max(len(approved), 1) * 1000:.2f}ms each -> {'OK' if served == len(approved) and not calls else 'FAILED'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Compare worker startup time and memory: JSON data files vs the mmap'd msgpack bundle.
+
+Each mode loads the data in a fresh process, builds the same indexes the
+apps build, and reports:
+
+  load     time to get the menu, passages and company data into memory
+  total    load plus the BM25 index, FAQ matcher and intent router
+  rss/uss  resident and private (unshared) memory of that process, which is
+           what every worker pays when the app is not preloaded
+  forked   private memory a forked worker accumulates while serving every
+           menu path, the menu tree and some searches from preloaded data
+           (gc frozen first, as gunicorn.conf.py does)
+
+Modes: "json-before" is the loader before the bundle existed (it also kept
+the parsed company data and the full static prompt), "json" is the default
+(DATA_BUNDLE_PATH unset) and "bundle" is DATA_BUNDLE_PATH set. Memory figures
+need Linux /proc.
+
+    python benchmarks/bench_bundle.py [--runs 3]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+DATA_DIR = os.path.join(BASE_DIR, 'Data')
+MODES = ('json-before', 'json', 'bundle')
+QUERIES = ["website development cost", "branding strategy", "swot analysis for a bakery", "refund policy"]
+
+
+def memory_kb():
+    """(rss, uss) of this process in KB, or (None, None) without /proc"""
+    kb = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    kb[key] = int(value.split()[0])
+    except OSError:
+        return None, None
+    return kb.get('Rss'), kb.get('Private_Clean', 0) + kb.get('Private_Dirty', 0)
+
+
+def load(mode, bundle_path):
+    from fingerprint import compact_json, directory_fingerprint
+    from menu_index import MenuIndex
+    from retrieval import load_passages
+    if mode == 'bundle':
+        from data_bundle import BundleMenuIndex, open_bundle
+        bundle = open_bundle(DATA_DIR, bundle_path, directory_fingerprint(DATA_DIR))
+        return BundleMenuIndex(bundle), bundle.passages(), None
+    with open(os.path.join(DATA_DIR, 'temp_data.json')) as f:
+        menu_index = MenuIndex(json.load(f))
+    passages = load_passages(DATA_DIR)
+    if mode == 'json':
+        return menu_index, passages, None
+    with open(os.path.join(DATA_DIR, 'data.json')) as f:
+        company_data = json.load(f)
+    return menu_index, passages, (company_data, compact_json(company_data))
+
+
+def serve(menu_index, knowledge_index):
+    """Touch everything a worker's requests would"""
+    for path in list(menu_index.nodes):
+        menu_index.lookup(path)
+        menu_index.response_json(path)
+    len(menu_index.tree_json)
+    for query in QUERIES:
+        knowledge_index.search(query)
+
+
+def child(mode, bundle_path):
+    from retrieval import BM25Index
+    from faq_match import FAQMatcher
+    from intent_router import IntentRouter
+    start = time.perf_counter()
+    menu_index, passages, extra = load(mode, bundle_path)
+    loaded = time.perf_counter()
+    knowledge_index = BM25Index(passages)
+    FAQMatcher(passages)
+    IntentRouter(menu_index)
+    total = time.perf_counter()
+    gc.collect()
+    rss, uss = memory_kb()
+
+    gc.freeze()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        _, before = memory_kb()
+        serve(menu_index, knowledge_index)
+        _, after = memory_kb()
+        os.write(write_fd, json.dumps(None if before is None else after - before).encode())
+        os._exit(0)
+    os.close(write_fd)
+    forked = json.loads(os.read(read_fd, 1024) or b'null')
+    os.waitpid(pid, 0)
+    print(json.dumps({'load_ms': (loaded - start) * 1000, 'total_ms': (total - start) * 1000,
+                      'rss_kb': rss, 'uss_kb': uss, 'forked_kb': forked}))
+
+
+def run(mode, bundle_path):
+    out = subprocess.run([sys.executable, __file__, '--child', mode, '--bundle', bundle_path],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--child', choices=MODES)
+    parser.add_argument('--bundle', default=os.path.join(tempfile.mkdtemp(prefix='bizowl_bundle_'), 'data.msgpack'))
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.bundle)
+        return
+
+    from data_bundle import compile_bundle
+    from fingerprint import directory_fingerprint
+    start = time.perf_counter()
+    compile_bundle(DATA_DIR, args.bundle, directory_fingerprint(DATA_DIR))
+    print(f"bundle compiled in {(time.perf_counter() - start) * 1000:.0f}ms, "
+          f"{os.path.getsize(args.bundle) / 1024:.0f} KB ({args.runs} runs per mode, medians)")
+    print(f"{'mode':<12} {'load ms':>8} {'total ms':>9} {'rss KB':>8} {'uss KB':>8} {'forked KB':>10}")
+    for mode in MODES:
+        runs = [run(mode, args.bundle) for _ in range(args.runs)]
+
+        def median(key):
+            values = sorted(r[key] for r in runs if r[key] is not None)
+            return values[len(values) // 2] if values else float('nan')
+        print(f"{mode:<12} {median('load_ms'):8.1f} {median('total_ms'):9.1f} {median('rss_kb'):8.0f} "
+              f"{median('uss_kb'):8.0f} {median('forked_kb'):10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Export throughput and resumability against the in-memory Firestore stand-in.
+
+Builds a synthetic dataset (--chats chats with --messages messages each,
+Firestore-style random IDs), then:
+
+  1. exports it with 1, 4 and 16 workers and reports documents/second,
+     output size and the number of queries, with every query costing
+     --read-ms of latency like a Firestore round trip;
+  2. interrupts an export halfway, resumes it, and checks the result holds
+     every document exactly once;
+  3. reports the peak Python memory of an export at two dataset sizes, to
+     show it does not grow with the data.
+
+    python benchmarks/bench_export.py [--chats 2000] [--messages 20] [--read-ms 20]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeFirestore, Latency
+from export_chats import ID_ALPHABET, ChatExporter, read_export
+
+WORDS = "website branding swot analysis pricing startup bakery logo investor deck refund timeline consultation".split()
+
+
+def synthetic_db(chats, messages, seed=1):
+    """FakeFirestore holding chats/{id} and chats/{id}/messages/{id} documents"""
+    rng = random.Random(seed)
+    new_id = lambda: ''.join(rng.choice(ID_ALPHABET) for _ in range(20))
+    db = FakeFirestore()
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for _ in range(chats):
+        chat_id = new_id()
+        created = start + timedelta(minutes=rng.randrange(500000))
+        db._set(('chats', chat_id), {'created_at': created, 'updated_at': created, 'status': 'active',
+                                     'message_count': messages, 'has_contact': rng.random() < 0.2}, False)
+        for n in range(messages):
+            db._set(('chats', chat_id, 'messages', new_id()), {
+                'content': " ".join(rng.choice(WORDS) for _ in range(rng.randrange(4, 40))),
+                'sender': 'user' if n % 2 == 0 else 'bot',
+                'timestamp': created + timedelta(seconds=20 * n)
+            }, False)
+    return db
+
+
+def export(db, workers, shards, page_size, stop=None, fresh=True, out_dir=None):
+    out_dir = out_dir or tempfile.mkdtemp(prefix='bizowl_export_')
+    exporter = ChatExporter(db, out_dir, workers=workers, shards=shards, page_size=page_size, stop=stop)
+    queries = db.latency.calls
+    start = time.perf_counter()
+    done = exporter.run(fresh=fresh)
+    return exporter, done, time.perf_counter() - start, db.latency.calls - queries, out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--read-ms', type=float, default=20)
+    parser.add_argument('--shards', type=int, default=32)
+    parser.add_argument('--page-size', type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    db = synthetic_db(args.chats, args.messages)
+    total = args.chats * (args.messages + 1)
+    print(f"dataset: {args.chats} chats x {args.messages} messages = {total} documents "
+          f"(built in {time.perf_counter() - start:.1f}s), {args.read_ms:g}ms per query")
+    db.latency = Latency(args.read_ms, seed=3)
+
+    print(f"{'workers':>7} {'seconds':>8} {'docs/s':>9} {'queries':>8} {'MB out':>7}")
+    for workers in (1, 4, 16):
+        exporter, done, elapsed, queries, out_dir = export(db, workers, args.shards, args.page_size)
+        documents = exporter.stats['chats'] + exporter.stats['messages']
+        assert done and documents == total, (done, documents, total)
+        print(f"{workers:>7} {elapsed:8.1f} {documents / elapsed:9.0f} {queries:>8} {exporter.stats['bytes'] / 1e6:7.1f}")
+        shutil.rmtree(out_dir)
+
+    # Interrupt once half the chat pages are written, then resume into the same directory
+    stop = threading.Event()
+    pages = -(-args.chats // args.page_size)
+    exporter = ChatExporter(db, tempfile.mkdtemp(prefix='bizowl_export_'), workers=4, shards=args.shards,
+                            page_size=args.page_size, stop=stop)
+
+    def interrupt():
+        while exporter.stats['pages'] < pages // 2 and not stop.is_set():
+            time.sleep(0.005)
+        stop.set()
+    threading.Thread(target=interrupt, daemon=True).start()
+    first_done = exporter.run(fresh=True)
+    first = exporter.stats['chats'] + exporter.stats['messages']
+    resumed, done, _, _, out_dir = export(db, 4, args.shards, args.page_size, fresh=False, out_dir=exporter.out_dir)
+    seen = set()
+    duplicates = 0
+    for doc in read_export(out_dir):
+        key = (doc['kind'], doc.get('chat_id'), doc['id'])
+        duplicates += key in seen
+        seen.add(key)
+    print(f"resume: first run stopped={not first_done} after {first} docs, resumed run wrote "
+          f"{resumed.stats['chats'] + resumed.stats['messages']}; export holds {len(seen)} of {total} "
+          f"documents, {duplicates} duplicates -> {'OK' if done and len(seen) == total and not duplicates else 'FAILED'}")
+    shutil.rmtree(out_dir)
+
+    # Peak traced memory at two dataset sizes, without latency
+    for chats in (args.chats // 4, args.chats):
+        small = synthetic_db(chats, args.messages, seed=chats)
+        tracemalloc.start()
+        _, _, _, _, out_dir = export(small, 4, args.shards, args.page_size)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        shutil.rmtree(out_dir)
+        print(f"memory: {chats * (args.messages + 1)} documents -> peak {peak / 1e6:.1f} MB allocated during export")
+
+
+if __name__ == '__main__':
+    main()
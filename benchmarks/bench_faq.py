@@ -0,0 +1,52 @@
+"""Report FAQ short-circuit hit rate and latency at several thresholds.
+
+Queries are every stored question, lightly perturbed (lowercased, punctuation
+dropped, "what is" contracted), plus off-topic and vague messages that should
+always go to the model.
+
+    python benchmarks/bench_faq.py
+"""
+import os
+import sys
+import time
+import contextlib
+import io
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from faq_match import FAQMatcher
+from retrieval import load_passages
+
+MISSES = [
+    "hello",
+    "What's the weather like today?",
+    "I don't know which service to choose",
+    "I have an idea for a food delivery app, what should I do?",
+    "Can you compare your branding and logo design services?",
+]
+
+
+def perturb(question):
+    return question.lower().rstrip('?').replace("what is", "whats")
+
+
+def main():
+    passages = load_passages(os.path.join(BASE_DIR, 'Data'))
+    questions = [p.question for p in passages if p.question and not p.has_extra]
+    queries = [perturb(q) for q in questions] + MISSES
+    print(f"{len(queries)} queries ({len(questions)} perturbed FAQ questions, {len(MISSES)} expected misses)")
+    for threshold in (0.8, 0.85, 0.9, 0.95):
+        matcher = FAQMatcher(passages, threshold=threshold)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            false_hits = sum(1 for q in MISSES if matcher.answer(q))
+            for q in queries[:-len(MISSES)]:
+                matcher.answer(q)
+        per_query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"threshold {threshold:.2f}: hit rate {matcher.hit_rate:6.1%}  "
+              f"false hits {false_hits}/{len(MISSES)}  {per_query_ms:.2f} ms/query")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Micro-benchmark: per-request prompt build time and size, through the app's own prompt builder.
+
+Compares the original prompt (the whole of data.json re-serialized with
+indent=2 on every request) with what create_gemini_prompt builds now: the
+whole data block rendered once per data version (PROMPT_TOP_K=0), and the
+retrieved passages (the default). The app is imported against the
+in-memory Firestore stand-in.
+
+    python benchmarks/bench_prompt.py [--app main|test] [--iterations 200]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import dataclasses
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeFirestore, install_fake_firebase
+from fingerprint import compact_json
+
+HISTORY = "User: What services do you offer?\nAssistant: We offer branding, SWOT analysis and more."
+QUERY = "How much does a SWOT analysis cost?"
+
+
+def load_app(name):
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    os.environ.pop('GEMINI_API_KEY', None)
+    os.environ['DATA_RELOAD_INTERVAL'] = '0'
+    install_fake_firebase(FakeFirestore())
+    return importlib.import_module(name)
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        prompt = fn()
+    return (time.perf_counter() - start) / iterations, prompt
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--app', default='main', choices=('main', 'test'))
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+    module = load_app(args.app)
+    data = module.data_store.current
+    with open(os.path.join(module.DATA_DIR, 'data.json'), 'r') as f:
+        company_data = json.load(f)
+    # The history argument only exists in test.py's builder
+    history = (HISTORY,) if args.app == 'test' else ()
+
+    def build_before():
+        return module.render_static_prompt(json.dumps(company_data, indent=2)) + f"\nUSER QUERY: {QUERY}\n"
+
+    def build_full(snapshot):
+        module.PROMPT_TOP_K = 0
+        try:
+            return module.create_gemini_prompt(QUERY, *history, snapshot)
+        finally:
+            module.PROMPT_TOP_K = top_k
+
+    top_k = module.PROMPT_TOP_K
+    full = dataclasses.replace(data, static_prompt=module.render_static_prompt(compact_json(company_data)))
+    results = [
+        ('before', timed(build_before, args.iterations)),
+        ('full data', timed(lambda: build_full(full), args.iterations)),
+        (f'top {top_k}', timed(lambda: module.create_gemini_prompt(QUERY, *history, data), args.iterations)),
+    ]
+    before_s, before_prompt = results[0][1]
+    print(f"{args.app}: {args.iterations} iterations")
+    for name, (seconds, prompt) in results:
+        size = len(prompt.encode())
+        print(f"{name:<10} {seconds * 1e3:8.3f} ms/request {size:>8} bytes  "
+              f"{before_s / seconds:6.1f}x faster, {100 * (1 - size / len(before_prompt.encode())):5.1f}% smaller")
+
+
+if __name__ == '__main__':
+    main()
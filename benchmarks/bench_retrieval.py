@@ -0,0 +1,60 @@
+"""Benchmark the BM25 knowledge index: build time over every Data/*.json file,
+query latency, and the size of the retrieved data block versus the whole of
+data.json.
+
+    python benchmarks/bench_retrieval.py [iterations] [top_k]
+"""
+import os
+import sys
+import json
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fingerprint import compact_json
+from retrieval import BM25Index, load_passages, format_passages, data_files
+
+DATA_DIR = os.path.join(BASE_DIR, 'Data')
+QUERIES = [
+    "What services do you offer?",
+    "What is a SWOT analysis?",
+    "How much does website development cost?",
+    "Can I get a refund if I am not satisfied?",
+    "I have a startup idea, how do I validate it?",
+    "How long does logo design take?",
+    "Do you help with branding strategy for a new company?",
+    "What is included in the business model canvas consultation?",
+]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    top_k = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    corpus_bytes = sum(os.path.getsize(p) for p in data_files(DATA_DIR))
+
+    start = time.perf_counter()
+    passages = load_passages(DATA_DIR)
+    loaded = time.perf_counter()
+    index = BM25Index(passages)
+    built = time.perf_counter()
+
+    start_q = time.perf_counter()
+    for i in range(iterations):
+        index.search(QUERIES[i % len(QUERIES)], top_k)
+    query_s = (time.perf_counter() - start_q) / iterations
+
+    with open(os.path.join(DATA_DIR, 'data.json'), 'r') as f:
+        full_bytes = len(compact_json(json.load(f)).encode())
+    block_bytes = [len(format_passages([p for _, p in index.search(q, top_k)]).encode()) for q in QUERIES]
+
+    print(f"corpus:        {corpus_bytes} bytes, {len(passages)} passages, {len(index.postings)} terms")
+    print(f"load + parse:  {(loaded - start) * 1e3:8.2f} ms")
+    print(f"index build:   {(built - loaded) * 1e3:8.2f} ms")
+    print(f"query (k={top_k}):   {query_s * 1e6:8.1f} us avg over {iterations}")
+    print(f"data block:    {sum(block_bytes) / len(block_bytes):8.0f} bytes avg vs {full_bytes} bytes full "
+          f"({full_bytes / (sum(block_bytes) / len(block_bytes)):.1f}x smaller)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""In-memory stand-ins for Firestore and the Gemini model, for offline benchmarks.
+
+Both take a latency (milliseconds, with +/- jitter) and a failure rate so the
+app's fallback paths can be exercised as well as its happy path. Call
+install_fake_firebase() before importing main or test: they connect to
+Firebase at import time.
+"""
+import time
+import random
+import threading
+import uuid
+import operator
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP, Increment
+
+
+class FakeFailure(Exception):
+    """Injected failure from a stand-in"""
+
+
+class Latency:
+    """Sleep for about `ms` milliseconds and fail with probability `failure_rate`"""
+
+    def __init__(self, ms=0.0, jitter=0.2, failure_rate=0.0, seed=None):
+        self.ms = ms
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def wait(self, what):
+        with self._lock:
+            self.calls += 1
+            delay = self.ms * (1 + self.random.uniform(-self.jitter, self.jitter)) / 1000
+            fail = self.random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise FakeFailure(f"injected {what} failure")
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data, reference=None):
+        self.id = doc_id
+        self._data = data
+        self.reference = reference
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return FakeCollection(self.db, self.path + (name,))
+
+    def set(self, data, merge=False, timeout=None):
+        self.db.latency.wait('write')
+        self.db._set(self.path, data, merge)
+
+    def update(self, data, timeout=None):
+        self.db.latency.wait('write')
+        self.db._update(self.path, data)
+
+    def get(self, timeout=None):
+        self.db.latency.wait('read')
+        return FakeSnapshot(self.id, self.db._get(self.path), self)
+
+
+# Filter operators the fake understands; '__name__' filters compare document IDs
+OPERATORS = {'==': operator.eq, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+
+def field_value(doc_id, data, field):
+    return doc_id if field == '__name__' else data.get(field)
+
+
+def after_cursor(keys, cursor, orders):
+    """Whether a document's order keys come after the cursor's, field by field in each field's direction"""
+    for key, value, (_, descending) in zip(keys, cursor, orders):
+        if key != value:
+            return key < value if descending else key > value
+    return False
+
+
+class FakeQuery:
+    """Ordering on fields (or '__name__'), comparison filters, start_after and limits"""
+
+    def __init__(self, collection, orders=(), last=None, filters=(), after=None, first=None):
+        self.collection = collection
+        # (field, descending) pairs, most significant first
+        self.orders = orders
+        self.last = last
+        self.filters = filters
+        self.after = after
+        self.first = first
+
+    def _with(self, **changes):
+        fields = dict(orders=self.orders, last=self.last, filters=self.filters, after=self.after, first=self.first)
+        fields.update(changes)
+        return FakeQuery(self.collection, **fields)
+
+    def order_by(self, field, direction='ASCENDING', **kwargs):
+        return self._with(orders=self.orders + ((field, direction == 'DESCENDING'),))
+
+    def where(self, filter=None):
+        value = getattr(filter.value, 'id', filter.value)
+        return self._with(filters=self.filters + ((filter.field_path, OPERATORS[filter.op_string], value),))
+
+    def start_after(self, values):
+        # Like the real client, the values cover a prefix of the ordered fields
+        fields = [field for field, _ in self.orders][:len(values)]
+        return self._with(after=tuple(getattr(values[field], 'id', values[field]) for field in fields))
+
+    def limit(self, count):
+        return self._with(first=count)
+
+    def limit_to_last(self, count):
+        return self._with(last=count)
+
+    def get(self, timeout=None):
+        db = self.collection.db
+        db.latency.wait('read')
+        docs = [(doc_id, data) for doc_id, data in db._children(self.collection.path)
+                if all(op(field_value(doc_id, data, field), value) for field, op, value in self.filters)]
+        if self.orders:
+            # Like Firestore, a query ordered on a field skips documents without it
+            docs = [(tuple(field_value(*item, field) for field, _ in self.orders), item) for item in docs]
+            docs = [(keys, item) for keys, item in docs if None not in keys]
+            for position in reversed(range(len(self.orders))):
+                docs.sort(key=lambda entry: entry[0][position], reverse=self.orders[position][1])
+            if self.after is not None:
+                docs = [(keys, item) for keys, item in docs if after_cursor(keys, self.after, self.orders)]
+            docs = [item for _, item in docs]
+        if self.last is not None:
+            docs = docs[-self.last:]
+        if self.first is not None:
+            docs = docs[:self.first]
+        return [FakeSnapshot(doc_id, data, self.collection.document(doc_id)) for doc_id, data in docs]
+
+    def stream(self, timeout=None):
+        return iter(self.get(timeout))
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        super().__init__(self)
+        self.db = db
+        self.path = path
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.db, self.path + (doc_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data, timeout=None):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+def check_fields(data):
+    """Reject field names the real client refuses when a write is added to a batch"""
+    for key, value in data.items():
+        if not isinstance(key, str) or not key:
+            raise ValueError("One or more components is not a string or is empty.")
+        if isinstance(value, dict):
+            check_fields(value)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        check_fields(data)
+        self.ops.append(('set', ref.path, data, merge))
+
+    def update(self, ref, data):
+        check_fields(data)
+        self.ops.append(('update', ref.path, data, False))
+
+    def commit(self, timeout=None):
+        self.db.latency.wait('commit')
+        with self.db._lock:
+            for op, path, data, merge in self.ops:
+                if op == 'update':
+                    self.db._update(path, data)
+                else:
+                    self.db._set(path, data, merge)
+
+
+class FakeFirestore:
+    """Thread-safe dict of document path -> data with the client calls the app uses"""
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.docs = {}
+        # parent path -> {doc id: data}, so queries do not scan every document
+        self.children = defaultdict(dict)
+        self._lock = threading.RLock()
+
+    def collection(self, name):
+        return FakeCollection(self, (name,))
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def _apply(self, doc, data):
+        for key, value in data.items():
+            if isinstance(value, Increment):
+                value = doc.get(key, 0) + value.value
+            elif value is SERVER_TIMESTAMP:
+                value = datetime.now(timezone.utc)
+            doc[key] = value
+
+    def _set(self, path, data, merge):
+        with self._lock:
+            if not (merge and path in self.docs):
+                self.docs[path] = self.children[path[:-1]][path[-1]] = {}
+            self._apply(self.docs[path], data)
+
+    def _update(self, path, data):
+        with self._lock:
+            if path not in self.docs:
+                raise FakeFailure(f"No document to update: {'/'.join(path)}")
+            self._apply(self.docs[path], data)
+
+    def _get(self, path):
+        with self._lock:
+            data = self.docs.get(path)
+            return dict(data) if data is not None else None
+
+    def _children(self, path):
+        with self._lock:
+            # Snapshots copy on to_dict(), so the scan itself allocates nothing per document
+            return list(self.children.get(path, {}).items())
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel: `latency` is time to first token, then one chunk per `chunk_ms`"""
+
+    model_name = 'models/fake'
+
+    def __init__(self, latency=None, chunks=8, chunk_ms=20.0):
+        self.latency = latency or Latency()
+        self.chunks = chunks
+        self.chunk_ms = chunk_ms
+
+    def _words(self, prompt):
+        return [f"Part {i + 1} of a canned answer for a {len(prompt)}-byte prompt. " for i in range(self.chunks)]
+
+    def _stream(self, prompt):
+        self.latency.wait('model')
+        for i, word in enumerate(self._words(prompt)):
+            if i:
+                time.sleep(self.chunk_ms / 1000)
+            yield FakeChunk(word)
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        if stream:
+            return self._stream(prompt)
+        self.latency.wait('model')
+        time.sleep(self.chunk_ms * (self.chunks - 1) / 1000)
+        return FakeChunk("".join(self._words(prompt)))
+
+
+def install_fake_firebase(db):
+    """Route firebase_admin initialization and firestore.client() to db"""
+    import os
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    os.environ.setdefault('FIREBASE_CREDENTIALS_JSON', '{}')
+    credentials.Certificate = lambda *args, **kwargs: None
+    firebase_admin.initialize_app = lambda *args, **kwargs: firebase_admin._apps.setdefault('[DEFAULT]', object())
+    firestore.client = lambda *args, **kwargs: db
@@ -0,0 +1,223 @@
+"""Offline load test: drive the chat routes with fake Firestore and Gemini backends.
+
+Each virtual user holds its own session cookie and loops through a visit:
+GET /, a menu click, a typed question, a voice question (where the app has
+/voice_input) and a contact form. Firestore and the model are the in-memory
+stand-ins from fakes.py, so the numbers measure this app's own hot paths
+plus whatever latency the stand-ins are told to add. The per-session and
+host-wide model call limits are off unless --limits is given, since every
+virtual user would otherwise hit them within seconds.
+
+    python benchmarks/load_test.py [--app main|test] [--users 16] [--duration 20]
+        [--firestore-ms 30] [--firestore-failure-rate 0] [--model-ms 400]
+        [--model-failure-rate 0] [--limits] [--json results.json] [--baseline results.json]
+
+With --baseline, routes whose p95 regressed by more than --tolerance (default
+25%) are listed and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import importlib
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeFirestore, FakeModel, Latency, install_fake_firebase
+
+ROUTES = ['/', '/get_menu_options', '/process_custom_input', '/voice_input', '/save_contact']
+
+QUESTIONS = [
+    "What services do you offer for a new startup?",
+    "How much does a SWOT analysis cost?",
+    "I want to open a bakery, which service should I pick?",
+    "What is a branding strategy?",
+    "Can you help me with a pitch deck for investors?",
+    "What's the weather like today?",
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def load_app(name, args):
+    """Import main or test against the stand-ins"""
+    # Shedding and injected failures are counted in the report; set LOG_LEVEL to see them logged
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    os.environ.pop('GEMINI_API_KEY', None)
+    scratch = tempfile.mkdtemp(prefix='bizowl_bench_')
+    os.environ['RESPONSE_CACHE_PATH'] = os.path.join(scratch, 'cache.sqlite3')
+    # The model call limits are off unless asked for, so the run measures the routes rather than the
+    # limiter; with --limits the buckets are fresh and the limits come from the LLM_* environment as usual
+    os.environ['LLM_LIMITS_PATH'] = os.path.join(scratch, 'limits.sqlite3') if args.limits else ''
+    db = FakeFirestore(Latency(args.firestore_ms, failure_rate=args.firestore_failure_rate, seed=1))
+    install_fake_firebase(db)
+    module = importlib.import_module(name)
+    module.model = FakeModel(Latency(args.model_ms, failure_rate=args.model_failure_rate, seed=2),
+                             chunks=args.chunks, chunk_ms=args.chunk_ms)
+    return module, db
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, status):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            self.statuses[route][status] += 1
+
+
+def virtual_user(app, routes, menu_option, recorder, deadline, seed, unique):
+    rng = random.Random(seed)
+    client = app.test_client()
+    visit = 0
+
+    def call(route, method='post', **kwargs):
+        start = time.perf_counter()
+        try:
+            response = getattr(client, method)(route, **kwargs)
+            response.get_data()
+            status = response.status_code
+        except Exception:
+            status = 'exception'
+        recorder.record(route, time.perf_counter() - start, status)
+
+    while time.perf_counter() < deadline:
+        visit += 1
+        question = rng.choice(QUESTIONS)
+        if unique:
+            # Defeat the response cache so every question reaches the model
+            question = f"{question} (visitor {seed}, visit {visit})"
+        for route in routes:
+            if time.perf_counter() >= deadline:
+                break
+            if route == '/':
+                call('/', method='get')
+            elif route == '/get_menu_options':
+                call(route, json={'option': menu_option, 'path': []})
+            elif route in ('/process_custom_input', '/voice_input'):
+                call(route, json={'input': question})
+            elif route == '/save_contact':
+                call(route, json={'name': f"Visitor {seed}", 'email': f"visitor{seed}@example.com", 'phone': '5550100'})
+
+
+def run(args):
+    module, db = load_app(args.app, args)
+    app = module.app
+    rules = {rule.rule for rule in app.url_map.iter_rules()}
+    routes = [r for r in ROUTES if r in rules]
+    skipped = [r for r in ROUTES if r not in rules]
+    menu_option = module.get_initial_menu_options()[0]['id']
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=virtual_user, daemon=True,
+                                args=(app, routes, menu_option, recorder, deadline, i, not args.cacheable))
+               for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    module.firestore_writer.flush(timeout=10)
+
+    results = {}
+    for route in routes:
+        values = sorted(recorder.latencies[route])
+        statuses = recorder.statuses[route]
+        results[route] = {
+            'requests': len(values),
+            'ok': sum(n for s, n in statuses.items() if isinstance(s, int) and s < 400),
+            'shed': statuses.get(503, 0) + statuses.get(429, 0),
+            'errors': sum(n for s, n in statuses.items() if s == 'exception' or (isinstance(s, int) and s >= 400 and s not in (429, 503))),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'rps': len(values) / elapsed
+        }
+    config = {k: getattr(args, k) for k in ('app', 'users', 'duration', 'firestore_ms', 'firestore_failure_rate',
+                                             'model_ms', 'model_failure_rate', 'chunks', 'chunk_ms', 'cacheable',
+                                             'limits')}
+    return {'config': config, 'elapsed': elapsed, 'skipped': skipped, 'routes': results,
+            'firestore': {'calls': db.latency.calls, 'failures': db.latency.failures},
+            'model': {'calls': module.model.latency.calls, 'failures': module.model.latency.failures}}
+
+
+def report(results):
+    config = results['config']
+    print(f"app={config['app']} users={config['users']} duration={results['elapsed']:.1f}s "
+          f"firestore={config['firestore_ms']}ms/{config['firestore_failure_rate']:.0%} fail "
+          f"model={config['model_ms']}ms/{config['model_failure_rate']:.0%} fail")
+    print(f"{'route':<24}{'reqs':>7}{'ok':>7}{'shed':>6}{'err':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}")
+    total = 0
+    for route, r in results['routes'].items():
+        total += r['requests']
+        print(f"{route:<24}{r['requests']:>7}{r['ok']:>7}{r['shed']:>6}{r['errors']:>6}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['rps']:>8.1f}")
+    print(f"{'total':<24}{total:>7}{'':>46}{total / results['elapsed']:>8.1f}")
+    for route in results['skipped']:
+        print(f"{route} skipped: not a route of {config['app']}.py")
+    print(f"Firestore calls {results['firestore']['calls']} ({results['firestore']['failures']} failed), "
+          f"model calls {results['model']['calls']} ({results['model']['failures']} failed)")
+
+
+def regressions(results, baseline, tolerance):
+    """Routes whose p95 is more than `tolerance` slower than in baseline"""
+    found = []
+    for route, r in results['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if before and before['p95_ms'] > 0 and r['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append((route, before['p95_ms'], r['p95_ms']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--app', default='main', choices=['main', 'test'])
+    parser.add_argument('--users', type=int, default=16, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=20, help="seconds to run")
+    parser.add_argument('--firestore-ms', type=float, default=30)
+    parser.add_argument('--firestore-failure-rate', type=float, default=0.0)
+    parser.add_argument('--model-ms', type=float, default=400, help="time to first token")
+    parser.add_argument('--model-failure-rate', type=float, default=0.0)
+    parser.add_argument('--chunks', type=int, default=8, help="chunks per model response")
+    parser.add_argument('--chunk-ms', type=float, default=20, help="delay between chunks")
+    parser.add_argument('--limits', action='store_true', help="apply the LLM_* model call limits")
+    parser.add_argument('--cacheable', action='store_true', help="repeat questions verbatim so caches can hit")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="results file from an earlier run to compare p95 against")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for route, before, after in found:
+            print(f"REGRESSION {route}: p95 {before:.1f}ms -> {after:.1f}ms")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Denormalized per-chat counters and the paginated chat listing built on them.
+
+Usage: python chat_index.py backfill
+
+The backfill fills in the fields for chats written before they existed
+(one read of each such chat's messages, once); chats without last_activity
+are not listed. It needs FIREBASE_CREDENTIALS_JSON, like the apps.
+"""
+import os
+import sys
+import json
+import base64
+import logging
+from datetime import datetime
+
+from google.cloud.firestore_v1 import Increment, Query
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+logger = logging.getLogger(__name__)
+
+# Characters of the latest message kept on the chat document
+PREVIEW_CHARS = 120
+MAX_PAGE_SIZE = 200
+
+# Contact form fields kept on the chat document, and the most characters kept of each
+CONTACT_FIELDS = ('name', 'email', 'phone', 'issue')
+CONTACT_FIELD_CHARS = 500
+
+# Fields a listing returns; everything else on the chat document (contact details, summary) stays behind
+LIST_FIELDS = ('status', 'created_at', 'last_activity', 'message_count', 'last_sender', 'last_message_preview',
+               'has_contact')
+
+
+def preview(text):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS - 3].rstrip() + "..."
+
+
+def message_fields(message, sender, timestamp):
+    """Chat document fields to merge alongside a new message.
+
+    message_count is a server-side increment, so workers never read the
+    document to maintain it. A spooled batch that is replayed twice counts
+    its messages twice; the counter is for ops queries, not billing.
+    """
+    return {
+        'message_count': Increment(1),
+        'last_activity': timestamp,
+        'last_sender': sender,
+        'last_message_preview': preview(message)
+    }
+
+
+def clean_contact(payload):
+    """The known contact form fields of a request body, as trimmed strings; None if it has none.
+
+    The body goes into a Firestore merge, and a field name Firestore refuses
+    (empty, say) would fail the whole write batch it lands in.
+    """
+    if not isinstance(payload, dict):
+        return None
+    contact = {}
+    for field in CONTACT_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            value = str(value).strip()[:CONTACT_FIELD_CHARS]
+            if value:
+                contact[field] = value
+    return contact or None
+
+
+def contact_fields(timestamp):
+    """Chat document fields to merge alongside contact info"""
+    return {'has_contact': True, 'last_activity': timestamp}
+
+
+def encode_cursor(last_activity, chat_id):
+    return base64.urlsafe_b64encode(json.dumps([last_activity.isoformat(), chat_id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(last_activity, chat_id) a page starts after; raises ValueError for a cursor this module did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        last_activity, chat_id = json.loads(raw)
+        if not isinstance(chat_id, str):
+            raise TypeError(f"chat ID is {type(chat_id).__name__}")
+        return datetime.fromisoformat(last_activity), chat_id
+    # Decoding errors are all ValueErrors; JSON of the wrong shape raises the rest
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def list_chats(db, limit=50, cursor=None, has_contact=None):
+    """One page of chats, most recently active first, and the cursor of the next page (None on the last).
+
+    A single query on the chat documents' denormalized fields: it never
+    touches the messages subcollections. Chats active at the same instant
+    are ordered by ID, which the cursor records too, so none is skipped or
+    repeated at a page boundary. Filtering on has_contact needs the
+    composite index (has_contact ASC, last_activity DESC) in Firestore.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query = db.collection('chats')
+    if has_contact is not None:
+        query = query.where(filter=FieldFilter('has_contact', '==', bool(has_contact)))
+    query = query.order_by('last_activity', direction=Query.DESCENDING).order_by('__name__', direction=Query.DESCENDING)
+    if cursor:
+        last_activity, chat_id = decode_cursor(cursor)
+        query = query.start_after({'last_activity': last_activity, '__name__': chat_id})
+    # One extra document tells whether another page exists
+    docs = list(query.limit(limit + 1).stream())
+    chats = []
+    for doc in docs[:limit]:
+        data = doc.to_dict() or {}
+        chats.append(dict({field: data.get(field) for field in LIST_FIELDS}, chat_id=doc.id,
+                          has_contact=bool(data.get('has_contact'))))
+    next_cursor = None
+    if len(docs) > limit and chats[-1]['last_activity']:
+        next_cursor = encode_cursor(chats[-1]['last_activity'], chats[-1]['chat_id'])
+    return chats, next_cursor
+
+
+def backfill(db):
+    """Set the denormalized fields on every chat that predates them; returns the number of chats updated"""
+    updated = 0
+    for chat in db.collection('chats').stream():
+        data = chat.to_dict() or {}
+        if data.get('last_activity') is not None:
+            continue
+        messages = [m.to_dict() for m in chat.reference.collection('messages').order_by('timestamp').stream()]
+        fields = {'message_count': len(messages), 'has_contact': bool(data.get('contact_info'))}
+        if messages:
+            last = messages[-1]
+            fields.update(last_activity=last.get('timestamp'), last_sender=last.get('sender'),
+                          last_message_preview=preview(last.get('content')))
+        else:
+            fields['last_activity'] = data.get('updated_at') or data.get('created_at')
+        chat.reference.set(fields, merge=True)
+        updated += 1
+    logger.info("Backfilled chat counters on %d chats", updated)
+    return updated
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if sys.argv[1:] != ['backfill']:
+        sys.exit(__doc__)
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    firebase_admin.initialize_app(credentials.Certificate(json.loads(os.environ['FIREBASE_CREDENTIALS_JSON'])))
+    backfill(firestore.client())
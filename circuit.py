@@ -0,0 +1,77 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures, then probe it.
+
+    After `failure_threshold` consecutive failures (timeouts included) the
+    breaker opens and allow() returns False, so callers answer without the
+    upstream. Once `reset_timeout` seconds have passed a single probe is let
+    through (half-open): success closes the breaker, failure re-opens it. A
+    probe that never reports back is replaced after another reset_timeout.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.stats = {'opened': 0, 'closed': 0, 'short_circuited': 0, 'failures': 0}
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        logger.warning("Circuit %s %s -> %s (%d consecutive failures)", self.name, self.state, state, self.failures)
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            self.stats['opened'] += 1
+        elif state == CLOSED:
+            self.stats['closed'] += 1
+
+    @property
+    def closed(self):
+        return self.state == CLOSED
+
+    def allow(self):
+        """Whether a call may go to the upstream now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+                self.probe_started = now
+                return True
+            if self.state == HALF_OPEN and now - self.probe_started >= self.reset_timeout:
+                self.probe_started = now
+                return True
+            self.stats['short_circuited'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.stats['failures'] += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._transition(OPEN)
+
+    def snapshot(self):
+        return dict(self.stats, state=STATE_VALUES[self.state], consecutive_failures=self.failures)
@@ -0,0 +1,177 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from history_cache import EPOCH
+
+logger = logging.getLogger(__name__)
+
+MENU_PREFIX = "Selected menu option: "
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def clip(text, max_tokens):
+    """Cut text to roughly max_tokens, on a word boundary"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + " ..."
+
+
+def message_line(message):
+    """One prompt line for a message, with menu echoes shortened"""
+    content = (message.get('content') or '').strip()
+    if not content:
+        return None
+    if message.get('sender', 'user') == 'user':
+        if content.startswith(MENU_PREFIX):
+            return f"User chose menu option: {content[len(MENU_PREFIX):]}"
+        return f"User: {content}"
+    return f"Assistant: {content}"
+
+
+def extractive_summary(previous, messages, max_tokens):
+    """Fold messages into a summary by keeping a clipped line per message, oldest lines dropped first"""
+    lines = previous.splitlines() if previous else []
+    for message in messages:
+        line = message_line(message)
+        if line:
+            lines.append(clip(line, 40))
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def message_time(message):
+    return message.get('timestamp') or EPOCH
+
+
+class ConversationContext:
+    """Per-chat prompt context that fits a fixed token budget.
+
+    The last `recent_messages` messages go into the prompt verbatim (each
+    clipped to `message_tokens`); everything older is represented by a running
+    summary. Once `summarize_every` messages have left the verbatim window,
+    they are folded into the summary on a background thread by
+    `summarize(previous_summary, messages, max_tokens)`, so the request path
+    only ever reads the stored summary and the model is asked for a summary
+    every few exchanges rather than after each one. Until then those messages
+    are added to the summary as clipped lines. `persist(chat_id, summary, until)`
+    is called with each new summary so other workers can pick it up with
+    `refresh`.
+
+    `get_messages(chat_id)` returns at most `max_messages` of the latest
+    messages, so `summarize_every` is capped at what lies beyond the
+    verbatim window; anything larger would let messages drop out of that
+    window, and out of context, before they were ever summarized.
+    """
+
+    def __init__(self, summarize, get_messages, persist=None, budget=600, recent_messages=4,
+                 message_tokens=150, max_chats=1000, summarize_every=6, max_messages=10):
+        if recent_messages >= max_messages:
+            raise ValueError(f"recent_messages ({recent_messages}) must be below max_messages ({max_messages})")
+        self.summarize = summarize
+        self.get_messages = get_messages
+        self.persist = persist
+        self.budget = budget
+        self.recent_messages = recent_messages
+        self.summarize_every = max(1, min(summarize_every, max_messages - recent_messages))
+        if self.summarize_every != summarize_every:
+            logger.warning("Summarizing every %d messages instead of %d: only %d messages are kept per chat",
+                           self.summarize_every, summarize_every, max_messages)
+        self.message_tokens = message_tokens
+        self.summary_tokens = budget // 3
+        self.max_chats = max_chats
+        self.summaries = OrderedDict()
+        self.stats = {'updates': 0, 'update_failures': 0}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summary')
+
+    def load(self, chat_id, summary, until):
+        """Record a summary read from storage ('' and None for a chat that has none)"""
+        with self._lock:
+            self.summaries[chat_id] = (summary or '', until)
+            self.summaries.move_to_end(chat_id)
+            while len(self.summaries) > self.max_chats:
+                self.summaries.popitem(last=False)
+
+    def refresh(self, chat_id, summary, until):
+        """Record a summary read from storage unless the one held already covers as much"""
+        with self._lock:
+            held = self.summaries.get(chat_id)
+        if held is not None and (until is None or (held[1] is not None and held[1] >= until)):
+            return
+        self.load(chat_id, summary, until)
+
+    def __contains__(self, chat_id):
+        return chat_id in self.summaries
+
+    def summary(self, chat_id):
+        with self._lock:
+            return self.summaries.get(chat_id, ('', None))
+
+    def build(self, chat_id, messages):
+        """Prompt text for a chat: its summary, then as many recent messages as the budget allows"""
+        summary, until = self.summary(chat_id)
+        if until is not None:
+            messages = [m for m in messages if message_time(m) > until]
+        # Messages past the verbatim window that are not summarized yet
+        older = messages[:-self.recent_messages]
+        if older:
+            summary = extractive_summary(summary, older, self.summary_tokens)
+        lines = []
+        used = 0
+        if summary:
+            summary = clip(summary, self.summary_tokens)
+            lines.append(f"Summary of the earlier conversation:\n{summary}\n\nRecent messages:")
+            used = estimate_tokens(lines[0])
+        recent = []
+        for message in reversed(messages[-self.recent_messages:]):
+            line = message_line(message)
+            if not line:
+                continue
+            line = clip(line, self.message_tokens)
+            cost = estimate_tokens(line)
+            if used + cost > self.budget:
+                break
+            recent.append(line)
+            used += cost
+        return "\n".join(lines + recent[::-1])
+
+    def update_later(self, chat_id):
+        """Fold messages that have left the verbatim window into the summary, off the request path"""
+        with self._lock:
+            if chat_id in self._pending:
+                return
+            self._pending.add(chat_id)
+        self._executor.submit(self._update, chat_id)
+
+    def _update(self, chat_id):
+        try:
+            messages = self.get_messages(chat_id)
+            if not messages:
+                return
+            summary, until = self.summary(chat_id)
+            older = messages[:-self.recent_messages]
+            if until is not None:
+                older = [m for m in older if message_time(m) > until]
+            if len(older) < self.summarize_every:
+                return
+            summary = self.summarize(summary, older, self.summary_tokens)
+            until = message_time(older[-1])
+            self.load(chat_id, summary, until)
+            self.stats['updates'] += 1
+            if self.persist:
+                self.persist(chat_id, summary, until)
+        except Exception as e:
+            self.stats['update_failures'] += 1
+            logger.warning("Summary update failed for chat %s: %s", chat_id, e)
+        finally:
+            with self._lock:
+                self._pending.discard(chat_id)
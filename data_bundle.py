@@ -0,0 +1,174 @@
+"""Compile Data/*.json into one versioned msgpack bundle that workers mmap.
+
+Usage: python data_bundle.py [DATA_DIR] [BUNDLE_PATH]
+
+With DATA_BUNDLE_PATH set, the apps build the bundle themselves when it is
+missing or was compiled from other data, so running this ahead of time (in
+an image build, say) only saves that step at startup.
+"""
+import os
+import sys
+import mmap
+import json
+import struct
+import logging
+import tempfile
+from collections.abc import Mapping
+from dataclasses import astuple
+
+import msgpack
+
+from fingerprint import compact_json, directory_fingerprint
+from menu_index import MenuIndex, path_key
+from retrieval import MENU_FILE, PRIMARY_FILE, Passage, load_passages
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BZOWLDB1'
+HEADER = struct.Struct('<8sI')
+
+
+def compile_bundle(data_dir, path, version):
+    """Write the bundle for the files in data_dir to path, atomically"""
+    with open(os.path.join(data_dir, MENU_FILE), 'r') as f:
+        menu_index = MenuIndex(json.load(f))
+    with open(os.path.join(data_dir, PRIMARY_FILE), 'r') as f:
+        company_json = compact_json(json.load(f))
+    passages = load_passages(data_dir)
+
+    blob = bytearray()
+    sections = {'menu': {}, 'passages': {}, 'company': {}}
+
+    def put(section, key, value):
+        data = value if isinstance(value, bytes) else msgpack.packb(value, use_bin_type=True)
+        sections[section][key] = (len(blob), len(data))
+        blob.extend(data)
+
+    # One record per menu path, keyed like the browser's JSON.stringify(path)
+    for menu_path, entry in menu_index.nodes.items():
+        put('menu', path_key(menu_path), [entry['options'], entry['message'], menu_index.responses[menu_path]])
+    put('menu', 'tree_json', menu_index.tree_json.encode())
+    put('passages', 'all', [list(astuple(p)) for p in passages])
+    put('company', 'json', company_json.encode())
+    header = msgpack.packb({'version': version, 'menu_version': menu_index.version, 'sections': sections},
+                           use_bin_type=True)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(blob)
+    os.replace(tmp, path)
+    logger.info("Compiled data bundle %s for version %s (%d bytes, %d menu paths, %d passages)", path, version,
+                HEADER.size + len(header) + len(blob), len(menu_index.nodes), len(passages))
+
+
+class DataBundle:
+    """Read-only view of a compiled bundle.
+
+    The file is mapped, not read: its pages live in the page cache and are
+    shared by every worker on the host. Only the header (record offsets) is
+    decoded on open; each record is decoded when it is asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a data bundle")
+        header = msgpack.unpackb(self.mm[HEADER.size:HEADER.size + header_length], raw=False)
+        self.version = header['version']
+        self.menu_version = header['menu_version']
+        self.sections = header['sections']
+        self.base = HEADER.size + header_length
+
+    def raw(self, section, key):
+        offset, length = self.sections[section][key]
+        start = self.base + offset
+        return self.mm[start:start + length]
+
+    def record(self, section, key):
+        return msgpack.unpackb(self.raw(section, key), raw=False)
+
+    def keys(self, section):
+        return self.sections[section].keys()
+
+    def passages(self):
+        return [Passage(*row) for row in self.record('passages', 'all')]
+
+    def company_json(self):
+        return self.raw('company', 'json').decode()
+
+
+def open_bundle(data_dir, path, version):
+    """Open the bundle at path, compiling it first if it is missing or holds another data version"""
+    try:
+        bundle = DataBundle(path)
+        if bundle.version == version:
+            return bundle
+        logger.info("Data bundle %s holds version %s, recompiling for %s", path, bundle.version, version)
+    except (OSError, ValueError, struct.error) as e:
+        logger.info("Data bundle %s unusable (%s), compiling it", path, e)
+    compile_bundle(data_dir, path, version)
+    return DataBundle(path)
+
+
+class BundleMenuNodes(Mapping):
+    """{path tuple: {'options', 'message'}} decoded from the bundle on access"""
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.keys_ = [k for k in bundle.keys('menu') if k != 'tree_json']
+
+    def __getitem__(self, path):
+        try:
+            options, message, _ = self.bundle.record('menu', path_key(path))
+        except KeyError:
+            raise KeyError(path) from None
+        return {'options': options, 'message': message}
+
+    def __iter__(self):
+        return (tuple(json.loads(k)) for k in self.keys_)
+
+    def __len__(self):
+        return len(self.keys_)
+
+
+class BundleMenuIndex:
+    """MenuIndex interface over a DataBundle"""
+
+    empty_response = {'options': [], 'message': ''}
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.version = bundle.menu_version
+        self.nodes = BundleMenuNodes(bundle)
+
+    @property
+    def tree_json(self):
+        return self.bundle.raw('menu', 'tree_json')
+
+    def initial_options(self):
+        return self.nodes[()]['options']
+
+    def lookup(self, path):
+        """Return (options, message) for a path, or ([], '') if it is not in the menu"""
+        entry = self.nodes.get(tuple(path), self.empty_response)
+        return entry['options'], entry['message']
+
+    def response_json(self, path):
+        """Pre-serialized /get_menu_options body for path"""
+        try:
+            return self.bundle.record('menu', path_key(path))[2]
+        except KeyError:
+            return json.dumps({'options': [], 'bot_response': '', 'path': list(path)})
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data')
+    path = sys.argv[2] if len(sys.argv) > 2 else os.environ.get(
+        'DATA_BUNDLE_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_data.msgpack'))
+    compile_bundle(data_dir, path, directory_fingerprint(data_dir))
@@ -0,0 +1,104 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from dataclasses import dataclass
+
+from fingerprint import directory_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    """Data/*.json and every structure derived from it, for one data version"""
+    version: str
+    menu_index: object
+    passages: list
+    knowledge_index: object
+    faq_matcher: object
+    intent_router: object
+    shards: object
+    answer_bank: object
+    static_prompt: str
+
+
+class DataStore:
+    """Hold the current DataSnapshot and replace it when the data files change.
+
+    `build(version)` loads the files and derives everything from them; it runs
+    on the watcher thread (or an admin request), never on a user request. The
+    new snapshot is published with a single attribute assignment, so readers
+    see either the old snapshot or the new one, never a mix. A request that
+    keeps the snapshot it started with has a consistent view throughout.
+    Files that change while they are being loaded are loaded again, and a
+    version that fails to build (say, a half-written file) keeps the previous
+    snapshot in service until the files change again.
+    """
+
+    def __init__(self, data_dir, build, interval=5.0, on_reload=None):
+        self.data_dir = data_dir
+        self.build = build
+        self.interval = interval
+        # on_reload(snapshot) runs right after a new snapshot is published
+        self.on_reload = on_reload
+        self.stats = {'reloads': 0, 'reload_failures': 0}
+        self.failed_version = None
+        self._reload_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._closing = threading.Event()
+        atexit.register(self._closing.set)
+        self.current = self._load()
+
+    def _load(self, attempts=3):
+        for _ in range(attempts):
+            version = directory_fingerprint(self.data_dir)
+            snapshot = self.build(version)
+            if directory_fingerprint(self.data_dir) == version:
+                return snapshot
+            logger.info("Data files changed while loading version %s, loading again", version)
+        raise RuntimeError(f"Data files in {self.data_dir} kept changing while loading")
+
+    def reload(self, force=False):
+        """Rebuild and publish a snapshot if the data files changed; returns True if one was published"""
+        with self._reload_lock:
+            version = directory_fingerprint(self.data_dir)
+            if not force and version in (self.current.version, self.failed_version):
+                return False
+            start = time.perf_counter()
+            try:
+                snapshot = self._load()
+            except Exception:
+                self.stats['reload_failures'] += 1
+                self.failed_version = version
+                raise
+            previous, self.current = self.current, snapshot
+            self.failed_version = None
+            self.stats['reloads'] += 1
+            logger.info("Data reloaded: version %s -> %s in %.0fms (%d passages)", previous.version, snapshot.version,
+                        (time.perf_counter() - start) * 1000, len(snapshot.passages))
+        if self.on_reload:
+            self.on_reload(snapshot)
+        return True
+
+    def start(self):
+        """Watch the data directory from this process; a zero interval disables watching"""
+        if self.interval <= 0:
+            return
+        # Per process, like the write-behind thread: threads do not survive fork()
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='data-watcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closing.wait(self.interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.warning("Data reload failed, keeping version %s: %s", self.current.version, e)
@@ -0,0 +1,220 @@
+"""Export every chat and its messages from Firestore to gzipped JSONL.
+
+Usage: python export_chats.py OUT_DIR [--workers 8] [--shards 32] [--page-size 200] [--fresh]
+
+The chats collection is split into --shards ranges of document ID, and
+--workers threads export the ranges in parallel, each to its own file,
+OUT_DIR/chats-NNN.jsonl.gz. Every line is one document:
+
+    {"kind": "chat", "id": ..., "data": {...}}
+    {"kind": "message", "chat_id": ..., "id": ..., "data": {...}}
+
+with a chat's messages right after it, in ID order (sort them by
+data.timestamp for conversation order). Chats and messages are read in
+pages through cursors, and each page is written as its own gzip member, so
+memory use does not grow with the size of the export. After every page the
+shard's cursor and file size go to OUT_DIR/checkpoint.json; an interrupted
+export run again with the same OUT_DIR truncates each file to its last
+checkpoint and carries on from there. The export is not a point-in-time
+snapshot: chats written while it runs may or may not be included.
+
+It needs FIREBASE_CREDENTIALS_JSON, like the apps.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'checkpoint.json'
+# Characters of Firestore auto-generated IDs, in the order Firestore sorts them
+ID_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def shard_bounds(shards):
+    """[(lower, upper)] ID ranges covering every possible ID; None means unbounded"""
+    shards = max(1, min(shards, len(ID_ALPHABET)))
+    splits = [ID_ALPHABET[len(ID_ALPHABET) * i // shards] for i in range(1, shards)]
+    return list(zip([None] + splits, splits + [None]))
+
+
+def encode(value):
+    """JSON form of Firestore values that json cannot encode itself"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class ChatExporter:
+    """One export run over `db` into `out_dir`; see the module docstring"""
+
+    def __init__(self, db, out_dir, workers=8, shards=32, page_size=200, compresslevel=6, stop=None):
+        self.db = db
+        self.out_dir = out_dir
+        self.workers = workers
+        self.bounds = shard_bounds(shards)
+        self.page_size = page_size
+        self.compresslevel = compresslevel
+        # Set to interrupt the export between pages (for tests and signal handlers)
+        self.stop = stop or threading.Event()
+        self.checkpoint_path = os.path.join(out_dir, CHECKPOINT_FILE)
+        self.state = {}
+        self.stats = {'chats': 0, 'messages': 0, 'pages': 0, 'bytes': 0}
+        self._lock = threading.Lock()
+
+    def shard_path(self, shard):
+        return os.path.join(self.out_dir, f"chats-{shard:03d}.jsonl.gz")
+
+    def _load_checkpoint(self, fresh):
+        os.makedirs(self.out_dir, exist_ok=True)
+        if not fresh and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('bounds') != [list(b) for b in self.bounds]:
+                raise ValueError(f"{self.checkpoint_path} was written with a different shard count; "
+                                 "use the same --shards or --fresh")
+            self.state = {int(k): v for k, v in checkpoint['shards'].items()}
+            logger.info("Resuming export in %s: %d of %d shards done", self.out_dir,
+                        sum(s['done'] for s in self.state.values()), len(self.bounds))
+        else:
+            self.state = {}
+            for shard in range(len(self.bounds)):
+                if os.path.exists(self.shard_path(shard)):
+                    os.remove(self.shard_path(shard))
+        for shard in range(len(self.bounds)):
+            self.state.setdefault(shard, {'after': None, 'size': 0, 'done': False, 'chats': 0, 'messages': 0})
+
+    def _save_checkpoint(self):
+        # Called with self._lock held; written atomically so a crash leaves the previous checkpoint
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'bounds': self.bounds, 'shards': self.state}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _chat_pages(self, lower, upper, after):
+        chats = self.db.collection('chats')
+        query = chats
+        if lower is not None:
+            query = query.where(filter=FieldFilter('__name__', '>=', chats.document(lower)))
+        if upper is not None:
+            query = query.where(filter=FieldFilter('__name__', '<', chats.document(upper)))
+        query = query.order_by('__name__')
+        while True:
+            page_query = query.start_after({'__name__': after}) if after else query
+            page = list(page_query.limit(self.page_size).stream())
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            after = page[-1].id
+
+    def _messages(self, chat):
+        messages = chat.reference.collection('messages').order_by('__name__')
+        after = None
+        while True:
+            page_query = messages.start_after({'__name__': after}) if after else messages
+            page = list(page_query.limit(self.page_size).stream())
+            yield from page
+            if len(page) < self.page_size:
+                return
+            after = page[-1].id
+
+    def _write_page(self, f, page):
+        chats = messages = 0
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=self.compresslevel) as gz:
+            for chat in page:
+                line = {'kind': 'chat', 'id': chat.id, 'data': chat.to_dict()}
+                gz.write(json.dumps(line, default=encode).encode() + b'\n')
+                chats += 1
+                for message in self._messages(chat):
+                    line = {'kind': 'message', 'chat_id': chat.id, 'id': message.id, 'data': message.to_dict()}
+                    gz.write(json.dumps(line, default=encode).encode() + b'\n')
+                    messages += 1
+        f.flush()
+        return chats, messages
+
+    def export_shard(self, shard):
+        state = self.state[shard]
+        if state['done']:
+            return
+        lower, upper = self.bounds[shard]
+        path = self.shard_path(shard)
+        with open(path, 'ab') as f:
+            # Drop whatever was written after the last checkpoint
+            f.truncate(state['size'])
+            f.seek(state['size'])
+            for page in self._chat_pages(lower, upper, state['after']):
+                if self.stop.is_set():
+                    return
+                chats, messages = self._write_page(f, page)
+                with self._lock:
+                    state.update(after=page[-1].id, size=f.tell(), chats=state['chats'] + chats,
+                                 messages=state['messages'] + messages)
+                    self.stats['chats'] += chats
+                    self.stats['messages'] += messages
+                    self.stats['pages'] += 1
+                    self._save_checkpoint()
+            if self.stop.is_set():
+                return
+            with self._lock:
+                state['done'] = True
+                self._save_checkpoint()
+
+    def run(self, fresh=False):
+        """Export every shard not done yet; returns True once the whole export is complete"""
+        self._load_checkpoint(fresh)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export') as pool:
+            for future in [pool.submit(self.export_shard, shard) for shard in range(len(self.bounds))]:
+                try:
+                    future.result()
+                except BaseException:
+                    # Other shards stop at their next page and keep their checkpoints; run again to resume
+                    self.stop.set()
+                    raise
+        elapsed = time.perf_counter() - start
+        self.stats['bytes'] = sum(os.path.getsize(self.shard_path(s)) for s in range(len(self.bounds))
+                                  if os.path.exists(self.shard_path(s)))
+        done = all(state['done'] for state in self.state.values())
+        documents = self.stats['chats'] + self.stats['messages']
+        logger.info("Exported %d chats and %d messages in %.1fs (%.0f docs/s) to %s%s", self.stats['chats'],
+                    self.stats['messages'], elapsed, documents / elapsed if elapsed else 0, self.out_dir,
+                    "" if done else " (interrupted, run again to resume)")
+        return done
+
+
+def read_export(out_dir):
+    """Iterate the documents of a finished export, shard by shard"""
+    with open(os.path.join(out_dir, CHECKPOINT_FILE)) as f:
+        shards = len(json.load(f)['bounds'])
+    for shard in range(shards):
+        path = os.path.join(out_dir, f"chats-{shard:03d}.jsonl.gz")
+        if os.path.exists(path):
+            with gzip.open(path, 'rt') as f:
+                for line in f:
+                    yield json.loads(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export chats and messages to gzipped JSONL")
+    parser.add_argument('out_dir')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--shards', type=int, default=32)
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--fresh', action='store_true', help="ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    firebase_admin.initialize_app(credentials.Certificate(json.loads(os.environ['FIREBASE_CREDENTIALS_JSON'])))
+    exporter = ChatExporter(firestore.client(), args.out_dir, args.workers, args.shards, args.page_size)
+    sys.exit(0 if exporter.run(fresh=args.fresh) else 1)
@@ -0,0 +1,93 @@
+import time
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from difflib import SequenceMatcher
+
+from retrieval import BM25Index, normalize, tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class FAQMatcher:
+    """Answer near-verbatim copies of stored FAQ questions without calling the model.
+
+    Candidates come from a BM25 index over the stored questions; each is
+    scored by the similarity of its normalized question to the normalized
+    query. Entries whose answer
+    relies on extra structured fields are never served directly, nor are
+    generic questions ("What are the pricing options?") that several services
+    answer differently without naming the service.
+    """
+
+    def __init__(self, passages, threshold=0.9, candidates=10):
+        self.threshold = threshold
+        self.candidates = candidates
+        by_question = defaultdict(list)
+        for passage in passages:
+            if passage.question and not passage.has_extra:
+                by_question[normalize(passage.question)].append(passage)
+        self.exact = {}
+        for question, entries in by_question.items():
+            if len(entries) == 1 or set(tokenize(question)) & set(tokenize(entries[0].topic)):
+                self.exact[question] = entries[0]
+        self.index = BM25Index(self.exact.values(), key=lambda p: p.question)
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        # The routes look a message up before the menu router and again before the model
+        self._closest = lru_cache(maxsize=1024)(self._closest)
+
+    def best_match(self, query):
+        """Return (score, passage) for the closest stored question, or (0.0, None)"""
+        norm = normalize(query)
+        if not norm:
+            return 0.0, None
+        return self._closest(norm)
+
+    def _closest(self, norm):
+        if norm in self.exact:
+            return 1.0, self.exact[norm]
+        best_score, best = 0.0, None
+        for _, passage in self.index.search(norm, self.candidates):
+            score = SequenceMatcher(None, norm, normalize(passage.question)).ratio()
+            if score > best_score:
+                best_score, best = score, passage
+        return best_score, best
+
+    def matches(self, query):
+        """Whether answer() would serve query, without counting a lookup"""
+        score, passage = self.best_match(query)
+        return passage is not None and score >= self.threshold
+
+    def answer(self, query):
+        """Return the stored answer if query clears the threshold, else None"""
+        start = time.perf_counter()
+        score, passage = self.best_match(query)
+        hit = passage is not None and score >= self.threshold
+        with self._lock:
+            self.lookups += 1
+            if hit:
+                self.hits += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if hit:
+            logger.info("FAQ match %.2f in %.1fms -> [%s#%d] %r (hit rate %.1f%%)", score, elapsed_ms,
+                        passage.source, passage.id, passage.question, self.hit_rate * 100)
+            return passage.answer
+        if passage is not None:
+            logger.info("FAQ miss, best %.2f < %s -> [%s#%d] %r (hit rate %.1f%%)", score, self.threshold,
+                        passage.source, passage.id, passage.question, self.hit_rate * 100)
+        return None
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hit_rate, 4),
+            'threshold': self.threshold
+        }
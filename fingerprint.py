@@ -0,0 +1,26 @@
+import os
+import json
+import hashlib
+
+
+def file_fingerprint(*paths):
+    """Cheap version tag for a set of files, derived from their mtime and size"""
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            st = os.stat(path)
+            digest.update(f"{path}:{st.st_mtime_ns}:{st.st_size};".encode())
+        except OSError:
+            digest.update(f"{path}:missing;".encode())
+    return digest.hexdigest()[:12]
+
+
+def directory_fingerprint(path, suffix='.json'):
+    """Version tag covering every data file in a directory"""
+    names = sorted(n for n in os.listdir(path) if n.endswith(suffix))
+    return file_fingerprint(*(os.path.join(path, n) for n in names))
+
+
+def compact_json(data):
+    """Serialize data without the whitespace json.dumps(indent=2) adds"""
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
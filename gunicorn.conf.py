@@ -0,0 +1,34 @@
+# Gunicorn settings, loaded automatically from the working directory.
+#
+# Threaded workers let a slow Gemini call occupy one thread instead of a whole
+# worker. Model calls themselves run on each worker's bounded LLM pool
+# (LLM_WORKERS running + LLM_QUEUE waiting); keep GUNICORN_THREADS above that
+# total so menu, health and static routes always have a free thread.
+import gc
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+# Streamed replies keep a connection open for the whole generation
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+keepalive = 5
+
+# Load the app and its data once in the master and fork workers from it, so
+# the menu tree, passages and indexes are shared copy-on-write. Network
+# clients are created lazily in each worker (see worker.LazyClient).
+preload_app = os.environ.get('PRELOAD_APP', '1') != '0'
+
+
+def pre_fork(server, worker):
+    # Keep the garbage collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Runs before the worker accepts connections
+    warm_up = getattr(sys.modules.get(worker.wsgi.import_name), 'warm_up', None)
+    if warm_up:
+        warm_up()
@@ -0,0 +1,220 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+VERSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_versions (
+    chat_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_versions_updated_at ON chat_versions (updated_at);
+"""
+# Chats idle this long are dropped from the versions file; their caches have long expired
+VERSIONS_IDLE_SECONDS = 86400
+
+
+def message_size(message):
+    return len(message.get('content', '')) + 64
+
+
+def message_key(message):
+    return message.get('timestamp'), message.get('sender'), message.get('content')
+
+
+class ChatVersions:
+    """Per-chat count of messages written, shared by every worker on the host through a SQLite file.
+
+    gunicorn runs several workers without sticky sessions, so a chat's turns
+    are written by whichever worker served them. A worker's cached history
+    is only current while the shared version matches the one it last saw.
+    Errors are logged and reported as an unknown version, which makes the
+    cache fall back to Firestore.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.bumps = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connect().executescript(VERSIONS_SCHEMA)
+
+    def _connect(self):
+        # SQLite connections must not be used across fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def current(self, chat_id):
+        """(version, updated_at) of chat_id, (0, 0.0) if nothing was written yet, None if unknown"""
+        try:
+            row = self._connect().execute("SELECT version, updated_at FROM chat_versions WHERE chat_id = ?",
+                                          (chat_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Chat version read failed: %s", e)
+            return None
+        return tuple(row) if row else (0, 0.0)
+
+    def bump(self, chat_id):
+        """Count a message written to chat_id; returns the new version, or None if unknown"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT INTO chat_versions (chat_id, version, updated_at) VALUES (?, 1, ?) "
+                             "ON CONFLICT (chat_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                             (chat_id, now))
+                row = conn.execute("SELECT version FROM chat_versions WHERE chat_id = ?", (chat_id,)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            with self._lock:
+                self.bumps += 1
+                prune = self.bumps % 1000 == 0
+            if prune:
+                conn.execute("DELETE FROM chat_versions WHERE updated_at < ?", (now - VERSIONS_IDLE_SECONDS,))
+        except sqlite3.Error as e:
+            logger.warning("Chat version update failed: %s", e)
+            return None
+        return row[0]
+
+
+class HistoryCache:
+    """Bounded per-chat ring buffers of recent messages, evicted LRU across chats.
+
+    A chat's buffer is "complete" when it is known to hold the chat's latest
+    messages: either the chat started in this process (`seed`) or its history
+    was loaded from Firestore (`fill`). Messages appended to a chat that is not
+    cached are kept in an incomplete buffer and merged into the next `fill`, so
+    writes still sitting in the write-behind queue are not lost from context.
+    Total size is capped by `max_chats` and by approximate content bytes.
+
+    Other workers write to the same chats, so a complete buffer is only
+    served while its `versions` entry is the one this process last saw, and
+    for at most `ttl` seconds (which also covers other hosts). A fill right
+    after another worker wrote may miss that write, still on its way to
+    Firestore, so it only counts as complete once the chat has been quiet for
+    `settle` seconds.
+    """
+
+    def __init__(self, max_messages=10, max_chats=1000, max_bytes=8 * 1024 * 1024, versions=None, ttl=60.0,
+                 settle=2.0):
+        self.max_messages = max_messages
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self.versions = versions
+        self.ttl = ttl
+        self.settle = settle
+        self.chats = OrderedDict()
+        self.bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def _buffer(self, chat_id, complete):
+        entry = self.chats.get(chat_id)
+        if entry is None:
+            entry = self.chats[chat_id] = {'messages': deque(maxlen=self.max_messages), 'complete': complete,
+                                           'version': 0, 'synced_at': time.monotonic()}
+        self.chats.move_to_end(chat_id)
+        return entry
+
+    def _push(self, entry, message):
+        messages = entry['messages']
+        if len(messages) == messages.maxlen:
+            self.bytes -= message_size(messages[0])
+        messages.append(message)
+        self.bytes += message_size(message)
+
+    def _evict(self):
+        while self.chats and (len(self.chats) > self.max_chats or self.bytes > self.max_bytes):
+            _, entry = self.chats.popitem(last=False)
+            self.bytes -= sum(message_size(m) for m in entry['messages'])
+            self.stats['evictions'] += 1
+
+    def version(self, chat_id):
+        """Shared version of chat_id to pass to `fill`; read it before loading the messages"""
+        return self.versions.current(chat_id) if self.versions else (None, 0.0)
+
+    def seed(self, chat_id):
+        """Register a chat that is known to have no earlier messages"""
+        with self._lock:
+            self._buffer(chat_id, complete=True)
+            self._evict()
+
+    def append(self, chat_id, message, create=False):
+        """Record a message just written for chat_id; create makes an unknown chat complete"""
+        version = self.versions.bump(chat_id) if self.versions else None
+        with self._lock:
+            entry = self._buffer(chat_id, complete=create)
+            self._push(entry, message)
+            if self.versions:
+                # Still current only if nobody else wrote to the chat since this process last looked
+                if version is None or version != entry['version'] + 1:
+                    entry['complete'] = False
+                entry['version'] = version or 0
+            self._evict()
+
+    def get(self, chat_id):
+        """Return the cached messages oldest first, or None if the cache cannot answer"""
+        current = self.versions.current(chat_id) if self.versions else None
+        with self._lock:
+            entry = self.chats.get(chat_id)
+            if entry is not None and entry['complete'] and (
+                    time.monotonic() - entry['synced_at'] > self.ttl
+                    or self.versions and (current is None or current[0] != entry['version'])):
+                entry['complete'] = False
+                self.stats['stale'] += 1
+            if entry is None or not entry['complete']:
+                self.stats['misses'] += 1
+                return None
+            self.chats.move_to_end(chat_id)
+            self.stats['hits'] += 1
+            return list(entry['messages'])
+
+    def peek(self, chat_id):
+        """Cached messages for chat_id, complete or not, without touching LRU order or stats"""
+        with self._lock:
+            entry = self.chats.get(chat_id)
+            return list(entry['messages']) if entry else []
+
+    def fill(self, chat_id, messages, version=(None, 0.0)):
+        """Merge messages loaded from Firestore with any written locally since; version is from `version()`"""
+        with self._lock:
+            entry = self._buffer(chat_id, complete=True)
+            merged = {message_key(m): m for m in messages}
+            for message in entry['messages']:
+                merged.setdefault(message_key(message), message)
+            self.bytes -= sum(message_size(m) for m in entry['messages'])
+            entry['messages'].clear()
+            for message in sorted(merged.values(), key=lambda m: m.get('timestamp') or EPOCH):
+                self._push(entry, message)
+            if self.versions:
+                entry['complete'] = version is not None and time.time() - version[1] >= self.settle
+                entry['version'] = version[0] if version else 0
+            else:
+                entry['complete'] = True
+            entry['synced_at'] = time.monotonic()
+            self._evict()
+            return list(entry['messages'])
+
+    def chat_ids(self):
+        with self._lock:
+            return list(self.chats.keys())
+
+    def __contains__(self, chat_id):
+        return chat_id in self.chats
@@ -0,0 +1,140 @@
+import math
+import time
+import logging
+import threading
+from collections import Counter
+
+from retrieval import STOPWORDS, TOKEN_RE, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Conversational filler that says nothing about which menu node is wanted
+FILLER = frozenset("""
+want wanted need needs tell know like looking interested info information please hi hello hey
+help get some something more details explain show give regarding kindly
+""".split())
+
+# Words asking something specific about a topic (its cost, how or why it works), which the
+# topic's menu node only introduces
+SPECIFIC = frozenset("""
+how why when where which cost costs price prices pricing fee fees charge charges much many long
+""".split())
+
+
+def compounds(text):
+    """Adjacent words joined together, mapped to their terms, so "ecommerce" meets "E-commerce" in a label"""
+    raw = [t for t in TOKEN_RE.findall(str(text).lower()) if t not in STOPWORDS]
+    return {a + b: set(tokenize(f"{a} {b}")) for a, b in zip(raw, raw[1:])}
+
+
+def query_terms(text):
+    return {t for t in tokenize(text) if t not in FILLER and len(t) > 1}
+
+
+def is_specific(text):
+    return not SPECIFIC.isdisjoint(TOKEN_RE.findall(str(text).lower()))
+
+
+class IntentRouter:
+    """Map free-text input onto a temp_data.json menu node without calling the model.
+
+    Each menu node whose label is unique in the tree becomes a candidate
+    (repeated labels such as "Process" or "Schedule a Call" only make sense
+    under their parent, and some of them trigger actions). At load time every
+    candidate gets its label terms plus a document of its ancestors' labels and
+    its message. A query is scored per candidate as
+
+        label coverage (IDF-weighted share of the label's terms in the query)
+        x query coverage (IDF-weighted share of the query's terms in the document)
+
+    so "I want a website" reaches Website Development, while a longer or more
+    specific question that the node would not answer falls below the
+    threshold and goes to the model. A match must also beat the runner-up by
+    `margin`. Questions about cost, how or why (SPECIFIC) are never routed,
+    since a node's message introduces its topic without answering them, and
+    a session inside a menu branch is only routed within that branch.
+    """
+
+    def __init__(self, menu_index, threshold=0.55, margin=0.15, max_terms=6):
+        self.menu_index = menu_index
+        self.threshold = threshold
+        self.margin = margin
+        self.max_terms = max_terms
+        labels = Counter(path[-1] for path in menu_index.nodes if path)
+        self.candidates = []
+        df = Counter()
+        for path, entry in menu_index.nodes.items():
+            if not path or labels[path[-1]] > 1 or not entry['message']:
+                continue
+            label = [t for t in tokenize(path[-1]) if len(t) > 1]
+            if not label:
+                continue
+            label_compounds = compounds(path[-1])
+            doc = set(label) | set(label_compounds)
+            for ancestor in path[:-1]:
+                doc.update(tokenize(ancestor))
+                doc.update(compounds(ancestor))
+            doc.update(tokenize(entry['message']))
+            df.update(doc)
+            self.candidates.append((path, label, label_compounds, doc))
+        n = len(self.candidates)
+        self.idf = {term: math.log(1 + n / count) for term, count in df.items()}
+        self.unseen_idf = math.log(1 + n)
+        self.lookups = 0
+        self.routed = 0
+        self._lock = threading.Lock()
+
+    def weight(self, term):
+        return self.idf.get(term, self.unseen_idf)
+
+    def scores(self, query, within=None):
+        """(score, path) for every candidate under the `within` path that the query touches, best first"""
+        terms = query_terms(query)
+        if not terms or len(terms) > self.max_terms:
+            return []
+        joined = terms | set(compounds(query))
+        query_weight = sum(self.weight(t) for t in terms)
+        within = tuple(within or ())
+        results = []
+        for path, label, label_compounds, doc in self.candidates:
+            if path[:len(within)] != within:
+                continue
+            covered = joined.copy()
+            for compound, parts in label_compounds.items():
+                if compound in joined:
+                    covered |= parts
+            label_cov = sum(self.weight(t) for t in label if t in covered) / sum(self.weight(t) for t in label)
+            if not label_cov:
+                continue
+            query_cov = sum(self.weight(t) for t in terms if t in doc) / query_weight
+            results.append((label_cov * query_cov, path))
+        results.sort(key=lambda r: (-r[0], len(r[1])))
+        return results
+
+    def route(self, query, within=None):
+        """Return the menu path for query if it matches one node under `within` confidently, else None"""
+        start = time.perf_counter()
+        results = [] if is_specific(query) else self.scores(query, within)
+        best, path = results[0] if results else (0.0, None)
+        runner_up = results[1][0] if len(results) > 1 else 0.0
+        hit = path is not None and best >= self.threshold and best - runner_up >= self.margin
+        with self._lock:
+            self.lookups += 1
+            if hit:
+                self.routed += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if hit:
+            logger.info("Intent routed %.2f (next %.2f) in %.1fms -> %s", best, runner_up, elapsed_ms, " > ".join(path))
+            return list(path)
+        if path is not None:
+            logger.info("Intent not routed, best %.2f (next %.2f) -> %s", best, runner_up, " > ".join(path))
+        return None
+
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'routed': self.routed,
+            'route_rate': round(self.routed / self.lookups, 4) if self.lookups else 0.0,
+            'candidates': len(self.candidates),
+            'threshold': self.threshold
+        }
@@ -0,0 +1,253 @@
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+_DONE = object()
+
+# Call priorities: lower is served first
+VOICE, TEXT, BACKGROUND = 0, 1, 2
+
+
+class LLMOverloaded(Exception):
+    """Raised when every LLM worker is busy and the wait queue is full"""
+
+    retry_after = 5
+
+
+class LLMRateLimited(LLMOverloaded):
+    """Raised when a session calls the model faster than its limit allows"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeout(Exception):
+    """Raised when a model call misses its deadline"""
+
+
+class LLMPool:
+    """Bounded thread pool for blocking model calls, with load shedding and fair queuing.
+
+    At most `max_workers` calls run at once and `max_queue` more may wait for
+    a worker. Anything beyond that is rejected immediately with LLMOverloaded
+    so request threads are never tied up behind a slow upstream, which keeps
+    menu and health routes responsive. A `timeout` bounds how long the caller
+    waits; the pool thread itself is only freed when the call returns, so the
+    call should also carry its own deadline.
+
+    Waiting calls are served by priority (VOICE before TEXT before
+    BACKGROUND) and, within a priority, round-robin by session, so one
+    session with a backlog cannot hold the queue. With a `limiter`
+    (rate_limit.RateLimiter) a session over its rate is delayed, or rejected
+    with LLMRateLimited if it would wait longer than `max_wait`, and the call
+    at the head of the queue also waits for the host-wide call and token
+    budget; a call that cannot start within `max_wait` is rejected with
+    LLMOverloaded, and what it took from the limits is given back. Calls
+    waiting out their session's limit count against `max_queue`.
+    """
+
+    def __init__(self, max_workers=4, max_queue=8, limiter=None, max_wait=5.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.limiter = limiter
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+        # {priority: OrderedDict(session: deque of waiting calls)}, sessions in round-robin order
+        self.waiting = {}
+        self.running = 0
+        self.queued = 0
+        self.throttled = 0
+        # The waiter checking the host budget, which happens outside the lock
+        self._checking = None
+        self.stats = {'submitted': 0, 'rejected': 0, 'rate_limited': 0, 'delayed': 0, 'in_flight': 0, 'queued': 0,
+                      'throttled': 0}
+        self._cond = threading.Condition()
+
+    def _count(self, name):
+        with self._cond:
+            self.stats[name] += 1
+
+    def _head(self):
+        for priority in sorted(self.waiting):
+            sessions = self.waiting[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _dequeue(self, waiter, priority, session):
+        sessions = self.waiting[priority]
+        calls = sessions[session]
+        calls.remove(waiter)
+        if calls:
+            # This session has had its turn; the next one in line goes first
+            sessions.move_to_end(session)
+        else:
+            del sessions[session]
+        self.queued -= 1
+        self.stats['queued'] = self.queued
+
+    def _throttle_session(self, session):
+        """Wait out session's rate limit, or raise LLMRateLimited if that would take too long"""
+        if self.limiter is None or session is None:
+            return
+        delayed = False
+        while True:
+            wait = self.limiter.session_wait(session)
+            if not wait:
+                return
+            if wait > self.max_wait:
+                self._count('rate_limited')
+                raise LLMRateLimited(f"Session over its model call rate, retry in {wait:.0f}s", retry_after=wait)
+            if not delayed:
+                delayed = True
+                self._count('delayed')
+            time.sleep(wait)
+
+    def _budget_wait(self, cost):
+        """limiter.budget_wait(cost) with the lock released, since it may wait on the limits file"""
+        self._cond.release()
+        try:
+            return self.limiter.budget_wait(cost)
+        finally:
+            self._cond.acquire()
+
+    def _refund(self, session, cost):
+        """limiter.refund(session, cost), also with the lock released"""
+        self._cond.release()
+        try:
+            self.limiter.refund(session, cost)
+        finally:
+            self._cond.acquire()
+
+    def _acquire(self, session=None, priority=TEXT, cost=0):
+        with self._cond:
+            # Calls waiting out their session's rate limit hold a place in the queue too
+            if self.running + self.queued + self.throttled >= self.max_workers + self.max_queue:
+                self.stats['rejected'] += 1
+                raise LLMOverloaded(f"LLM pool full ({self.max_workers} running, {self.max_queue} queued)")
+            self.throttled += 1
+            self.stats['throttled'] = self.throttled
+        try:
+            self._throttle_session(session)
+        except BaseException:
+            with self._cond:
+                self.throttled -= 1
+                self.stats['throttled'] = self.throttled
+            raise
+        deadline = time.monotonic() + self.max_wait
+        waiter = object()
+        with self._cond:
+            self.throttled -= 1
+            self.stats['throttled'] = self.throttled
+            self.waiting.setdefault(priority, OrderedDict()).setdefault(session, deque()).append(waiter)
+            self.queued += 1
+            self.stats['queued'] = self.queued
+            delayed = False
+            # Whether this call has taken its share of the host budget
+            paid = False
+            try:
+                while True:
+                    wait = None
+                    free = self.running < self.max_workers
+                    if free and (paid or (self.limiter is None and self._head() is waiter)):
+                        break
+                    # One call at a time checks the budget, so two cannot both take it for one free worker
+                    if free and not paid and self._head() is waiter and self._checking is None:
+                        self._checking = waiter
+                        try:
+                            wait = self._budget_wait(cost)
+                        finally:
+                            self._checking = None
+                            self._cond.notify_all()
+                        if not wait:
+                            # Workers may have filled up meanwhile; check again
+                            paid = True
+                            continue
+                        if not delayed:
+                            delayed = True
+                            self.stats['delayed'] += 1
+                    remaining = deadline - time.monotonic()
+                    # Waiting is pointless if the budget will not allow the call before the deadline
+                    if remaining <= 0 or (wait or 0) > remaining:
+                        self.stats['rejected'] += 1
+                        raise LLMOverloaded(f"No LLM capacity within {self.max_wait:g}s")
+                    self._cond.wait(min(wait, remaining) if wait else remaining)
+            except BaseException:
+                self._dequeue(waiter, priority, session)
+                self._cond.notify_all()
+                # The call never ran, so it does not count against the session or the host
+                if self.limiter is not None:
+                    self._refund(session, cost if paid else None)
+                raise
+            self._dequeue(waiter, priority, session)
+            self.running += 1
+            self.stats['submitted'] += 1
+            self.stats['in_flight'] = self.running
+            self._cond.notify_all()
+
+    def _release(self, _future=None):
+        with self._cond:
+            self.running -= 1
+            self.stats['in_flight'] = self.running
+            self._cond.notify_all()
+
+    def call(self, fn, *args, timeout=None, session=None, priority=TEXT, cost=0, **kwargs):
+        """Run fn on the pool and wait up to timeout seconds for its result.
+
+        session, priority and cost (prompt tokens) place the call in the queue
+        and against the limits; they are not passed to fn.
+        """
+        self._acquire(session, priority, cost)
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            raise LLMTimeout(f"Model call exceeded {timeout:g}s") from None
+
+    def stream(self, fn, *args, timeout=None, session=None, priority=TEXT, cost=0, **kwargs):
+        """Iterate fn(*args) on the pool, yielding its items as they arrive, for at most timeout seconds"""
+        self._acquire(session, priority, cost)
+        items = queue.Queue()
+        cancelled = threading.Event()
+        deadline = time.monotonic() + timeout if timeout else None
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if cancelled.is_set():
+                        return
+                    items.put((item, None))
+            except BaseException as e:
+                items.put((None, e))
+            finally:
+                items.put((_DONE, None))
+
+        try:
+            future = self.executor.submit(produce)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        try:
+            while True:
+                remaining = deadline - time.monotonic() if deadline else None
+                try:
+                    item, error = items.get(timeout=max(remaining, 0) if deadline else None)
+                except queue.Empty:
+                    raise LLMTimeout(f"Model stream exceeded {timeout:g}s") from None
+                if error is not None:
+                    raise error
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            # Stop the producer early if the caller gave up or timed out
+            cancelled.set()
@@ -1,22 +1,60 @@
 import os
+import hmac
 import json
-from datetime import datetime
-from flask import Flask, request, render_template, jsonify, session
+import time
+import math
+import logging
+import itertools
+from contextlib import closing
+import tempfile
+from datetime import datetime, timezone
+from flask import Flask, Response, request, render_template, jsonify, session, stream_with_context, has_request_context, g
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import google.generativeai as genai
+from google.generativeai.types import BlockedPromptException, StopCandidateException
 import firebase_admin
 from firebase_admin import credentials, firestore
-from google.api_core.exceptions import DeadlineExceeded
 from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+from fingerprint import compact_json
+from data_store import DataSnapshot, DataStore
+from response_cache import ResponseCache, make_key
+from prompt_shards import BranchShards
+from answer_bank import AnswerBank, content_hash
+from write_behind import WriteBehindQueue
+from spool import WriteSpool
+from llm_pool import LLMPool, LLMOverloaded, LLMRateLimited, LLMTimeout, TEXT
+from rate_limit import RateLimiter
+from circuit import CircuitBreaker
+from singleflight import SingleFlight
+from menu_index import MenuIndex, is_menu_path, path_key
+from conversation import estimate_tokens
+from chat_index import clean_contact, contact_fields, list_chats, message_fields
+from faq_match import FAQMatcher
+from intent_router import IntentRouter
+from retrieval import BM25Index, load_passages, format_passages
+import metrics
+from metrics import span, timed, stats_collector, PROMPT_BYTES, STAGE_SECONDS
+from log_config import configure_logging
+from worker import LazyClient, WorkerStartup
+
+configure_logging()
+logger = logging.getLogger(__name__)
+startup = WorkerStartup()
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 app.secret_key = os.environ.get('FLASK_SECRET', 'default-secret-key')
+# Proxies in front of the app (X-Forwarded-For hops to trust), so request.remote_addr is the client's address
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+metrics.install(app)
 
 # --- Firebase Initialization ---
 firebase_credentials_str = os.getenv("FIREBASE_CREDENTIALS_JSON")
 if not firebase_credentials_str:
-    print("❌ Firebase credentials not found in environment variables!")
+    logger.error("Firebase credentials not found in environment variables!")
     raise RuntimeError("Firebase credentials missing")
 else:
     try:
@@ -24,95 +62,184 @@ else:
         cred = credentials.Certificate(firebase_credentials_dict)
         if not firebase_admin._apps:
             firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        print("✅ Firebase initialized successfully.")
+        # The Firestore client (and its gRPC channel) is created per worker on first use
+        db = LazyClient(firestore.client, 'Firestore')
+        logger.info("Firebase initialized successfully.")
     except json.JSONDecodeError as e:
-        print(f"❌ Failed to decode Firebase credentials JSON: {e}")
+        logger.error("Failed to decode Firebase credentials JSON: %s", e)
         raise
     except Exception as e:
-        print(f"❌ Error initializing Firebase: {e}")
+        logger.error("Error initializing Firebase: %s", e)
         raise
 
-# --- Load Data Files (absolute paths) ---
+# --- Data Files (absolute paths; loaded into a DataStore below the prompt template) ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-try:
-    with open(os.path.join(BASE_DIR, 'Data', 'temp_data.json'), 'r') as f:
-        menu_data = json.load(f)
-    with open(os.path.join(BASE_DIR, 'Data', 'data.json'), 'r') as f:
-        company_data = json.load(f)
-    print("✅ Data files loaded successfully.")
-except Exception as e:
-    print(f"❌ Error loading data files: {e}")
-    raise
+DATA_DIR = os.path.join(BASE_DIR, 'Data')
+# Seconds between checks of Data/*.json for changes; 0 disables hot reload
+DATA_RELOAD_INTERVAL = float(os.environ.get('DATA_RELOAD_INTERVAL', 5))
+# Optional compiled msgpack bundle of the data files, mapped by every worker (compiled here if missing or stale).
+# Off by default: at this data size it saves ~1ms of load but costs ~1MB RSS (see benchmarks/bench_bundle.py)
+DATA_BUNDLE_PATH = os.environ.get('DATA_BUNDLE_PATH', '')
+# Shared secret for the /admin routes (data reload, chat listing); they are disabled when unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Number of retrieved passages per prompt; 0 sends the whole of data.json instead
+PROMPT_TOP_K = int(os.environ.get('PROMPT_TOP_K', 8))
+# Similarity a question must reach to be answered straight from the FAQ data
+FAQ_MATCH_THRESHOLD = float(os.environ.get('FAQ_MATCH_THRESHOLD', 0.9))
+# Score free text must reach to be answered by jumping to a menu node instead of calling the model
+INTENT_ROUTE_THRESHOLD = float(os.environ.get('INTENT_ROUTE_THRESHOLD', 0.55))
+# Passages per prompt while the user is inside a service branch of the menu (drawn from that branch only)
+BRANCH_TOP_K = int(os.environ.get('BRANCH_TOP_K', 4))
+# How much better a passage elsewhere must score than the branch's best before the prompt leaves the branch
+BRANCH_ESCAPE_RATIO = float(os.environ.get('BRANCH_ESCAPE_RATIO', 1.5))
+# Answers generated ahead of time by answer_bank.py, served for exact matches; an empty path disables it.
+# Loaded with the data files, so after rebuilding it use POST /admin/reload_data?force=1 (or restart)
+ANSWER_BANK_PATH = os.environ.get('ANSWER_BANK_PATH', os.path.join(BASE_DIR, 'answer_bank_main.json'))
+
+# Model response cache shared by every worker on the host; an empty path disables it
+RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_response_cache.sqlite3'))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1000))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+response_cache = ResponseCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL) if RESPONSE_CACHE_PATH else None
+
+# Messages and contact info are committed in batches by a background writer
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 50))
+WRITE_FLUSH_MS = int(os.environ.get('WRITE_FLUSH_MS', 200))
+# Writes that could not be committed to Firebase, kept on disk and replayed once it recovers
+SPOOL_PATH = os.environ.get('SPOOL_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_write_spool.sqlite3'))
+
+# Blocking Gemini calls run on a bounded pool; requests beyond LLM_WORKERS + LLM_QUEUE get a fast 503
+LLM_WORKERS = int(os.environ.get('LLM_WORKERS', 4))
+LLM_QUEUE = int(os.environ.get('LLM_QUEUE', 8))
+# Model call limits, shared by every worker on the host through a SQLite file (an empty path disables them).
+# Per client address: LLM_SESSION_RATE calls a minute with bursts of LLM_SESSION_BURST. Per host: LLM_GLOBAL_QPS
+# calls a second and LLM_TOKENS_PER_MINUTE prompt tokens; 0 turns either off. Calls may be delayed up to
+# LLM_MAX_WAIT seconds to fit the limits, then they are rejected
+LLM_LIMITS_PATH = os.environ.get('LLM_LIMITS_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_llm_limits.sqlite3'))
+LLM_SESSION_RATE = float(os.environ.get('LLM_SESSION_RATE', 10))
+LLM_SESSION_BURST = float(os.environ.get('LLM_SESSION_BURST', 5))
+LLM_GLOBAL_QPS = float(os.environ.get('LLM_GLOBAL_QPS', 5))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get('LLM_TOKENS_PER_MINUTE', 1000000))
+LLM_MAX_WAIT = float(os.environ.get('LLM_MAX_WAIT', 5))
+llm_limiter = RateLimiter(LLM_LIMITS_PATH, LLM_SESSION_RATE, LLM_SESSION_BURST, LLM_GLOBAL_QPS,
+                          LLM_TOKENS_PER_MINUTE) if LLM_LIMITS_PATH else None
+llm_pool = LLMPool(max_workers=LLM_WORKERS, max_queue=LLM_QUEUE, limiter=llm_limiter, max_wait=LLM_MAX_WAIT)
+# Identical concurrent requests (same message, context and data version) share one generation, up to
+# LLM_QUEUE requests following each one; a follower retries on its own if the leader was rate limited
+generations = SingleFlight(private_errors=(LLMRateLimited,), max_followers=LLM_QUEUE)
+# Seconds a Gemini call may take before it counts as failed
+GEMINI_DEADLINE = float(os.environ.get('GEMINI_DEADLINE', 30))
+# Consecutive failures or timeouts that open the breaker, and seconds before it lets a probe through
+GEMINI_BREAKER_FAILURES = int(os.environ.get('GEMINI_BREAKER_FAILURES', 5))
+GEMINI_BREAKER_RESET = float(os.environ.get('GEMINI_BREAKER_RESET', 30))
+gemini_breaker = CircuitBreaker('gemini', GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET)
+# Similarity a question must reach to be answered from the FAQ data while Gemini is unavailable, and the
+# share of its terms a retrieved passage must contain otherwise; below both, DEGRADED_MESSAGE is shown
+DEGRADED_MATCH_THRESHOLD = float(os.environ.get('DEGRADED_MATCH_THRESHOLD', 0.6))
 
 # --- Configure Gemini ---
 api_key = os.environ.get('GEMINI_API_KEY')
 if not api_key:
-    print("❌ Gemini API key not found in environment variables.")
+    logger.warning("Gemini API key not found in environment variables.")
     model = None
 else:
-    print("✅ Gemini API key found.")
     genai.configure(api_key=api_key)
     model = genai.GenerativeModel('gemini-1.5-flash')
-    print("✅ Gemini model loaded:", model)
+    logger.info("Gemini model loaded: %s", model.model_name)
 
 # --- Firebase Helper Functions ---
+@timed('session_create')
 def create_chat_session():
-    chat_ref = db.collection('chats').document()
-    chat_data = {
+    # IDs are generated locally; the chat document is written with the first message
+    return db.collection('chats').document().id
+
+write_spool = WriteSpool(SPOOL_PATH)
+firestore_writer = WriteBehindQueue(db, max_batch=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_MS / 1000,
+                                    on_error=write_spool.add, healthy=write_spool.healthy,
+                                    on_reject=write_spool.dead_letter)
+write_spool.commit = firestore_writer.commit
+
+# Export the existing stats dicts on /metrics alongside the request and stage timings
+# FAQ and router counters belong to the current data snapshot and restart from zero after a reload
+metrics.REGISTRY.collector(stats_collector('bizowl_faq', 'FAQ short-circuit', lambda: data_store.current.faq_matcher.stats(),
+                                           counters=('lookups', 'hits'), gauges=('hit_rate',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_intent_router', 'Menu intent router',
+                                           lambda: data_store.current.intent_router.stats(),
+                                           counters=('lookups', 'routed'), gauges=('route_rate',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_prompt_shards', 'Menu branch prompt scoping',
+                                           lambda: data_store.current.shards.stats(),
+                                           counters=('scoped', 'escaped'), gauges=('branches',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_answer_bank', 'Answer bank', lambda: data_store.current.answer_bank.stats(),
+                                           counters=('lookups', 'hits'), gauges=('entries',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_data', 'Data snapshot', lambda: data_store.stats,
+                                           counters=('reloads', 'reload_failures')))
+metrics.REGISTRY.collector(stats_collector('bizowl_response_cache', 'Response cache',
+                                           lambda: response_cache.stats() if response_cache else {},
+                                           counters=('hits', 'misses', 'evictions'), gauges=('entries', 'hit_rate')))
+metrics.REGISTRY.collector(stats_collector('bizowl_firestore_writes', 'Write-behind queue',
+                                           lambda: dict(firestore_writer.stats, pending=firestore_writer.queue.unfinished_tasks),
+                                           counters=('queued', 'committed', 'failed', 'rejected', 'batches'), gauges=('pending',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_llm_pool', 'LLM pool', lambda: llm_pool.stats,
+                                           counters=('submitted', 'rejected', 'rate_limited', 'delayed'),
+                                           gauges=('in_flight', 'queued', 'throttled')))
+metrics.REGISTRY.collector(stats_collector('bizowl_coalesced', 'Coalesced generations',
+                                           lambda: dict(generations.stats, in_flight=generations.in_flight()),
+                                           counters=('leaders', 'waiters', 'promoted', 'retried', 'overflow'),
+                                           gauges=('in_flight',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_spool', 'Write spool',
+                                           lambda: dict(write_spool.stats, pending=write_spool.pending(), outage=int(write_spool.outage)),
+                                           counters=('spooled', 'replayed', 'replay_failures', 'dead_lettered'),
+                                           gauges=('pending', 'outage')))
+metrics.REGISTRY.collector(stats_collector('bizowl_gemini_circuit', 'Gemini circuit breaker', gemini_breaker.snapshot,
+                                           counters=('opened', 'closed', 'short_circuited', 'failures'),
+                                           gauges=('state', 'consecutive_failures')))
+
+def materialize_chat(chat_id):
+    if not has_request_context() or session.get('chat_pending') != chat_id:
+        return
+    session.pop('chat_pending')
+    firestore_writer.enqueue('merge', ('chats', chat_id), {
         'created_at': SERVER_TIMESTAMP,
         'updated_at': SERVER_TIMESTAMP,
-        'status': 'active'
-    }
-    try:
-        chat_ref.set(chat_data, timeout=30)
-        return chat_ref.id
-    except DeadlineExceeded:
-        print("⚠️ Firestore DeadlineExceeded while creating chat session. Retrying once...")
-        try:
-            chat_ref.set(chat_data, timeout=30)
-            return chat_ref.id
-        except Exception as e:
-            print(f"❌ Failed to create chat session after retry: {e}")
-            return None
-    except Exception as e:
-        print(f"❌ Unexpected error while creating chat session: {e}")
-        return None
+        'status': 'active',
+        'has_contact': False
+    }, chat_id=chat_id)
 
 def save_message(chat_id, message, is_user=True):
-    try:
-        if not chat_id:
-            print("⚠️ No chat_id provided, skipping save_message.")
-            return
-        messages_ref = db.collection('chats').document(chat_id).collection('messages')
-        messages_ref.add({
-            'content': message,
-            'sender': 'user' if is_user else 'bot',
-            'timestamp': SERVER_TIMESTAMP
-        }, timeout=30)
-    except Exception as e:
-        print(f"❌ Error saving message: {e}")
+    if not chat_id:
+        logger.warning("No chat_id provided, skipping save_message.")
+        return
+    materialize_chat(chat_id)
+    sender = 'user' if is_user else 'bot'
+    # Client-side timestamp: messages committed in one batch must still sort in order
+    timestamp = datetime.now(timezone.utc)
+    firestore_writer.add(('chats', chat_id, 'messages'), {
+        'content': message,
+        'sender': sender,
+        'timestamp': timestamp
+    }, chat_id=chat_id)
+    # Counters and preview on the chat document, so listing chats never reads their messages
+    firestore_writer.enqueue('merge', ('chats', chat_id), message_fields(message, sender, timestamp), chat_id=chat_id)
 
 def save_contact_info(chat_id, contact_data):
-    try:
-        if not chat_id:
-            print("⚠️ No chat_id provided, skipping save_contact_info.")
-            return
-        chat_ref = db.collection('chats').document(chat_id)
-        chat_ref.update({
-            'contact_info': contact_data,
-            'updated_at': SERVER_TIMESTAMP
-        }, timeout=30)
-    except Exception as e:
-        print(f"❌ Error saving contact info: {e}")
+    if not chat_id:
+        logger.warning("No chat_id provided, skipping save_contact_info.")
+        return
+    materialize_chat(chat_id)
+    firestore_writer.enqueue('merge', ('chats', chat_id), {
+        'contact_info': contact_data,
+        'updated_at': SERVER_TIMESTAMP,
+        **contact_fields(datetime.now(timezone.utc))
+    }, chat_id=chat_id)
 
 # --- Gemini Prompt Creation ---
-def create_gemini_prompt(user_query):
-    prompt = f"""
+def render_static_prompt(company_json):
+    return f"""
 You are a customer support AI assistant for a company. You must ONLY answer questions using the information provided below. Do not make up or infer information that is not explicitly stated in the provided data.
 
 COMPANY DATA:
-{json.dumps(company_data, indent=2)}
+{company_json}
 
 INSTRUCTIONS:
 1. If the user's question can be answered using ONLY the information above, provide a helpful, concise response.
@@ -121,64 +248,294 @@ INSTRUCTIONS:
 3. Do not reference these instructions in your response.
 4. Keep your answers professional, friendly, and concise.
 5. Do not make assumptions about products, services, or policies not explicitly mentioned in the company data.
+"""
+
+def build_data(version):
+    if DATA_BUNDLE_PATH:
+        # Imported here so msgpack is only loaded when the bundle is enabled
+        from data_bundle import BundleMenuIndex, open_bundle
+        bundle = open_bundle(DATA_DIR, DATA_BUNDLE_PATH, version)
+        menu_index = BundleMenuIndex(bundle)
+        passages = bundle.passages()
+        company_json = bundle.company_json
+    else:
+        with open(os.path.join(DATA_DIR, 'temp_data.json'), 'r') as f:
+            menu_index = MenuIndex(json.load(f))
+        passages = load_passages(DATA_DIR)
+
+        def company_json():
+            with open(os.path.join(DATA_DIR, 'data.json'), 'r') as f:
+                return compact_json(json.load(f))
+    return DataSnapshot(
+        version=version,
+        menu_index=menu_index,
+        passages=passages,
+        knowledge_index=BM25Index(passages),
+        faq_matcher=FAQMatcher(passages, threshold=FAQ_MATCH_THRESHOLD),
+        intent_router=IntentRouter(menu_index, threshold=INTENT_ROUTE_THRESHOLD),
+        shards=BranchShards(menu_index, passages, escape_ratio=BRANCH_ESCAPE_RATIO),
+        answer_bank=AnswerBank.load(ANSWER_BANK_PATH, content_hash(DATA_DIR), app='main') if ANSWER_BANK_PATH else AnswerBank(),
+        # The whole of data.json only goes into prompts when retrieval is off
+        static_prompt=render_static_prompt(company_json()) if PROMPT_TOP_K <= 0 else None
+    )
+
+def data_reloaded(snapshot):
+    # Responses generated from older data are dropped as soon as the new snapshot is live
+    if response_cache:
+        response_cache.check_version(snapshot.version)
+
+try:
+    data_store = DataStore(DATA_DIR, build_data, DATA_RELOAD_INTERVAL, on_reload=data_reloaded)
+    logger.info("Data files loaded successfully (version %s). Indexed %d passages.",
+                data_store.current.version, len(data_store.current.passages))
+except Exception as e:
+    logger.error("Error loading data files: %s", e)
+    raise
 
+def current_data():
+    # Pinned per request on first use, so a reload mid-request cannot mix versions
+    if not has_request_context():
+        return data_store.current
+    if 'data' not in g:
+        g.data = data_store.current
+    return g.data
+
+def menu_branch(data):
+    # Service branch of the menu this session is browsing, or None
+    if not has_request_context():
+        return None
+    return data.shards.branch(session.get('menu_path'))
+
+@timed('prompt_build')
+def create_gemini_prompt(user_query, data, branch=None):
+    passages = data.shards.search(data.knowledge_index, user_query, branch, BRANCH_TOP_K) if branch else None
+    if passages:
+        static_section = render_static_prompt(format_passages(passages))
+    elif PROMPT_TOP_K > 0:
+        results = data.knowledge_index.search(user_query, PROMPT_TOP_K)
+        passages = [p for _, p in results] or data.knowledge_index.passages[:PROMPT_TOP_K]
+        static_section = render_static_prompt(format_passages(passages))
+    else:
+        static_section = data.static_prompt
+    prompt = f"""{static_section}
 USER QUERY: {user_query}
 """
+    PROMPT_BYTES.observe(len(prompt.encode()))
     return prompt
 
+def bank_prompt(question, data, branch=None):
+    # Prompt answer_bank.py generates a banked answer from
+    return create_gemini_prompt(question, data, branch)
+
 def get_initial_menu_options():
-    try:
-        return [{'id': k, 'text': k} for k in menu_data.get('menu', {}).get('greeting', {}).get('options', {}).keys()]
-    except Exception as e:
-        print(f"❌ Error getting initial menu options: {e}")
-        return []
+    return current_data().menu_index.initial_options()
 
 def get_next_menu_options(path):
+    return current_data().menu_index.lookup(path)
+
+AI_ERROR_MESSAGE = "I apologize, but our system is experiencing technical difficulties."
+DEGRADED_MESSAGE = "Our AI assistant is temporarily unavailable. Please choose a topic from the menu, or leave your contact details and our team will get back to you."
+
+def degraded_answer(user_input):
+    """Best answer from the local data files, used while Gemini is failing"""
+    data = current_data()
+    score, passage = data.faq_matcher.best_match(user_input)
+    if passage is None or score < DEGRADED_MATCH_THRESHOLD:
+        index = data.knowledge_index
+        passage = next((p for _, p in index.search(user_input, 3)
+                        if p.answer and index.coverage(user_input, p) >= DEGRADED_MATCH_THRESHOLD), None)
+    if passage is None:
+        return DEGRADED_MESSAGE
+    return f"Here's what I can tell you right now: {passage.answer}"
+
+def generate_content(prompt, stream=False):
+    return model.generate_content(prompt, stream=stream, request_options={'timeout': GEMINI_DEADLINE})
+
+# Gemini answered but withheld the content: a blocked prompt, or .text on a candidate stopped for safety
+CONTENT_BLOCKED = (ValueError, BlockedPromptException, StopCandidateException)
+
+def client_key():
+    # Rate limits apply per client address: a chat ID comes from a cookie the client can drop for a fresh one
+    if not has_request_context():
+        return None
+    return request.remote_addr
+
+def stream_ai_response(user_input, stream=True):
+    data = current_data()
+    with span('faq_match'):
+        faq_answer = data.faq_matcher.answer(user_input)
+    if faq_answer:
+        yield faq_answer
+        return
+
+    branch = menu_branch(data)
+    with span('answer_bank'):
+        banked = data.answer_bank.answer(user_input, branch)
+    if banked:
+        yield banked
+        return
+
+    data_version = data.version
+    client = client_key()
+    # Answers inside a branch are built from that branch's passages, so they are cached per branch
+    cache_key = make_key(user_input, "", data_version, path_key(branch) if branch else "")
+    if response_cache:
+        cached = response_cache.get(cache_key, data_version)
+        if cached:
+            logger.info("Response cache hit")
+            yield cached
+            return
+
+    if not model:
+        yield AI_ERROR_MESSAGE
+        return
+    if not gemini_breaker.allow():
+        logger.info("Gemini circuit open, answering from local data")
+        yield degraded_answer(user_input)
+        return
+
+    def generate():
+        prompt = create_gemini_prompt(user_input, data, branch)
+        logger.debug("Prompt sent to Gemini (%d bytes):\n%s", len(prompt.encode()), prompt)
+        schedule = {'session': client, 'priority': TEXT, 'cost': estimate_tokens(prompt)}
+        start = time.perf_counter()
+        first_token = None
+        texts = []
+        try:
+            if stream:
+                chunks = llm_pool.stream(lambda: (chunk.text for chunk in generate_content(prompt, stream=True)),
+                                         timeout=GEMINI_DEADLINE, **schedule)
+            else:
+                chunks = [llm_pool.call(lambda: generate_content(prompt).text, timeout=GEMINI_DEADLINE, **schedule)]
+            for text in chunks:
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    STAGE_SECONDS.observe(first_token - start, stage='gemini_first_token')
+                texts.append(text)
+                yield text
+        except LLMOverloaded:
+            raise
+        except CONTENT_BLOCKED:
+            # A refusal says nothing about Gemini's health, so a run of blocked prompts must not open the breaker
+            gemini_breaker.record_success()
+            raise
+        except Exception:
+            gemini_breaker.record_failure()
+            raise
+        gemini_breaker.record_success()
+        total = time.perf_counter() - start
+        STAGE_SECONDS.observe(total, stage='gemini')
+        response_text = "".join(texts)
+        logger.debug("Gemini response (%d bytes):\n%s", len(response_text.encode()), response_text)
+        logger.info("Gemini first token %.0fms, total %.0fms, %d chunk(s), stream=%s",
+                    ((first_token or start) - start) * 1000, total * 1000, len(texts), stream)
+        # Cached before the flight ends, so the next identical request is a cache hit
+        if response_cache and response_text:
+            response_cache.set(cache_key, response_text, data_version)
+
+    parts = []
     try:
-        current = menu_data.get('menu', {}).get('greeting', {})
-        for step in path:
-            current = current.get('options', {}).get(step, {})
-        return [
-            {'id': k, 'text': k}
-            for k in current.get('options', {}).keys()
-        ], current.get('message', '')
+        flight, leader = generations.join(cache_key)
+        with closing(flight.run(generate) if leader else flight.follow(generate)) as chunks:
+            for text in chunks:
+                parts.append(text)
+                yield text
+    except LLMOverloaded:
+        raise
+    except LLMTimeout as e:
+        metrics.ERRORS.inc(stage='gemini_timeout')
+        logger.warning("%s", e)
+        yield f"\n\n{AI_ERROR_MESSAGE}" if parts else degraded_answer(user_input)
+    except CONTENT_BLOCKED as e:
+        metrics.ERRORS.inc(stage='gemini_blocked')
+        logger.warning("Gemini withheld its answer: %s", e)
+        yield f"\n\n{AI_ERROR_MESSAGE}" if parts else degraded_answer(user_input)
     except Exception as e:
-        print(f"❌ Error getting next menu options: {e}")
-        return [], ""
+        metrics.ERRORS.inc(stage='gemini')
+        logger.exception("Error in Gemini API call: %s", e)
+        yield f"\n\n{AI_ERROR_MESSAGE}" if parts else degraded_answer(user_input)
+
+def route_to_menu(chat_id, user_input):
+    """Menu node reply for free text that the menu already answers, or None to answer it another way"""
+    data = current_data()
+    branch = menu_branch(data)
+    # A stored or banked answer to the question says more than the menu node's introduction
+    if data.faq_matcher.matches(user_input) or data.answer_bank.has(user_input, branch):
+        return None
+    with span('intent_route'):
+        path = data.intent_router.route(user_input, within=branch)
+    if path is None:
+        return None
+    options, message = get_next_menu_options(path)
+    session['menu_path'] = path
+    save_message(chat_id, message, is_user=False)
+    return {'response': message, 'options': options, 'path': path}
+
+def generate_ai_response(user_input):
+    return "".join(stream_ai_response(user_input, stream=False))
+
+BUSY_MESSAGE = "We're receiving a lot of questions right now. Please try again in a few seconds."
+
+RATE_LIMITED_MESSAGE = "You're sending messages faster than we can answer them. Please wait a few seconds and try again."
+
+def overloaded_response(error):
+    # 429 when this client is over its own rate limit, 503 when the host is out of capacity
+    if isinstance(error, LLMRateLimited):
+        response = jsonify({'response': RATE_LIMITED_MESSAGE, 'error': 'rate_limited'})
+        response.status_code = 429
+    else:
+        response = jsonify({'response': BUSY_MESSAGE, 'error': 'overloaded'})
+        response.status_code = 503
+    response.headers['Retry-After'] = str(math.ceil(error.retry_after))
+    return response
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # --- Routes ---
 @app.route('/')
 def index():
-    print("Route / called")
     if 'chat_id' not in session:
-        print("No chat_id in session, creating...")
         chat_id = create_chat_session()
-        print(f"Created chat_id: {chat_id}")
-        if not chat_id:
-            print("Failed to create chat session. Proceeding without chat_id.")
-        session['chat_id'] = chat_id
-    print("Rendering template...")
-    return render_template('index1.html', menu_options=get_initial_menu_options())
+        logger.info("Created chat_id: %s", chat_id)
+        session['chat_id'] = session['chat_pending'] = chat_id
+    return render_template('index1.html', menu_options=get_initial_menu_options(),
+                           menu_version=current_data().menu_index.version)
 
 @app.route('/get_menu_options', methods=['POST'])
 def get_menu_options():
-    data = request.json
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
     selected_option = data.get('option')
     path = data.get('path', [])
+    # Anything but a list of labels is not in the menu, so it gets the same empty reply as an unknown path
+    if not isinstance(selected_option, str) or not is_menu_path(path):
+        return jsonify({'options': [], 'bot_response': '', 'path': []})
 
     save_message(session.get('chat_id'), selected_option, is_user=True)
 
     current_path = path + [selected_option]
     next_options, bot_response = get_next_menu_options(current_path)
+    # Remember where the user is in the menu so free-text questions get that branch's context
+    if tuple(current_path) in current_data().menu_index.nodes:
+        session['menu_path'] = current_path
 
     if bot_response:
         save_message(session.get('chat_id'), bot_response, is_user=False)
 
-    return jsonify({
-        'options': next_options,
-        'bot_response': bot_response,
-        'path': current_path
-    })
+    return app.response_class(current_data().menu_index.response_json(current_path), mimetype='application/json')
+
+@app.route('/menu_tree')
+def menu_tree():
+    menu_index = current_data().menu_index
+    response = app.response_class(menu_index.tree_json, mimetype='application/json')
+    response.set_etag(menu_index.version)
+    # Pages request ?v=<version>, so a cached copy can never be stale for its URL
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400 if request.args.get('v') == menu_index.version else 0
+    return response.make_conditional(request)
 
 @app.route('/process_custom_input', methods=['POST'])
 def process_custom_input():
@@ -186,24 +543,57 @@ def process_custom_input():
 
     save_message(session.get('chat_id'), user_input, is_user=True)
 
-    response_text = "I apologize, but our system is experiencing technical difficulties."
-    if model:
-        try:
-            prompt = create_gemini_prompt(user_input)
-            print("\n🔹 Prompt sent to Gemini:\n", prompt)
-            response_obj = model.generate_content(prompt)
-            print("\n🔸 Gemini Response Object:\n", response_obj)
-            response_text = response_obj.text
-        except Exception as e:
-            print("❌ Error in Gemini API call:", e)
+    routed = route_to_menu(session.get('chat_id'), user_input)
+    if routed:
+        return jsonify(routed)
+
+    try:
+        response_text = generate_ai_response(user_input)
+    except LLMOverloaded as e:
+        logger.warning("Shedding request: %s", e)
+        return overloaded_response(e)
 
     save_message(session.get('chat_id'), response_text, is_user=False)
 
     return jsonify({'response': response_text})
 
+@app.route('/process_custom_input/stream', methods=['POST'])
+def process_custom_input_stream():
+    user_input = request.json.get('input', '')
+    chat_id = session.get('chat_id')
+
+    save_message(chat_id, user_input, is_user=True)
+
+    routed = route_to_menu(chat_id, user_input)
+    if routed:
+        return Response(sse_event('chunk', {'text': routed['response']}) + sse_event('done', routed),
+                        mimetype='text/event-stream')
+
+    chunks = stream_ai_response(user_input)
+    try:
+        # Pull the first chunk before sending headers so overload can still become a 503
+        first_chunk = next(chunks, None)
+    except LLMOverloaded as e:
+        logger.warning("Shedding streamed request: %s", e)
+        return overloaded_response(e)
+
+    def events():
+        parts = []
+        for chunk in itertools.chain([] if first_chunk is None else [first_chunk], chunks):
+            parts.append(chunk)
+            yield sse_event('chunk', {'text': chunk})
+        response_text = "".join(parts)
+        save_message(chat_id, response_text, is_user=False)
+        yield sse_event('done', {'response': response_text})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/save_contact', methods=['POST'])
 def save_contact():
-    contact_info = request.json
+    contact_info = clean_contact(request.get_json(silent=True))
+    if not contact_info:
+        return jsonify({'success': False, 'message': "Please enter your name, email or phone number."}), 400
     save_contact_info(session.get('chat_id'), contact_info)
     return jsonify({
         'success': True,
@@ -216,13 +606,47 @@ def health():
 
 @app.route('/reset', methods=['POST'])
 def reset():
-    session.pop('chat_id', None)
-    chat_id = create_chat_session()
-    if not chat_id:
-        print("⚠️ Failed to create new chat session during reset.")
-    session['chat_id'] = chat_id
+    session['chat_id'] = session['chat_pending'] = create_chat_session()
+    session.pop('menu_path', None)
     return jsonify({'options': get_initial_menu_options()})
 
+def is_admin():
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+@app.route('/admin/reload_data', methods=['POST'])
+def reload_data():
+    # Reloads this worker now; other workers pick the change up on their next check
+    if not is_admin():
+        return jsonify({'error': 'Not found'}), 404
+    try:
+        reloaded = data_store.reload(force=request.args.get('force') == '1')
+    except Exception as e:
+        logger.error("Data reload failed, keeping version %s: %s", data_store.current.version, e)
+        return jsonify({'success': False, 'error': str(e), 'version': data_store.current.version}), 500
+    return jsonify({'success': True, 'reloaded': reloaded, 'version': data_store.current.version})
+
+@app.route('/admin/chats')
+def admin_chats():
+    # One page of chats by last activity: ?limit=50&cursor=<next_cursor>&has_contact=1
+    if not is_admin():
+        return jsonify({'error': 'Not found'}), 404
+    has_contact = request.args.get('has_contact')
+    try:
+        chats, next_cursor = list_chats(db, limit=request.args.get('limit', 50, type=int),
+                                        cursor=request.args.get('cursor'),
+                                        has_contact=None if has_contact is None else has_contact == '1')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'chats': chats, 'next_cursor': next_cursor})
+
+def warm_up():
+    """Create this worker's clients and start its background threads before it takes traffic (run by gunicorn's post_worker_init)"""
+    startup.warm_up(db.get, write_spool.start, data_store.start)
+
+startup.loaded()
+startup.install(app)
+
 if __name__ == '__main__':
+    warm_up()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,64 @@
+import json
+import hashlib
+
+from fingerprint import compact_json
+
+
+def path_key(path):
+    """Key for a menu path, identical to JSON.stringify(path) in the browser"""
+    return compact_json(list(path))
+
+
+def is_menu_path(value):
+    """Whether a path sent by the browser has the shape the index looks up: a list of labels"""
+    return isinstance(value, list) and all(isinstance(step, str) for step in value)
+
+
+class MenuIndex:
+    """The temp_data.json menu tree compiled into a flat map from path tuple to node.
+
+    Every node's option list and message are built once at load time, along
+    with the serialized /get_menu_options response for that path and a
+    versioned JSON document of the whole tree for the browser.
+    """
+
+    def __init__(self, menu_data):
+        root = menu_data.get('menu', {}).get('greeting', {})
+        self.nodes = {}
+        self.responses = {}
+        stack = [((), root)]
+        while stack:
+            path, node = stack.pop()
+            options = node.get('options', {}) or {}
+            entry = {
+                'options': [{'id': k, 'text': k} for k in options.keys()],
+                'message': node.get('message', '')
+            }
+            self.nodes[path] = entry
+            self.responses[path] = json.dumps({
+                'options': entry['options'],
+                'bot_response': entry['message'],
+                'path': list(path)
+            })
+            for key, child in options.items():
+                if isinstance(child, dict):
+                    stack.append((path + (key,), child))
+        client_tree = {path_key(path): entry for path, entry in self.nodes.items()}
+        self.version = hashlib.sha1(compact_json(client_tree).encode()).hexdigest()[:12]
+        self.tree_json = compact_json({'version': self.version, 'nodes': client_tree})
+        self.empty_response = {'options': [], 'message': ''}
+
+    def initial_options(self):
+        return self.nodes[()]['options']
+
+    def lookup(self, path):
+        """Return (options, message) for a path, or ([], '') if it is not in the menu"""
+        entry = self.nodes.get(tuple(path), self.empty_response)
+        return entry['options'], entry['message']
+
+    def response_json(self, path):
+        """Pre-serialized /get_menu_options body for path"""
+        path = tuple(path)
+        if path in self.responses:
+            return self.responses[path]
+        return json.dumps({'options': [], 'bot_response': '', 'path': list(path)})
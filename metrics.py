@@ -0,0 +1,201 @@
+import time
+import bisect
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTE_BUCKETS = (1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144)
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _label_text(self.labelnames, key), value) for key, value in self.values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, state in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, state['counts']):
+                    cumulative += count
+                    labels = _label_text(self.labelnames + ('le',), key + (repr(float(bound)),))
+                    out.append((f"{self.name}_bucket", labels, cumulative))
+                labels = _label_text(self.labelnames + ('le',), key + ('+Inf',))
+                out.append((f"{self.name}_bucket", labels, state['count']))
+                out.append((f"{self.name}_sum", _label_text(self.labelnames, key), state['sum']))
+                out.append((f"{self.name}_count", _label_text(self.labelnames, key), state['count']))
+        return out
+
+
+class Registry:
+    """Process-local metrics rendered in the Prometheus text exposition format.
+
+    Besides counters and histograms owned by the registry, collectors can
+    export existing stats dicts: each returns (name, type, help, samples)
+    tuples where samples is a list of (labels dict, value).
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+        for collect in self.collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", getattr(collect, '__name__', collect), e)
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_label_text(names, [labels[n] for n in names])} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter('bizowl_http_requests_total', 'HTTP requests by route, method and status',
+                            ('route', 'method', 'status'))
+REQUEST_SECONDS = REGISTRY.histogram('bizowl_http_request_seconds', 'HTTP request latency by route', ('route',))
+STAGE_SECONDS = REGISTRY.histogram('bizowl_stage_seconds', 'Time spent in each request stage', ('stage',))
+ERRORS = REGISTRY.counter('bizowl_errors_total', 'Errors by stage', ('stage',))
+FALLBACKS = REGISTRY.counter('bizowl_spool_fallbacks_total',
+                             'Reads and writes served by the local write spool while Firebase is unavailable', ('operation',))
+PROMPT_BYTES = REGISTRY.histogram('bizowl_prompt_bytes', 'Size of prompts sent to Gemini', buckets=BYTE_BUCKETS)
+
+
+@contextmanager
+def span(stage):
+    """Time a block into bizowl_stage_seconds and count it in bizowl_errors_total if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed(stage):
+    """Decorator form of span()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats_collector(prefix, help_prefix, get_stats, counters=(), gauges=()):
+    """Collector exporting selected keys of a stats dict as counters and gauges"""
+    def collect():
+        stats = get_stats() or {}
+        for key in counters:
+            if key in stats:
+                yield f"{prefix}_{key}_total", 'counter', f"{help_prefix}: {key}", [({}, stats[key])]
+        for key in gauges:
+            if key in stats:
+                yield f"{prefix}_{key}", 'gauge', f"{help_prefix}: {key}", [({}, stats[key])]
+    collect.__name__ = f"{prefix}_collector"
+    return collect
+
+
+def install(app):
+    """Record per-route request metrics for app and serve them at /metrics"""
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        started = g.get('request_started')
+        if started is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route=route)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics for this worker process"""
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
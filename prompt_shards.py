@@ -0,0 +1,109 @@
+import os
+import math
+import heapq
+import threading
+from collections import Counter
+
+from retrieval import tokenize
+
+
+def label_terms(text):
+    return {t for t in tokenize(text) if len(t) > 2}
+
+
+def same_term(a, b):
+    """Loose term match, so web ~ website, dev ~ development and consulting ~ consultancy"""
+    if a == b:
+        return True
+    if min(len(a), len(b)) >= 3 and (a.startswith(b) or b.startswith(a)):
+        return True
+    return len(os.path.commonprefix([a, b])) >= 6
+
+
+class Shard:
+    """The passages of one menu branch: its service's own file plus its slice of data.json"""
+
+    def __init__(self, branch, topics, positions):
+        self.branch = branch
+        self.topics = topics
+        self.positions = frozenset(positions)
+
+
+class BranchShards:
+    """Scope prompt context to the service branch of the menu a user is in.
+
+    At load time every menu node with a unique label is matched against the
+    passage topics (the per-service files and the services in data.json) by
+    IDF-weighted term overlap in both directions, so "SWOT Analysis" picks up
+    SWOT.json and "SWOT Analysis Service" but not every other "Analysis".
+    A node that matches becomes a branch; deeper menu paths use their nearest
+    branch. Within a branch, passages are ranked by the global BM25 scores and
+    only the branch's passages are used, unless the best passage anywhere
+    beats the best one inside by `escape_ratio` (the user asked about
+    something else), in which case the caller falls back to global context.
+    """
+
+    def __init__(self, menu_index, passages, min_match=0.5, escape_ratio=1.5):
+        self.escape_ratio = escape_ratio
+        by_topic = {}
+        for position, passage in enumerate(passages):
+            by_topic.setdefault(passage.topic, []).append(position)
+        label_counts = Counter(path[-1] for path in menu_index.nodes if path)
+        labels = [path for path in menu_index.nodes if path and label_counts[path[-1]] == 1]
+        names = list(by_topic) + [path[-1] for path in labels]
+        df = Counter()
+        for name in names:
+            df.update(label_terms(name))
+        self.idf = {term: math.log(1 + len(names) / count) for term, count in df.items()}
+        self.shards = {}
+        for path in labels:
+            topics = [topic for topic in by_topic if self.match(path[-1], topic) >= min_match]
+            if topics:
+                self.shards[path] = Shard(path, topics, (p for topic in topics for p in by_topic[topic]))
+        self.scoped = 0
+        self.escaped = 0
+        self._lock = threading.Lock()
+
+    def match(self, label, topic):
+        """How well a menu label and a passage topic name each other, 0 to 1"""
+        a, b = label_terms(label), label_terms(topic)
+        if not a or not b:
+            return 0.0
+        weight = lambda t: self.idf.get(t, 1.0)
+        matched_a = sum(weight(t) for t in a if any(same_term(t, u) for u in b))
+        matched_b = sum(weight(u) for u in b if any(same_term(t, u) for t in a))
+        return min(matched_a / sum(map(weight, a)), matched_b / sum(map(weight, b)))
+
+    def branch(self, path):
+        """The deepest prefix of a menu path that has a shard, or None"""
+        path = tuple(path or ())
+        for end in range(len(path), 0, -1):
+            if path[:end] in self.shards:
+                return path[:end]
+        return None
+
+    def search(self, index, query, branch, k):
+        """Top-k passages of branch's shard for query, or None to use global context instead"""
+        shard = self.shards.get(branch)
+        if shard is None:
+            return None
+        scores = index.scores(query)
+        inside = [(score, position) for position, score in scores.items() if position in shard.positions]
+        best_inside = max(inside)[0] if inside else 0.0
+        if max(scores.values(), default=0.0) > best_inside * self.escape_ratio:
+            with self._lock:
+                self.escaped += 1
+            return None
+        with self._lock:
+            self.scoped += 1
+        positions = [position for _, position in heapq.nlargest(k, inside)]
+        # Fill up with the branch's leading passages (its overview) when few match the query
+        positions += [p for p in sorted(shard.positions) if p not in positions][:k - len(positions)]
+        return [index.passages[position] for position in positions]
+
+    def stats(self):
+        return {
+            'branches': len(self.shards),
+            'scoped': self.scoped,
+            'escaped': self.escaped
+        }
@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_updated_at ON buckets (updated_at);
+"""
+
+# Session buckets idle this long are full again, so their rows can go
+IDLE_SECONDS = 3600
+
+
+class RateLimiter:
+    """Token buckets for model calls, shared by every worker on the host.
+
+    Each session gets a bucket of `session_burst` calls refilled at
+    `session_rate` calls per minute. The host as a whole gets two more: one of
+    `qps` calls per second (burst of one second's worth) and one of
+    `tokens_per_minute` prompt tokens (burst of one minute's worth). A zero
+    rate disables that bucket.
+
+    Buckets live in a SQLite file (WAL mode), like the response cache, so the
+    limits hold across gunicorn workers rather than per worker. A check that
+    cannot reach the file is logged and allowed: the limiter protects the
+    upstream quota, it must not take the chat down with it.
+    """
+
+    def __init__(self, path, session_rate=10, session_burst=5, qps=5, tokens_per_minute=1000000):
+        self.path = path
+        self.session_rate = session_rate / 60
+        self.session_burst = session_burst
+        self.qps = qps
+        self.tokens_per_second = tokens_per_minute / 60
+        self.token_burst = tokens_per_minute
+        self.checks = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # SQLite connections must not be used across fork(), so a preloaded
+        # gunicorn master's connection is replaced in each worker
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _take(self, buckets):
+        """Take from every (key, rate per second, burst, amount) bucket, or from none.
+
+        Returns 0 when all of them had enough, otherwise the seconds until the
+        emptiest one will (nothing is taken in that case).
+        """
+        buckets = [(key, rate, burst, min(amount, burst)) for key, rate, burst, amount in buckets if rate > 0]
+        if not buckets:
+            return 0.0
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                wait = 0.0
+                for key, rate, burst, amount in buckets:
+                    row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                    tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                    if tokens < amount:
+                        wait = max(wait, (amount - tokens) / rate)
+                    levels.append((key, tokens - amount))
+                if not wait:
+                    conn.executemany("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                                     [(key, tokens, now) for key, tokens in levels])
+                    with self._lock:
+                        self.checks += 1
+                        prune = self.checks % 1000 == 0
+                    if prune:
+                        conn.execute("DELETE FROM buckets WHERE key LIKE 'session:%' AND updated_at < ?",
+                                     (now - IDLE_SECONDS,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Rate limit check failed, allowing the call: %s", e)
+            return 0.0
+        return wait
+
+    def _give(self, buckets):
+        """Return `amount` to every (key, rate per second, burst, amount) bucket, up to its burst"""
+        buckets = [(min(burst, amount), burst, key) for key, rate, burst, amount in buckets if rate > 0]
+        if not buckets:
+            return
+        try:
+            self._connect().executemany("UPDATE buckets SET tokens = MIN(tokens + ?, ?) WHERE key = ?", buckets)
+        except sqlite3.Error as e:
+            logger.warning("Rate limit refund failed: %s", e)
+
+    def session_wait(self, session):
+        """Take one call from session's bucket; returns 0, or the seconds until it may call"""
+        return self._take([(f"session:{session}", self.session_rate, self.session_burst, 1)])
+
+    def budget_wait(self, tokens):
+        """Take one call and `tokens` prompt tokens from the host budget; returns 0, or the seconds to wait"""
+        return self._take([('host:calls', self.qps, self.qps, 1),
+                           ('host:tokens', self.tokens_per_second, self.token_burst, tokens)])
+
+    def refund(self, session=None, tokens=None):
+        """Give back what session_wait(session) and budget_wait(tokens) took for a call that never ran"""
+        buckets = []
+        if session is not None:
+            buckets.append((f"session:{session}", self.session_rate, self.session_burst, 1))
+        if tokens is not None:
+            buckets += [('host:calls', self.qps, self.qps, 1),
+                        ('host:tokens', self.tokens_per_second, self.token_burst, tokens)]
+        self._give(buckets)
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import sqlite3
+import hashlib
+import threading
+
+from retrieval import normalize
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    data_version TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+"""
+
+
+def make_key(message, history, data_version, scope=""):
+    """Cache key for a model response: normalized message, history fingerprint, data version and prompt scope"""
+    history_fingerprint = hashlib.sha1((history or "").encode()).hexdigest()
+    raw = f"{normalize(message)}\0{history_fingerprint}\0{data_version}\0{scope}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU + TTL cache of model responses in a SQLite file.
+
+    Every gunicorn worker on the host opens the same file (WAL mode), so a
+    response generated in one worker is served to all of them. Entries from
+    an older data version are never returned and are purged the first time a
+    new version is seen. Cache failures are logged and treated as misses.
+    """
+
+    def __init__(self, path, max_entries=1000, ttl=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.data_version = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # SQLite connections must not be used across fork(), so a preloaded
+        # gunicorn master's connection is replaced in each worker
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, conn, name, amount=1):
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (amount, name))
+
+    def check_version(self, data_version):
+        """Drop entries from other data versions the first time a new one is seen"""
+        if data_version == self.data_version:
+            return
+        with self._lock:
+            if data_version == self.data_version:
+                return
+            try:
+                deleted = self._connect().execute(
+                    "DELETE FROM entries WHERE data_version != ?", (data_version,)).rowcount
+                if deleted:
+                    logger.info("Response cache invalidated %d entries for data version %s", deleted, data_version)
+            except sqlite3.Error as e:
+                logger.warning("Response cache invalidation failed: %s", e)
+            self.data_version = data_version
+
+    def get(self, key, data_version):
+        """Return the cached response for key, or None on a miss"""
+        self.check_version(data_version)
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response FROM entries WHERE key = ? AND data_version = ? AND created_at > ?",
+                (key, data_version, now - self.ttl)).fetchone()
+            if row is None:
+                self._count(conn, 'misses')
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count(conn, 'hits')
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning("Response cache read failed: %s", e)
+            return None
+
+    def set(self, key, response, data_version):
+        """Store a response and evict the least recently used entries over the size cap"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, data_version, response, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (key, data_version, response, now, now))
+                conn.execute("DELETE FROM entries WHERE created_at <= ?", (now - self.ttl,))
+                excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute(
+                        "DELETE FROM entries WHERE key IN "
+                        "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)", (excess,))
+                    self._count(conn, 'evictions', excess)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Response cache write failed: %s", e)
+
+    def stats(self):
+        """Host-wide hit/miss/eviction counters and the current entry count"""
+        try:
+            conn = self._connect()
+            stats = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            stats['entries'] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning("Response cache stats failed: %s", e)
+            return {}
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = round(stats.get('hits', 0) / lookups, 4) if lookups else 0.0
+        stats.update(max_entries=self.max_entries, ttl=self.ttl, data_version=self.data_version)
+        return stats
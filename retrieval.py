@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import math
+import heapq
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from fingerprint import compact_json
+
+MENU_FILE = 'temp_data.json'
+PRIMARY_FILE = 'data.json'
+
+STOPWORDS = frozenset("""
+a about am an and any are as at be been but by can could do does for from had has have how
+i if in into is it its me much my of on or our so than that the their them then there these they
+this to us was we what when where which who why will with would you your
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase text and collapse punctuation and whitespace"""
+    return " ".join(TOKEN_RE.findall(str(text).lower()))
+
+
+def tokenize(text):
+    """Split text into index terms, dropping stopwords and folding plurals"""
+    terms = []
+    for token in TOKEN_RE.findall(str(text).lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+@dataclass(frozen=True)
+class Passage:
+    id: int
+    source: str
+    title: str
+    text: str
+    question: str = None
+    answer: str = None
+    has_extra: bool = False
+    topic: str = ""
+
+
+def source_topic(source):
+    """Human-readable topic for a per-service data file, e.g. 'business branding'"""
+    return os.path.splitext(source)[0].replace('_', ' ')
+
+
+def trail_topic(trail, source):
+    """The service a passage belongs to: the key under 'services', else its file"""
+    for i, key in enumerate(trail[:-1]):
+        if key == 'services':
+            return trail[i + 1]
+    if source == PRIMARY_FILE:
+        return 'Bizowl'
+    return source_topic(source)
+
+
+def _has_qa(node):
+    if isinstance(node, dict):
+        if 'question' in node and 'answer' in node:
+            return True
+        return any(_has_qa(v) for v in node.values())
+    if isinstance(node, list):
+        return any(_has_qa(v) for v in node)
+    return False
+
+
+def _walk(node, trail, source, out):
+    """Emit a passage per question/answer entry and per section without any"""
+    if isinstance(node, dict) and 'question' in node and 'answer' in node:
+        question, answer = str(node['question']), str(node['answer'])
+        extra = {k: v for k, v in node.items() if k not in ('question', 'answer')}
+        text = f"Q: {question}\nA: {answer}"
+        if extra:
+            text += f"\n{compact_json(extra)}"
+        out.append(Passage(len(out), source, " > ".join(trail), text, question, answer, bool(extra),
+                           trail_topic(trail, source)))
+        return
+    items = node.items() if isinstance(node, dict) else ((None, v) for v in node)
+    for key, value in items:
+        child_trail = trail + [key] if key is not None else trail
+        if _has_qa(value):
+            _walk(value, child_trail, source, out)
+        else:
+            out.append(Passage(len(out), source, " > ".join(child_trail), compact_json(value),
+                               topic=trail_topic(child_trail, source)))
+
+
+def data_files(data_dir):
+    """Knowledge files in load order: data.json first, then the per-service files"""
+    names = sorted(n for n in os.listdir(data_dir) if n.endswith('.json') and n != MENU_FILE)
+    if PRIMARY_FILE in names:
+        names.remove(PRIMARY_FILE)
+        names.insert(0, PRIMARY_FILE)
+    return [os.path.join(data_dir, n) for n in names]
+
+
+def load_passages(data_dir):
+    """Flatten every knowledge file under data_dir into retrievable passages"""
+    passages = []
+    for path in data_files(data_dir):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        _walk(data, [], os.path.basename(path), passages)
+    return passages
+
+
+def passage_terms(passage):
+    return f"{source_topic(passage.source)} {passage.title} {passage.text}"
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of passages"""
+
+    def __init__(self, passages, k1=1.5, b=0.75, key=passage_terms):
+        self.passages = list(passages)
+        self.k1 = k1
+        self.b = b
+        self.key = key
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, passage in enumerate(self.passages):
+            terms = tokenize(key(passage))
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((doc_id, tf))
+        count = len(self.passages)
+        self.avg_length = (sum(self.doc_lengths) / count) if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def scores(self, query):
+        """Return a {position: score} map for every passage sharing a term with query"""
+        scores = defaultdict(float)
+        k1, b, avg = self.k1, self.b, self.avg_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = k1 * (1 - b + b * self.doc_lengths[doc_id] / avg)
+                scores[doc_id] += idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def coverage(self, query, passage):
+        """Share of query's terms, weighted by idf, that passage contains: 0.0 to 1.0
+
+        Terms the index has never seen weigh as much as the rarest known term,
+        so an off-topic query that shares one common word still scores low.
+        """
+        terms = set(tokenize(query))
+        unseen = max(self.idf.values(), default=1.0)
+        weights = {term: self.idf.get(term, unseen) for term in terms}
+        total = sum(weights.values())
+        if not total:
+            return 0.0
+        present = terms.intersection(tokenize(self.key(passage)))
+        return sum(weights[term] for term in present) / total
+
+    def search(self, query, k=8):
+        """Return the top-k (score, passage) pairs for query, best first"""
+        best = heapq.nlargest(k, self.scores(query).items(), key=lambda item: item[1])
+        return [(score, self.passages[doc_id]) for doc_id, score in best]
+
+
+def format_passages(passages):
+    """Render passages as the data block of a prompt"""
+    return "\n\n".join(f"[{p.source} | {p.title}]\n{p.text}" if p.title else f"[{p.source}]\n{p.text}"
+                       for p in passages)
+
+
+def retrieval_query(user_query, chat_history, history_lines=2):
+    """Combine the user message with the tail of the conversation for follow-up questions"""
+    if not chat_history:
+        return user_query
+    tail = chat_history.splitlines()[-history_lines:]
+    return "\n".join([user_query] + tail)
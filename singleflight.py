@@ -0,0 +1,161 @@
+import threading
+
+
+class FlightAbandoned(Exception):
+    """The request leading a flight stopped reading before the generation finished"""
+
+
+class Flight:
+    """One in-flight generation whose chunks are replayed to every request that joins it"""
+
+    def __init__(self, group, key):
+        self.group = group
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        # Requests that joined and are still reading, and a generation their leader left behind
+        self.followers = 0
+        self.orphan = None
+        self._cond = threading.Condition()
+
+    def _finish(self, error):
+        with self._cond:
+            if self.done:
+                return
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+        self.group._remove(self)
+
+    def _hand_over(self, chunks):
+        """Leave the rest of the generation to a follower; False if nobody is left to read it"""
+        with self._cond:
+            if not self.followers:
+                return False
+            self.orphan = chunks
+            self._cond.notify_all()
+            return True
+
+    def _leave(self):
+        orphan = None
+        with self._cond:
+            self.followers -= 1
+            if not self.followers:
+                orphan, self.orphan = self.orphan, None
+        if orphan is not None:
+            orphan.close()
+            self._finish(FlightAbandoned(f"Every request on flight {self.key[:12]} disconnected"))
+
+    def _drive(self, chunks):
+        try:
+            for chunk in chunks:
+                with self._cond:
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+                yield chunk
+        except GeneratorExit:
+            # The generation carries on for the requests still reading it
+            if not self._hand_over(chunks):
+                chunks.close()
+                self._finish(FlightAbandoned(f"Leader of flight {self.key[:12]} disconnected"))
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+        self._finish(None)
+
+    def run(self, produce):
+        """Iterate produce() as the leader, publishing each chunk to followers"""
+        return self._drive(iter(produce()))
+
+    def follow(self, produce):
+        """Yield the leader's chunks as they arrive, then re-raise its error if it failed.
+
+        If the leader disconnects this request takes over the generation. If
+        the leader failed for a reason of its own (see SingleFlight) before
+        anything was yielded, this request joins again and runs produce()
+        itself if nobody else has started it.
+        """
+        seen = 0
+        orphan = None
+        try:
+            while True:
+                with self._cond:
+                    while seen == len(self.chunks) and not self.done and self.orphan is None:
+                        self._cond.wait()
+                    chunks = self.chunks[seen:]
+                    done, error, orphan = self.done, self.error, self.orphan
+                    if orphan is not None:
+                        self.orphan = None
+                        self.followers -= 1
+                seen += len(chunks)
+                yield from chunks
+                if orphan is not None:
+                    self.group._count('promoted')
+                    yield from self._drive(orphan)
+                    return
+                if done:
+                    break
+        finally:
+            if orphan is None:
+                self._leave()
+        if error is None:
+            return
+        if seen or not isinstance(error, self.group.private_errors):
+            raise error
+        self.group._count('retried')
+        flight, leader = self.group.join(self.key)
+        yield from flight.run(produce) if leader else flight.follow(produce)
+
+
+class SingleFlight:
+    """Coalesce concurrent identical requests onto one generation.
+
+    The first request for a key becomes the leader and runs the generation;
+    requests for the same key that arrive while it is in flight follow it and
+    receive the same chunks. The key is forgotten as soon as the flight ends,
+    so later requests are served by the response cache or start a new flight.
+
+    Errors in `private_errors` (and FlightAbandoned) belong to the leader's
+    request, such as its session being rate limited, so followers retry
+    rather than fail with them. A flight takes at most `max_followers`; past
+    that a request leads a flight of its own that nobody else can join, so
+    it is bounded by whatever limits the generation itself.
+    """
+
+    def __init__(self, private_errors=(), max_followers=None):
+        self.private_errors = (FlightAbandoned,) + tuple(private_errors)
+        self.max_followers = max_followers
+        self.flights = {}
+        self.stats = {'leaders': 0, 'waiters': 0, 'promoted': 0, 'retried': 0, 'overflow': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def join(self, key):
+        """Return (flight, is_leader) for key"""
+        with self._lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                with flight._cond:
+                    if not flight.done and (self.max_followers is None or flight.followers < self.max_followers):
+                        flight.followers += 1
+                        self.stats['waiters'] += 1
+                        return flight, False
+                if not flight.done:
+                    self.stats['overflow'] += 1
+                    return Flight(self, key), True
+            flight = self.flights[key] = Flight(self, key)
+            self.stats['leaders'] += 1
+            return flight, True
+
+    def _remove(self, flight):
+        with self._lock:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+
+    def in_flight(self):
+        return len(self.flights)
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP, Increment
+
+from write_behind import MAX_BATCH_WRITES, PendingWrite, is_permanent
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    data TEXT NOT NULL,
+    chat_id TEXT,
+    spooled_at REAL NOT NULL,
+    claimed_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS writes_parent ON writes (parent);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    path TEXT NOT NULL,
+    data TEXT NOT NULL,
+    chat_id TEXT,
+    spooled_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    error TEXT NOT NULL
+);
+"""
+
+
+def encode_value(value):
+    """JSON-safe form of a Firestore field value (datetimes, SERVER_TIMESTAMP and Increment are tagged)"""
+    if value is SERVER_TIMESTAMP:
+        return {'$server_timestamp': True}
+    if isinstance(value, Increment):
+        return {'$increment': value.value}
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if value.get('$server_timestamp') is True and len(value) == 1:
+            return SERVER_TIMESTAMP
+        if '$datetime' in value and len(value) == 1:
+            return datetime.fromisoformat(value['$datetime'])
+        if '$increment' in value and len(value) == 1:
+            return Increment(value['$increment'])
+        return {k: decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    return value
+
+
+class WriteSpool:
+    """Durable SQLite spool for Firestore writes that could not be committed.
+
+    Writes are kept in a WAL-mode file shared by every worker on the host, so
+    they survive restarts and spooled messages can be read back by any worker
+    while Firestore is down. A background reconciler in each process replays
+    them in batches once Firestore accepts commits again. Every write carries
+    a client-generated document path, so a batch replayed twice (by two
+    workers, or after a crash mid-replay) is harmless, apart from counter
+    increments (chat message counts), which are applied twice.
+
+    A write Firestore will never accept (see write_behind.is_permanent) is
+    moved to the dead_letters table for inspection instead of being retried,
+    so it cannot hold up the writes spooled after it.
+    """
+
+    def __init__(self, path, commit=None, batch_size=MAX_BATCH_WRITES, retry_interval=2.0, max_retry_interval=60.0,
+                 lease=60.0):
+        self.path = path
+        # commit(writes) replays one batch; usually WriteBehindQueue.commit
+        self.commit = commit
+        self.batch_size = min(batch_size, MAX_BATCH_WRITES)
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.lease = lease
+        # Set while this process believes Firestore is unavailable; cleared by a successful replay
+        self.outage = False
+        self.stats = {'spooled': 0, 'replayed': 0, 'replay_failures': 0, 'dead_lettered': 0}
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._connect().executescript(SCHEMA)
+        atexit.register(self._closing.set)
+
+    def _connect(self):
+        # SQLite connections must not be used across fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def healthy(self):
+        return not self.outage
+
+    def add(self, writes):
+        """Spool writes that failed for want of Firestore, and mark it unavailable until they are replayed"""
+        now = time.time()
+        rows = [(w.op, '/'.join(w.path), '/'.join(w.path[:-1]), json.dumps(encode_value(w.data)), w.chat_id, now)
+                for w in writes]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO writes (op, path, parent, data, chat_id, spooled_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.stats['spooled'] += len(rows)
+        self._ensure_started()
+        if not self.outage:
+            logger.warning("Firestore unavailable, spooling writes to %s", self.path)
+        self.outage = True
+        logger.info("Spooled %d writes", len(rows))
+
+    def dead_letter(self, writes, error):
+        """Keep writes Firestore rejected for good, with the error, without retrying them"""
+        now = time.time()
+        rows = [(w.op, '/'.join(w.path), json.dumps(encode_value(w.data), default=str), w.chat_id, w.enqueued_at,
+                 now, str(error)) for w in writes]
+        self._connect().executemany("INSERT INTO dead_letters (op, path, data, chat_id, spooled_at, failed_at, error) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.stats['dead_lettered'] += len(rows)
+
+    def dead_letters(self):
+        """Number of writes kept in the dead_letters table"""
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def documents(self, collection_path, limit=None):
+        """Spooled documents directly under collection_path, oldest first"""
+        query = "SELECT data FROM writes WHERE parent = ? AND op != 'update' ORDER BY id"
+        try:
+            rows = self._connect().execute(query, ('/'.join(collection_path),)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Spool read failed: %s", e)
+            return []
+        docs = [decode_value(json.loads(data)) for (data,) in rows]
+        return docs[-limit:] if limit else docs
+
+    def pending(self):
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def _claim(self):
+        """Lease the oldest unclaimed rows to this process"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, op, path, data, chat_id, spooled_at FROM writes WHERE claimed_until < ? ORDER BY id LIMIT ?",
+                (now, self.batch_size)).fetchall()
+            if rows:
+                conn.executemany("UPDATE writes SET claimed_until = ? WHERE id = ?",
+                                 [(now + self.lease, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _release(self, ids):
+        self._connect().executemany("UPDATE writes SET claimed_until = 0 WHERE id = ?", [(i,) for i in ids])
+
+    def _move_to_dead_letters(self, rejected):
+        """Move (row, error) pairs from writes to dead_letters in one transaction"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO dead_letters (op, path, data, chat_id, spooled_at, failed_at, error) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [(op, path, data, chat_id, spooled_at, now, str(error))
+                              for (_, op, path, data, chat_id, spooled_at), error in rejected])
+            conn.executemany("DELETE FROM writes WHERE id = ?", [(row[0],) for row, _ in rejected])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for (_, _, path, _, _, _), error in rejected:
+            logger.error("Firestore rejected spooled write to %s, moved to dead_letters: %s", path, error)
+        self.stats['dead_lettered'] += len(rejected)
+
+    def _replay_each(self, rows, writes, commit):
+        """Replay a batch that failed permanently one write at a time; returns the ids committed"""
+        committed, rejected, retry = [], [], []
+        for row, write in zip(rows, writes):
+            try:
+                commit([write])
+                committed.append(row[0])
+            except Exception as e:
+                if is_permanent(e):
+                    rejected.append((row, e))
+                else:
+                    retry.append((row[0], e))
+        if rejected:
+            self._move_to_dead_letters(rejected)
+        self._connect().executemany("DELETE FROM writes WHERE id = ?", [(i,) for i in committed])
+        if retry:
+            self._release([i for i, _ in retry])
+            self.stats['replayed'] += len(committed)
+            raise retry[0][1]
+        return committed
+
+    def replay(self, commit):
+        """Commit spooled writes in batches until the spool is empty; returns the number replayed"""
+        replayed = 0
+        while True:
+            rows = self._claim()
+            if not rows:
+                break
+            writes = [PendingWrite(op, tuple(path.split('/')), decode_value(json.loads(data)), chat_id, spooled_at)
+                      for _, op, path, data, chat_id, spooled_at in rows]
+            try:
+                commit(writes)
+                committed = [row[0] for row in rows]
+                self._connect().executemany("DELETE FROM writes WHERE id = ?", [(i,) for i in committed])
+            except Exception as e:
+                if not is_permanent(e):
+                    self._release([row[0] for row in rows])
+                    raise
+                logger.warning("Spooled batch of %d writes rejected, replaying them one at a time: %s", len(rows), e)
+                committed = self._replay_each(rows, writes, commit)
+            replayed += len(committed)
+            self.stats['replayed'] += len(committed)
+        if replayed:
+            logger.info("Replayed %d spooled writes into Firestore", replayed)
+        if self.outage and (replayed or not self.pending()):
+            logger.info("Firestore accepting writes again")
+            self.outage = False
+        return replayed
+
+    def start(self):
+        """Run the reconciler in this process (also started by the first add())"""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        # Per process, like the write-behind thread: threads do not survive fork()
+        if self.commit is None:
+            return
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='firestore-reconciler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        delay = self.retry_interval
+        while not self._closing.is_set():
+            self._closing.wait(delay)
+            try:
+                if self.outage or self.pending():
+                    self.replay(self.commit)
+                delay = self.retry_interval
+            except Exception as e:
+                self.stats['replay_failures'] += 1
+                delay = min(delay * 2, self.max_retry_interval)
+                logger.warning("Spool replay failed, retrying in %.1fs: %s", delay, e)
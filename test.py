@@ -1,26 +1,66 @@
 import os
+import hmac
 import json
-from datetime import datetime
-from flask import Flask, request, render_template, jsonify, session
+import time
+import math
+import logging
+import itertools
+from contextlib import closing
+import tempfile
+from datetime import datetime, timezone
+from flask import Flask, Response, request, render_template, jsonify, session, stream_with_context, has_request_context, g
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import google.generativeai as genai
+from google.generativeai.types import BlockedPromptException, StopCandidateException
 import firebase_admin
 from firebase_admin import credentials, firestore
-from google.api_core.exceptions import DeadlineExceeded
 from google.cloud.firestore_v1 import SERVER_TIMESTAMP
 from dotenv import load_dotenv
+import metrics
+from metrics import span, timed, stats_collector, FALLBACKS, PROMPT_BYTES, STAGE_SECONDS
+from log_config import configure_logging
+from worker import LazyClient, WorkerStartup
+from fingerprint import compact_json
+from data_store import DataSnapshot, DataStore
+from response_cache import ResponseCache, make_key
+from prompt_shards import BranchShards
+from answer_bank import AnswerBank, content_hash
+from write_behind import WriteBehindQueue
+from spool import WriteSpool
+from llm_pool import LLMPool, LLMOverloaded, LLMRateLimited, LLMTimeout, VOICE, TEXT, BACKGROUND
+from rate_limit import RateLimiter
+from circuit import CircuitBreaker
+from singleflight import SingleFlight
+from menu_index import MenuIndex, is_menu_path, path_key
+from history_cache import ChatVersions, HistoryCache
+from chat_index import clean_contact, contact_fields, list_chats, message_fields
+from conversation import ConversationContext, extractive_summary, estimate_tokens, message_line, clip
+from faq_match import FAQMatcher
+from intent_router import IntentRouter
+from retrieval import BM25Index, load_passages, format_passages, retrieval_query
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
+startup = WorkerStartup()
 
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 app.secret_key = os.environ.get('FLASK_SECRET', 'SECRET_KEY')
+# Proxies in front of the app (X-Forwarded-For hops to trust), so request.remote_addr is the client's address
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+metrics.install(app)
 
-chat_memory = {}
+# Writes that could not be committed to Firebase, kept on disk and replayed once it recovers
+SPOOL_PATH = os.environ.get('SPOOL_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_write_spool.sqlite3'))
+write_spool = WriteSpool(SPOOL_PATH)
 
 firebase_credentials_str = os.getenv("FIREBASE_CREDENTIALS_JSON")
 if not firebase_credentials_str:
-    print("Firebase credentials not found in environment variables")
+    logger.error("Firebase credentials not found in environment variables")
     raise RuntimeError("Firebase credentials missing")
 else:
     try:
@@ -28,184 +68,343 @@ else:
         cred = credentials.Certificate(firebase_credentials_dict)
         if not firebase_admin._apps:
             firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        print("Firebase initialized successfully.")
+        # The Firestore client (and its gRPC channel) is created per worker on first use
+        db = LazyClient(firestore.client, 'Firestore')
+        logger.info("Firebase initialized successfully.")
     except json.JSONDecodeError as e:
-        print(f"Failed to decode Firebase credentials JSON : {e}")
+        logger.error("Failed to decode Firebase credentials JSON : %s", e)
         raise
     except Exception as e:
-        print(f"Error initializing firebase : {e}")
+        logger.error("Error initializing firebase : %s", e)
         raise
 
-#Load data files
+#Data files (loaded into a DataStore once the prompt template is defined)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-try:
-    with open(os.path.join(BASE_DIR, 'Data', 'temp_data.json'), 'r') as f:
-        menu_data = json.load(f)
-    with open(os.path.join(BASE_DIR, 'Data', 'data.json'), 'r') as f:
-        company_data = json.load(f)
-    print("Data files loaded successfully.")
-except Exception as e:
-    print(f"Error loading data files: {e}")
-    raise
+DATA_DIR = os.path.join(BASE_DIR, 'Data')
+# Seconds between checks of Data/*.json for changes; 0 disables hot reload
+DATA_RELOAD_INTERVAL = float(os.environ.get('DATA_RELOAD_INTERVAL', 5))
+# Optional compiled msgpack bundle of the data files, mapped by every worker (compiled here if missing or stale).
+# Off by default: at this data size it saves ~1ms of load but costs ~1MB RSS (see benchmarks/bench_bundle.py)
+DATA_BUNDLE_PATH = os.environ.get('DATA_BUNDLE_PATH', '')
+# Shared secret for the /admin routes (data reload, chat listing); they are disabled when unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Number of retrieved passages per prompt; 0 sends the whole of data.json instead
+PROMPT_TOP_K = int(os.environ.get('PROMPT_TOP_K', 8))
+# Similarity a question must reach to be answered straight from the FAQ data
+FAQ_MATCH_THRESHOLD = float(os.environ.get('FAQ_MATCH_THRESHOLD', 0.9))
+# Score free text must reach to be answered by jumping to a menu node instead of calling the model
+INTENT_ROUTE_THRESHOLD = float(os.environ.get('INTENT_ROUTE_THRESHOLD', 0.55))
+# Passages per prompt while the user is inside a service branch of the menu (drawn from that branch only)
+BRANCH_TOP_K = int(os.environ.get('BRANCH_TOP_K', 4))
+# How much better a passage elsewhere must score than the branch's best before the prompt leaves the branch
+BRANCH_ESCAPE_RATIO = float(os.environ.get('BRANCH_ESCAPE_RATIO', 1.5))
+# Answers generated ahead of time by answer_bank.py, served for exact matches; an empty path disables it.
+# Loaded with the data files, so after rebuilding it use POST /admin/reload_data?force=1 (or restart)
+ANSWER_BANK_PATH = os.environ.get('ANSWER_BANK_PATH', os.path.join(BASE_DIR, 'answer_bank_test.json'))
+
+# Model response cache shared by every worker on the host; an empty path disables it
+RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_response_cache.sqlite3'))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1000))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+response_cache = ResponseCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL) if RESPONSE_CACHE_PATH else None
+
+# Messages and contact info are committed in batches by a background writer
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 50))
+WRITE_FLUSH_MS = int(os.environ.get('WRITE_FLUSH_MS', 200))
+
+# Recent messages per chat, kept in sync by save_message so Firebase is only read on a miss
+HISTORY_CACHE_CHATS = int(os.environ.get('HISTORY_CACHE_CHATS', 1000))
+HISTORY_CACHE_MB = int(os.environ.get('HISTORY_CACHE_MB', 8))
+# Workers serve the same chats, so cached history is checked against per-chat versions shared through a SQLite
+# file (an empty path disables the check) and reloaded after HISTORY_CACHE_TTL seconds whatever they say
+HISTORY_VERSIONS_PATH = os.environ.get('HISTORY_VERSIONS_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_chat_versions.sqlite3'))
+HISTORY_CACHE_TTL = float(os.environ.get('HISTORY_CACHE_TTL', 60))
+history_cache = HistoryCache(max_messages=10, max_chats=HISTORY_CACHE_CHATS, max_bytes=HISTORY_CACHE_MB * 1024 * 1024,
+                             versions=ChatVersions(HISTORY_VERSIONS_PATH) if HISTORY_VERSIONS_PATH else None,
+                             ttl=HISTORY_CACHE_TTL, settle=WRITE_FLUSH_MS / 1000 + 1)
+
+# Prompt context per chat: a running summary of older turns plus the latest messages, within a token budget
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 600))
+CONTEXT_RECENT_MESSAGES = int(os.environ.get('CONTEXT_RECENT_MESSAGES', 4))
+# Messages that must leave the verbatim window before the summary is updated (one Gemini call per update);
+# at most the 10 messages cached per chat minus CONTEXT_RECENT_MESSAGES
+CONTEXT_SUMMARY_EVERY = int(os.environ.get('CONTEXT_SUMMARY_EVERY', 6))
+
+# Blocking Gemini calls run on a bounded pool; requests beyond LLM_WORKERS + LLM_QUEUE get a fast 503
+LLM_WORKERS = int(os.environ.get('LLM_WORKERS', 4))
+LLM_QUEUE = int(os.environ.get('LLM_QUEUE', 8))
+# Model call limits, shared by every worker on the host through a SQLite file (an empty path disables them).
+# Per client address: LLM_SESSION_RATE calls a minute with bursts of LLM_SESSION_BURST. Per host: LLM_GLOBAL_QPS
+# calls a second and LLM_TOKENS_PER_MINUTE prompt tokens; 0 turns either off. Calls may be delayed up to
+# LLM_MAX_WAIT seconds to fit the limits, then they are rejected
+LLM_LIMITS_PATH = os.environ.get('LLM_LIMITS_PATH', os.path.join(tempfile.gettempdir(), 'bizowl_llm_limits.sqlite3'))
+LLM_SESSION_RATE = float(os.environ.get('LLM_SESSION_RATE', 10))
+LLM_SESSION_BURST = float(os.environ.get('LLM_SESSION_BURST', 5))
+LLM_GLOBAL_QPS = float(os.environ.get('LLM_GLOBAL_QPS', 5))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get('LLM_TOKENS_PER_MINUTE', 1000000))
+LLM_MAX_WAIT = float(os.environ.get('LLM_MAX_WAIT', 5))
+llm_limiter = RateLimiter(LLM_LIMITS_PATH, LLM_SESSION_RATE, LLM_SESSION_BURST, LLM_GLOBAL_QPS,
+                          LLM_TOKENS_PER_MINUTE) if LLM_LIMITS_PATH else None
+llm_pool = LLMPool(max_workers=LLM_WORKERS, max_queue=LLM_QUEUE, limiter=llm_limiter, max_wait=LLM_MAX_WAIT)
+# Identical concurrent requests (same message, context and data version) share one generation, up to
+# LLM_QUEUE requests following each one; a follower retries on its own if the leader was rate limited
+generations = SingleFlight(private_errors=(LLMRateLimited,), max_followers=LLM_QUEUE)
+# Seconds a Gemini call may take before it counts as failed
+GEMINI_DEADLINE = float(os.environ.get('GEMINI_DEADLINE', 30))
+# Consecutive failures or timeouts that open the breaker, and seconds before it lets a probe through
+GEMINI_BREAKER_FAILURES = int(os.environ.get('GEMINI_BREAKER_FAILURES', 5))
+GEMINI_BREAKER_RESET = float(os.environ.get('GEMINI_BREAKER_RESET', 30))
+gemini_breaker = CircuitBreaker('gemini', GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET)
+# Similarity a question must reach to be answered from the FAQ data while Gemini is unavailable, and the
+# share of its terms a retrieved passage must contain otherwise; below both, DEGRADED_MESSAGE is shown
+DEGRADED_MATCH_THRESHOLD = float(os.environ.get('DEGRADED_MATCH_THRESHOLD', 0.6))
 
 #Configure Gemini 
 api_key = os.environ.get('GEMINI_API_KEY')
 if not api_key:
-    print("Gemini API key not found in environment variables.")
+    logger.warning("Gemini API key not found in environment variables.")
     model = None
 else:
-    print("Gemini API key found.")
     genai.configure(api_key=api_key)
     model = genai.GenerativeModel('gemini-1.5-flash')
-    print("Gemini model loaded:", model)
+    logger.info("Gemini model loaded: %s", model.model_name)
     
 #Firebase helper functions 
+@timed('session_create')
 def create_chat_session():
-    """Create a new chat session in Firebase"""
-    try:
-        chat_ref = db.collection('chats').document()
-        chat_data = {
-            'created_at': SERVER_TIMESTAMP,
-            'updated_at': SERVER_TIMESTAMP,
-            'status': 'active'
-        }
-        chat_ref.set(chat_data, timeout=30)
-        print(f"Created new chat session: {chat_ref.id}")
-        return chat_ref.id
-    except DeadlineExceeded:
-        print("Firestore Deadline Exceeded while creating chat session. Retrying...")
-        try:
-            chat_ref = db.collection('chats').document()
-            chat_ref.set(chat_data, timeout=30)
-            return chat_ref.id
-        except Exception as e:
-            print(f"Failed to create chat session after retry: {e}")
-            fallback_id = f"fallback_{int(datetime.utcnow().timestamp())}"
-            print(f"Using fallback chat ID: {fallback_id}")
-            return fallback_id
-    except Exception as e:
-        print(f"Unexpected error while creating chat session: {e}")
-        fallback_id = f"fallback_{int(datetime.utcnow().timestamp())}"
-        print(f"Using fallback chat ID: {fallback_id}")
-        return fallback_id
+    """Start a new chat with a locally generated ID; its Firebase document is written with the first message"""
+    chat_id = db.collection('chats').document().id
+    history_cache.seed(chat_id)
+    conversation.load(chat_id, '', None)
+    logger.info("Created new chat session: %s", chat_id)
+    return chat_id
+
+def start_chat_session():
+    """Put a new chat in the session, marked as not yet written to Firebase"""
+    chat_id = create_chat_session()
+    session['chat_id'] = chat_id
+    session['chat_pending'] = chat_id
+    return chat_id
 
 def ensure_chat_session():
     """Ensure a valid chat session exists"""
     chat_id = session.get('chat_id')
-    if not chat_id:
-        chat_id = create_chat_session()
-        session['chat_id'] = chat_id
+    # IDs from before chat documents were created lazily could collide within a second
+    if not chat_id or str(chat_id).startswith('fallback_'):
+        chat_id = start_chat_session()
     if isinstance(chat_id, (int, float)):
         chat_id = str(chat_id)
         session['chat_id'] = chat_id
     
     return chat_id
 
-def save_message(chat_id, message, is_user=True):
-    """Save message to Firebase with fallback to memory"""
-    try: 
-        if not chat_id:
-            print("No chat_id provided")
-            return
-        chat_id = str(chat_id)
-        if not chat_id.startswith('fallback_'):
-            messages_ref = db.collection('chats').document(chat_id).collection('messages')
-            messages_ref.add({
-                'content': message,
-                'sender': 'user' if is_user else 'bot',
-                'timestamp': SERVER_TIMESTAMP
-            }, timeout=30)
-            print(f"Message saved to Firebase for chat {chat_id}")
-        else:
-            raise Exception("Using fallback storage")
-            
-    except Exception as e:
-        print(f"Firebase save failed, using memory fallback: {e}")
-        chat_id = str(chat_id)
-        if chat_id not in chat_memory:
-            chat_memory[chat_id] = []
-        chat_memory[chat_id].append({
-            'content': message,
-            'sender': 'user' if is_user else 'bot',
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        print(f"Message saved to memory for chat {chat_id}")
-        
-def save_contact_info(chat_id, contact_data):
-    """Save contact information to Firebase"""
+def handle_failed_writes(writes):
+    """Spool a batch Firebase did not accept so the reconciler can replay it"""
     try:
-        if not chat_id or chat_id.startswith('fallback_'):
-            print("Cannot save contact info for fallback chat session")
-            return
-            
-        chat_ref = db.collection('chats').document(chat_id)
-        chat_ref.update({
-            'contact_info': contact_data,
-            'updated_at': SERVER_TIMESTAMP
-        }, timeout=30)
-        print(f"Contact info saved for chat {chat_id}")
+        write_spool.add(writes)
+        FALLBACKS.inc(len(writes), operation='write')
     except Exception as e:
-        print(f"Error saving contact info: {e}")
+        logger.error("Dropped %d Firebase writes, spool unavailable: %s", len(writes), e)
+
+# While the spool reports an outage, batches go straight to it instead of waiting on commit timeouts
+firestore_writer = WriteBehindQueue(db, max_batch=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_MS / 1000,
+                                    on_error=handle_failed_writes, healthy=write_spool.healthy,
+                                    on_reject=write_spool.dead_letter)
+write_spool.commit = firestore_writer.commit
+
+# Export the existing stats dicts on /metrics alongside the request and stage timings
+# FAQ and router counters belong to the current data snapshot and restart from zero after a reload
+metrics.REGISTRY.collector(stats_collector('bizowl_faq', 'FAQ short-circuit', lambda: data_store.current.faq_matcher.stats(),
+                                           counters=('lookups', 'hits'), gauges=('hit_rate',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_intent_router', 'Menu intent router',
+                                           lambda: data_store.current.intent_router.stats(),
+                                           counters=('lookups', 'routed'), gauges=('route_rate',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_prompt_shards', 'Menu branch prompt scoping',
+                                           lambda: data_store.current.shards.stats(),
+                                           counters=('scoped', 'escaped'), gauges=('branches',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_answer_bank', 'Answer bank', lambda: data_store.current.answer_bank.stats(),
+                                           counters=('lookups', 'hits'), gauges=('entries',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_data', 'Data snapshot', lambda: data_store.stats,
+                                           counters=('reloads', 'reload_failures')))
+metrics.REGISTRY.collector(stats_collector('bizowl_response_cache', 'Response cache',
+                                           lambda: response_cache.stats() if response_cache else {},
+                                           counters=('hits', 'misses', 'evictions'), gauges=('entries', 'hit_rate')))
+metrics.REGISTRY.collector(stats_collector('bizowl_history_cache', 'History cache',
+                                           lambda: dict(history_cache.stats, chats=len(history_cache.chats), bytes=history_cache.bytes),
+                                           counters=('hits', 'misses', 'stale', 'evictions'), gauges=('chats', 'bytes')))
+metrics.REGISTRY.collector(stats_collector('bizowl_firestore_writes', 'Write-behind queue',
+                                           lambda: dict(firestore_writer.stats, pending=firestore_writer.queue.unfinished_tasks),
+                                           counters=('queued', 'committed', 'failed', 'rejected', 'batches'), gauges=('pending',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_llm_pool', 'LLM pool', lambda: llm_pool.stats,
+                                           counters=('submitted', 'rejected', 'rate_limited', 'delayed'),
+                                           gauges=('in_flight', 'queued', 'throttled')))
+metrics.REGISTRY.collector(stats_collector('bizowl_coalesced', 'Coalesced generations',
+                                           lambda: dict(generations.stats, in_flight=generations.in_flight()),
+                                           counters=('leaders', 'waiters', 'promoted', 'retried', 'overflow'),
+                                           gauges=('in_flight',)))
+metrics.REGISTRY.collector(stats_collector('bizowl_spool', 'Write spool',
+                                           lambda: dict(write_spool.stats, pending=write_spool.pending(), outage=int(write_spool.outage)),
+                                           counters=('spooled', 'replayed', 'replay_failures', 'dead_lettered'),
+                                           gauges=('pending', 'outage')))
+metrics.REGISTRY.collector(stats_collector('bizowl_gemini_circuit', 'Gemini circuit breaker', gemini_breaker.snapshot,
+                                           counters=('opened', 'closed', 'short_circuited', 'failures'),
+                                           gauges=('state', 'consecutive_failures')))
+
+SUMMARY_PROMPT = """Update the running summary of a customer conversation with BizOwl Assistant.
+Keep the user's goals, business details, services discussed and any open questions. Drop greetings and menu navigation.
+Answer with the summary only, in at most {max_words} words.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+"""
+
+def summarize_conversation(summary, messages, max_tokens):
+    """Fold messages into a chat's running summary with Gemini, or extractively if it is unavailable"""
+    # Background summaries never probe a failing upstream; the extractive summary is good enough meanwhile
+    if model and gemini_breaker.closed:
+        lines = "\n".join(filter(None, map(message_line, messages)))
+        prompt = SUMMARY_PROMPT.format(max_words=max_tokens * 3 // 4, summary=summary or "(none)", messages=lines)
+        try:
+            with span('summary'):
+                text = llm_pool.call(lambda: generate_content(prompt).text, timeout=GEMINI_DEADLINE,
+                                     priority=BACKGROUND, cost=estimate_tokens(prompt))
+            if text and text.strip():
+                return clip(text.strip(), max_tokens)
+        except Exception as e:
+            logger.warning("Summary generation failed, using extractive summary: %s", e)
+    return extractive_summary(summary, messages, max_tokens)
+
+def generate_content(prompt, stream=False):
+    """Call Gemini with the request deadline applied to the underlying RPC"""
+    return model.generate_content(prompt, stream=stream, request_options={'timeout': GEMINI_DEADLINE})
+
+# Gemini answered but withheld the content: a blocked prompt, or .text on a candidate stopped for safety
+CONTENT_BLOCKED = (ValueError, BlockedPromptException, StopCandidateException)
+
+def persist_summary(chat_id, summary, until):
+    """Store a chat's running summary on its Firebase document"""
+    firestore_writer.enqueue('merge', ('chats', chat_id), {
+        'summary': summary,
+        'summary_until': until
+    }, chat_id=chat_id)
+
+conversation = ConversationContext(summarize_conversation, history_cache.peek, persist=persist_summary,
+                                   budget=CONTEXT_TOKEN_BUDGET, recent_messages=CONTEXT_RECENT_MESSAGES,
+                                   max_chats=HISTORY_CACHE_CHATS, summarize_every=CONTEXT_SUMMARY_EVERY,
+                                   max_messages=history_cache.max_messages)
+metrics.REGISTRY.collector(stats_collector('bizowl_summary', 'Conversation summaries', lambda: conversation.stats,
+                                           counters=('updates', 'update_failures')))
+
+def materialize_chat(chat_id):
+    """Queue the chat document ahead of the first write to a chat started in this session"""
+    if not has_request_context() or session.get('chat_pending') != chat_id:
+        return
+    session.pop('chat_pending')
+    firestore_writer.enqueue('merge', ('chats', chat_id), {
+        'created_at': SERVER_TIMESTAMP,
+        'updated_at': SERVER_TIMESTAMP,
+        'status': 'active',
+        'has_contact': False
+    }, chat_id=chat_id)
+
+def save_message(chat_id, message, is_user=True):
+    """Queue message for Firebase (spooled locally if Firebase is down)"""
+    if not chat_id:
+        logger.warning("No chat_id provided")
+        return
+    chat_id = str(chat_id)
+    sender = 'user' if is_user else 'bot'
+    # Client-side timestamp: messages committed in one batch must still sort in order
+    timestamp = datetime.now(timezone.utc)
+    entry = {
+        'content': message,
+        'sender': sender,
+        'timestamp': timestamp
+    }
+    history_cache.append(chat_id, entry)
+    materialize_chat(chat_id)
+    firestore_writer.add(('chats', chat_id, 'messages'), entry, chat_id=chat_id)
+    # Counters and preview on the chat document, so listing chats never reads their messages
+    firestore_writer.enqueue('merge', ('chats', chat_id), message_fields(message, sender, timestamp), chat_id=chat_id)
+    if not is_user:
+        conversation.update_later(chat_id)
+
+def save_contact_info(chat_id, contact_data):
+    """Queue contact information for Firebase"""
+    if not chat_id:
+        logger.warning("Cannot save contact info without a chat session")
+        return
+    materialize_chat(chat_id)
+    firestore_writer.enqueue('merge', ('chats', chat_id), {
+        'contact_info': contact_data,
+        'updated_at': SERVER_TIMESTAMP,
+        **contact_fields(datetime.now(timezone.utc))
+    }, chat_id=chat_id)
         
-def get_chat_history(chat_id, max_messages=10):
-    """Get recent chat history with fallback to memory"""
+def format_history(messages):
+    """Render messages as User/Assistant lines for the prompt"""
+    history = []
+    for msg in messages:
+        content = (msg.get('content') or '').strip()
+        if content:
+            role = 'User' if msg.get('sender', 'user') == 'user' else 'Assistant'
+            history.append(f"{role}: {content}")
+    return "\n".join(history)
+
+@timed('history_fetch')
+def get_chat_messages(chat_id, max_messages=10):
+    """Get recent messages from the local cache, then Firebase, with fallback to the write spool"""
+    if not chat_id:
+        return []
+    chat_id = str(chat_id)
     try:
-        if not chat_id:
-            return ""
-        chat_id = str(chat_id)
-        if not chat_id.startswith('fallback_'):
+        use_cache = max_messages <= history_cache.max_messages
+        messages = history_cache.get(chat_id) if use_cache else None
+        if messages is None:
+            if write_spool.outage:
+                raise Exception("Firebase unavailable")
+            version = history_cache.version(chat_id)
             messages_ref = db.collection('chats').document(chat_id).collection('messages')
             query = messages_ref.order_by('timestamp').limit_to_last(max_messages)
-            docs = query.get()
-            
-            history = []
-            for doc in docs:
-                msg = doc.to_dict()
-                sender = msg.get('sender', 'user')
-                content = msg.get('content', '').strip()
-                
-                if content:  
-                    role = 'User' if sender == 'user' else 'Assistant'
-                    history.append(f"{role}: {content}")
-            
-            result = "\n".join(history) if history else ""
-            print(f"Retrieved {len(history)} messages from Firebase for chat {chat_id}")
-            return result
-        else:
-            raise Exception("Using fallback storage")
+            messages = [doc.to_dict() for doc in query.get()]
+            logger.info("Retrieved %d messages from Firebase for chat %s", len(messages), chat_id)
+            # A reload means another worker may have written to the chat, its summary included
+            chat = db.collection('chats').document(chat_id).get().to_dict() or {}
+            conversation.refresh(chat_id, chat.get('summary'), chat.get('summary_until'))
+            if use_cache:
+                messages = history_cache.fill(chat_id, messages, version)
+        return messages[-max_messages:]
             
     except Exception as e:
-        print(f"Firebase fetch failed, using memory fallback: {e}")
-        chat_id = str(chat_id)
-        if chat_id in chat_memory:
-            messages = chat_memory[chat_id][-max_messages:]
-            history = []
-            for msg in messages:
-                content = msg.get('content', '').strip()
-                if content:
-                    role = 'User' if msg['sender'] == 'user' else 'Assistant'
-                    history.append(f"{role}: {content}")
-            result = "\n".join(history) if history else ""
-            print(f"Retrieved {len(history)} messages from memory for chat {chat_id}")
-            return result
+        logger.info("Firebase fetch failed, using spool fallback: %s", e)
+        FALLBACKS.inc(operation='read')
+        messages = write_spool.documents(('chats', chat_id, 'messages'), limit=max_messages)
+        if messages:
+            logger.info("Retrieved %d messages from the spool for chat %s", len(messages), chat_id)
+            return messages
         
-        print(f"No chat history found for chat {chat_id}")
-        return ""
+        logger.info("No chat history found for chat %s", chat_id)
+        return []
+
+def get_chat_history(chat_id):
+    """Conversation context for the prompt: running summary plus recent messages, within the token budget"""
+    return conversation.build(chat_id, get_chat_messages(chat_id)) if chat_id else ""
 
 #Gemini Prompt Creation
-def create_gemini_prompt(user_query, chat_history):
-    """Create a comprehensive prompt for Gemini with chat context"""
-    context_section = f"\nCONVERSATION CONTEXT:\n{chat_history}\n" if chat_history else "\nCONVERSATION CONTEXT:\nThis is the start of our conversation.\n"
-    
-    prompt = f"""
+def render_static_prompt(company_json):
+    """Render the role, company data and instructions shared by every prompt"""
+    return f"""
 You are BizOwl Assistant — a helpful, knowledgeable chatbot that helps users understand and select the best service from the company based on their needs.
 
 You are provided with structured company service data below. You must ONLY use this data to respond.
 
 COMPANY SERVICE DATA:
-{json.dumps(company_data, indent=2)}
-{context_section}
+{company_json}
+
 YOUR OBJECTIVE:
 Your job is to:
 1. Help the user identify which company service(s) fits their business goal or query.
@@ -232,91 +431,341 @@ IMPORTANT RULES:
 - Avoid excessive formatting or special characters in responses.
 - Reference previous parts of the conversation when relevant to provide continuity.
 - Don't offer to schedule calls for completely unrelated questions - just redirect politely.
+"""
 
+def build_data(version):
+    """Load Data/*.json, through the compiled bundle unless it is disabled, and build everything derived from it"""
+    if DATA_BUNDLE_PATH:
+        # Imported here so msgpack is only loaded when the bundle is enabled
+        from data_bundle import BundleMenuIndex, open_bundle
+        bundle = open_bundle(DATA_DIR, DATA_BUNDLE_PATH, version)
+        menu_index = BundleMenuIndex(bundle)
+        passages = bundle.passages()
+        company_json = bundle.company_json
+    else:
+        with open(os.path.join(DATA_DIR, 'temp_data.json'), 'r') as f:
+            menu_index = MenuIndex(json.load(f))
+        passages = load_passages(DATA_DIR)
+
+        def company_json():
+            with open(os.path.join(DATA_DIR, 'data.json'), 'r') as f:
+                return compact_json(json.load(f))
+    return DataSnapshot(
+        version=version,
+        menu_index=menu_index,
+        passages=passages,
+        knowledge_index=BM25Index(passages),
+        faq_matcher=FAQMatcher(passages, threshold=FAQ_MATCH_THRESHOLD),
+        intent_router=IntentRouter(menu_index, threshold=INTENT_ROUTE_THRESHOLD),
+        shards=BranchShards(menu_index, passages, escape_ratio=BRANCH_ESCAPE_RATIO),
+        answer_bank=AnswerBank.load(ANSWER_BANK_PATH, content_hash(DATA_DIR), app='test') if ANSWER_BANK_PATH else AnswerBank(),
+        # The whole of data.json only goes into prompts when retrieval is off
+        static_prompt=render_static_prompt(company_json()) if PROMPT_TOP_K <= 0 else None
+    )
+
+def data_reloaded(snapshot):
+    """Drop responses generated from older data as soon as the new snapshot is live"""
+    if response_cache:
+        response_cache.check_version(snapshot.version)
+
+try:
+    data_store = DataStore(DATA_DIR, build_data, DATA_RELOAD_INTERVAL, on_reload=data_reloaded)
+    logger.info("Data files loaded successfully (version %s). Indexed %d passages.",
+                data_store.current.version, len(data_store.current.passages))
+except Exception as e:
+    logger.error("Error loading data files: %s", e)
+    raise
+
+def current_data():
+    """Data snapshot for this request, pinned on first use so a reload mid-request cannot mix versions"""
+    if not has_request_context():
+        return data_store.current
+    if 'data' not in g:
+        g.data = data_store.current
+    return g.data
+
+def menu_branch(data):
+    """Service branch of the menu this session is browsing, or None"""
+    if not has_request_context():
+        return None
+    return data.shards.branch(session.get('menu_path'))
+
+def select_company_data(user_query, chat_history, data, branch=None):
+    """Render the static prompt around the passages relevant to this turn"""
+    query = retrieval_query(user_query, chat_history)
+    if branch is not None:
+        passages = data.shards.search(data.knowledge_index, query, branch, BRANCH_TOP_K)
+        if passages:
+            return render_static_prompt(format_passages(passages))
+    if PROMPT_TOP_K <= 0:
+        return data.static_prompt
+    results = data.knowledge_index.search(query, PROMPT_TOP_K)
+    passages = [p for _, p in results] or data.knowledge_index.passages[:PROMPT_TOP_K]
+    return render_static_prompt(format_passages(passages))
+
+@timed('prompt_build')
+def create_gemini_prompt(user_query, chat_history, data, branch=None):
+    """Create a comprehensive prompt for Gemini with chat context"""
+    context_section = f"\nCONVERSATION CONTEXT:\n{chat_history}\n" if chat_history else "\nCONVERSATION CONTEXT:\nThis is the start of our conversation.\n"
+    
+    prompt = f"""{select_company_data(user_query, chat_history, data, branch)}{context_section}
 CURRENT USER MESSAGE:
 {user_query}
 """
+    PROMPT_BYTES.observe(len(prompt.encode()))
     return prompt
 
+def bank_prompt(question, data, branch=None):
+    """Prompt answer_bank.py generates a banked answer from: the question as the first message of a chat"""
+    return create_gemini_prompt(question, "", data, branch)
+
 def get_initial_menu_options():
     """Get initial menu options from data"""
-    try:
-        return [{'id': k, 'text': k} for k in menu_data.get('menu', {}).get('greeting', {}).get('options', {}).keys()]
-    except Exception as e:
-        print(f"Error getting initial menu options: {e}")
-        return []
+    return current_data().menu_index.initial_options()
 
 def get_next_menu_options(path):
     """Get next menu options based on current path"""
-    try:
-        current = menu_data.get('menu', {}).get('greeting', {})
-        for step in path:
-            current = current.get('options', {}).get(step, {})
-        return [
-            {'id': k, 'text': k}
-            for k in current.get('options', {}).keys()
-        ], current.get('message', '')
-    except Exception as e:
-        print(f"Error getting next menu options: {e}")
-        return [], ""
+    return current_data().menu_index.lookup(path)
+
+def route_to_menu(chat_id, user_input):
+    """Menu node reply for free text that the menu already answers, or None to answer it another way"""
+    data = current_data()
+    branch = menu_branch(data)
+    # A stored or banked answer to the question says more than the menu node's introduction
+    if data.faq_matcher.matches(user_input) or data.answer_bank.has(user_input, branch):
+        return None
+    with span('intent_route'):
+        path = data.intent_router.route(user_input, within=branch)
+    if path is None:
+        return None
+    options, message = get_next_menu_options(path)
+    session['menu_path'] = path
+    save_message(chat_id, message, is_user=False)
+    return {'response': message, 'options': options, 'path': path}
+
+AI_ERROR_MESSAGE = "I apologize, but I'm having trouble processing your request right now. Could you please try again in a few moments or let us know if you need human assistance?"
+DEGRADED_MESSAGE = "Our AI assistant is temporarily unavailable. Please choose a topic from the menu, or leave your contact details and our team will get back to you."
+
+def degraded_answer(user_input, chat_history):
+    """Best answer from the local data files, used while Gemini is failing"""
+    data = current_data()
+    score, passage = data.faq_matcher.best_match(user_input)
+    if passage is None or score < DEGRADED_MATCH_THRESHOLD:
+        index = data.knowledge_index
+        # History helps find the passage, but only the question itself decides whether it answers it
+        results = index.search(retrieval_query(user_input, chat_history), 3)
+        passage = next((p for _, p in results
+                        if p.answer and index.coverage(user_input, p) >= DEGRADED_MATCH_THRESHOLD), None)
+    if passage is None:
+        return DEGRADED_MESSAGE
+    return f"Here's what I can tell you right now: {passage.answer}"
+
+def client_key():
+    """Key of the model call limits: the client address, since a cookieless client gets a new chat_id per request"""
+    if not has_request_context():
+        return None
+    return request.remote_addr
+
+def stream_ai_response(user_input, chat_id, stream=True, priority=TEXT):
+    """Yield the AI response in chunks, using Gemini's streaming generation when stream is set"""
+    data = current_data()
+    with span('faq_match'):
+        faq_answer = data.faq_matcher.answer(user_input)
+    if faq_answer:
+        yield faq_answer
+        return
+
+    branch = menu_branch(data)
+    with span('answer_bank'):
+        banked = data.answer_bank.answer(user_input, branch)
+    if banked:
+        yield banked
+        return
+
+    chat_history = get_chat_history(chat_id)
+    data_version = data.version
+    client = client_key()
+    # Answers inside a branch are built from that branch's passages, so they are cached per branch
+    cache_key = make_key(user_input, chat_history, data_version, path_key(branch) if branch else "")
+    if response_cache:
+        cached = response_cache.get(cache_key, data_version)
+        if cached:
+            logger.info("Response cache hit for chat %s", chat_id)
+            yield cached
+            return
 
-def generate_ai_response(user_input, chat_id):
-    """Generate AI response using Gemini with proper error handling"""
     if not model:
-        return "I apologize, but our AI system is currently unavailable. Our support team will contact you soon."
+        yield "I apologize, but our AI system is currently unavailable. Our support team will contact you soon."
+        return
+    if not gemini_breaker.allow():
+        logger.info("Gemini circuit open, answering chat %s from local data", chat_id)
+        yield degraded_answer(user_input, chat_history)
+        return
     
-    try:
-        chat_history = get_chat_history(chat_id)
-        prompt = create_gemini_prompt(user_input, chat_history)
-        
-        print(f"\nPrompt sent to Gemini for chat {chat_id}:")
-        print("=" * 50)
-        print(prompt)
-        print("=" * 50)
+    def generate():
+        prompt = create_gemini_prompt(user_input, chat_history, data, branch)
+        logger.debug("Prompt sent to Gemini for chat %s (%d bytes):\n%s", chat_id, len(prompt.encode()), prompt)
         
-        response_obj = model.generate_content(prompt)
-        response_text = response_obj.text
+        start = time.perf_counter()
+        first_token = None
+        texts = []
+        schedule = {'session': client, 'priority': priority, 'cost': estimate_tokens(prompt)}
+        try:
+            if stream:
+                chunks = llm_pool.stream(lambda: (chunk.text for chunk in generate_content(prompt, stream=True)),
+                                         timeout=GEMINI_DEADLINE, **schedule)
+            else:
+                chunks = [llm_pool.call(lambda: generate_content(prompt).text, timeout=GEMINI_DEADLINE, **schedule)]
+            for text in chunks:
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    STAGE_SECONDS.observe(first_token - start, stage='gemini_first_token')
+                texts.append(text)
+                yield text
+        except LLMOverloaded:
+            raise
+        except CONTENT_BLOCKED:
+            # A refusal says nothing about Gemini's health, so a run of blocked prompts must not open the breaker
+            gemini_breaker.record_success()
+            raise
+        except Exception:
+            # Timeouts count too; only the leader reports, so a coalesced failure counts once
+            gemini_breaker.record_failure()
+            raise
+        gemini_breaker.record_success()
+        total = time.perf_counter() - start
+        STAGE_SECONDS.observe(total, stage='gemini')
+        response_text = "".join(texts)
         
-        print(f"\nGemini Response for chat {chat_id}:")
-        print("-" * 30)
-        print(response_text)
-        print("-" * 30)
+        logger.debug("Gemini response for chat %s (%d bytes):\n%s", chat_id, len(response_text.encode()), response_text)
+        logger.info("Gemini timing for chat %s: first token %.0fms, total %.0fms, %d chunk(s), stream=%s",
+                    chat_id, ((first_token or start) - start) * 1000, total * 1000, len(texts), stream)
         
-        return response_text
+        # Cached before the flight ends, so the next identical request is a cache hit
+        if response_cache and response_text:
+            response_cache.set(cache_key, response_text, data_version)
+    
+    parts = []
+    try:
+        flight, leader = generations.join(cache_key)
+        if not leader:
+            logger.info("Chat %s joined an in-flight generation for the same message", chat_id)
+        with closing(flight.run(generate) if leader else flight.follow(generate)) as chunks:
+            for text in chunks:
+                parts.append(text)
+                yield text
         
+    except LLMOverloaded:
+        raise
+    except LLMTimeout as e:
+        metrics.ERRORS.inc(stage='gemini_timeout')
+        logger.warning("%s", e)
+        yield f"\n\n{AI_ERROR_MESSAGE}" if parts else degraded_answer(user_input, chat_history)
+    except CONTENT_BLOCKED as e:
+        metrics.ERRORS.inc(stage='gemini_blocked')
+        logger.warning("Gemini withheld its answer: %s", e)
+        yield f"\n\n{AI_ERROR_MESSAGE}" if parts else degraded_answer(user_input, chat_history)
     except Exception as e:
-        print(f"Error generating AI response: {e}")
-        return "I apologize, but I'm having trouble processing your request right now. Could you please try again in a few moments or let us know if you need human assistance?"
+        metrics.ERRORS.inc(stage='gemini')
+        logger.exception("Error generating AI response: %s", e)
+        yield f"\n\n{AI_ERROR_MESSAGE}" if parts else degraded_answer(user_input, chat_history)
+
+def generate_ai_response(user_input, chat_id, priority=TEXT):
+    """Generate AI response using Gemini with proper error handling"""
+    return "".join(stream_ai_response(user_input, chat_id, stream=False, priority=priority))
+
+BUSY_MESSAGE = "We're receiving a lot of questions right now. Please try again in a few seconds."
+
+RATE_LIMITED_MESSAGE = "You're sending messages faster than we can answer them. Please wait a few seconds and try again."
+
+def overloaded_response(error, **fields):
+    """Fast 503 when the LLM pool is shedding load, or 429 when this session is over its rate limit"""
+    if isinstance(error, LLMRateLimited):
+        response = jsonify(dict(fields, response=RATE_LIMITED_MESSAGE, error='rate_limited'))
+        response.status_code = 429
+    else:
+        response = jsonify(dict(fields, response=BUSY_MESSAGE, error='overloaded'))
+        response.status_code = 503
+    response.headers['Retry-After'] = str(math.ceil(error.retry_after))
+    return response
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_reply(user_input, chat_id, priority=TEXT, **done_fields):
+    """Stream the AI response as server-sent events and save it once complete"""
+    routed = route_to_menu(chat_id, user_input)
+    if routed:
+        return Response(sse_event('chunk', {'text': routed['response']}) + sse_event('done', dict(done_fields, **routed)),
+                        mimetype='text/event-stream')
+    chunks = stream_ai_response(user_input, chat_id, priority=priority)
+    try:
+        # Pull the first chunk before sending headers so overload can still become a 503
+        first_chunk = next(chunks, None)
+    except LLMOverloaded as e:
+        logger.warning("Shedding streamed request for chat %s: %s", chat_id, e)
+        return overloaded_response(e, **done_fields)
+
+    def events():
+        parts = []
+        for chunk in itertools.chain([] if first_chunk is None else [first_chunk], chunks):
+            parts.append(chunk)
+            yield sse_event('chunk', {'text': chunk})
+        response_text = "".join(parts)
+        save_message(chat_id, response_text, is_user=False)
+        yield sse_event('done', dict(done_fields, response=response_text))
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 #Routes 
 @app.route('/')
 def index():
     """Main page route"""
     chat_id = ensure_chat_session()
-    print(f"Index route - using chat session: {chat_id}")
-    return render_template('index1.html', menu_options=get_initial_menu_options())
+    logger.debug("Index route - using chat session: %s", chat_id)
+    return render_template('index1.html', menu_options=get_initial_menu_options(),
+                           menu_version=current_data().menu_index.version)
 
 @app.route('/get_menu_options', methods=['POST'])
 def get_menu_options():
     """Handle menu option selection"""
-    data = request.json
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
     selected_option = data.get('option')
     path = data.get('path', [])
+    # Anything but a list of labels is not in the menu, so it gets the same empty reply as an unknown path
+    if not isinstance(selected_option, str) or not is_menu_path(path):
+        return jsonify({'options': [], 'bot_response': '', 'path': []})
 
     current_path = path + [selected_option]
     next_options, bot_response = get_next_menu_options(current_path)
 
+    # Remember where the user is in the menu so free-text questions get that branch's context
+    if tuple(current_path) in current_data().menu_index.nodes:
+        session['menu_path'] = current_path
+
     # Save menu interaction to chat history
     chat_id = ensure_chat_session()
     save_message(chat_id, f"Selected menu option: {selected_option}", is_user=True)
     if bot_response:
         save_message(chat_id, bot_response, is_user=False)
 
-    return jsonify({
-        'options': next_options,
-        'bot_response': bot_response,
-        'path': current_path
-    })
+    return app.response_class(current_data().menu_index.response_json(current_path), mimetype='application/json')
+
+@app.route('/menu_tree')
+def menu_tree():
+    """Compiled menu tree so the browser can navigate without a request per click"""
+    menu_index = current_data().menu_index
+    response = app.response_class(menu_index.tree_json, mimetype='application/json')
+    response.set_etag(menu_index.version)
+    # Pages request ?v=<version>, so a cached copy can never be stale for its URL
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400 if request.args.get('v') == menu_index.version else 0
+    return response.make_conditional(request)
 
 @app.route('/process_custom_input', methods=['POST'])
 def process_custom_input():
@@ -327,13 +776,22 @@ def process_custom_input():
         return jsonify({'response': "I didn't receive any input. Could you please try again?"})
     
     chat_id = ensure_chat_session()
-    print(f"Processing custom input for chat {chat_id}: {user_input}")
+    logger.info("Processing custom input for chat %s (%d chars)", chat_id, len(user_input))
     
     # Save user message
     save_message(chat_id, user_input, is_user=True)
     
+    # Requests the menu already covers jump straight to that menu node
+    routed = route_to_menu(chat_id, user_input)
+    if routed:
+        return jsonify(routed)
+    
     # Generate AI response
-    response_text = generate_ai_response(user_input, chat_id)
+    try:
+        response_text = generate_ai_response(user_input, chat_id)
+    except LLMOverloaded as e:
+        logger.warning("Shedding request for chat %s: %s", chat_id, e)
+        return overloaded_response(e)
     
     # Save bot response
     save_message(chat_id, response_text, is_user=False)
@@ -353,12 +811,21 @@ def voice_input():
         })
 
     chat_id = ensure_chat_session()
-    print(f"Processing voice input for chat {chat_id}: {user_input}")
+    logger.info("Processing voice input for chat %s (%d chars)", chat_id, len(user_input))
     
     save_message(chat_id, user_input, is_user=True)
     
+    routed = route_to_menu(chat_id, user_input)
+    if routed:
+        return jsonify(dict(routed, success=True, transcribed_text=user_input))
+    
     # Generate AI response
-    response_text = generate_ai_response(user_input, chat_id)
+    try:
+        # Voice turns are interactive, so they go ahead of queued text
+        response_text = generate_ai_response(user_input, chat_id, priority=VOICE)
+    except LLMOverloaded as e:
+        logger.warning("Shedding voice request for chat %s: %s", chat_id, e)
+        return overloaded_response(e, success=False, transcribed_text=user_input)
     
     # Save bot response
     save_message(chat_id, response_text, is_user=False)
@@ -369,13 +836,46 @@ def voice_input():
         'transcribed_text': user_input
     })
 
+@app.route('/process_custom_input/stream', methods=['POST'])
+def process_custom_input_stream():
+    """Streaming variant of /process_custom_input using server-sent events"""
+    user_input = request.json.get('input', '').strip()
+    
+    if not user_input:
+        return Response(sse_event('done', {'response': "I didn't receive any input. Could you please try again?"}),
+                        mimetype='text/event-stream')
+    
+    chat_id = ensure_chat_session()
+    logger.info("Streaming custom input for chat %s (%d chars)", chat_id, len(user_input))
+    save_message(chat_id, user_input, is_user=True)
+    return stream_reply(user_input, chat_id)
+
+@app.route('/voice_input/stream', methods=['POST'])
+def voice_input_stream():
+    """Streaming variant of /voice_input using server-sent events"""
+    user_input = request.json.get('input', '').strip()
+    
+    if not user_input:
+        return Response(sse_event('done', {
+            'response': "I didn't catch that. Could you please try again?",
+            'success': False,
+            'transcribed_text': ''
+        }), mimetype='text/event-stream')
+
+    chat_id = ensure_chat_session()
+    logger.info("Streaming voice input for chat %s (%d chars)", chat_id, len(user_input))
+    save_message(chat_id, user_input, is_user=True)
+    return stream_reply(user_input, chat_id, priority=VOICE, success=True, transcribed_text=user_input)
+
 @app.route('/save_contact', methods=['POST'])
 def save_contact():
     """Save user contact information"""
-    contact_data = request.json
+    contact_data = clean_contact(request.get_json(silent=True))
     chat_id = session.get('chat_id')
-    
-    if chat_id and contact_data:
+    if not contact_data:
+        return jsonify({'success': False, 'message': "Please enter your name, email or phone number."}), 400
+
+    if chat_id:
         save_contact_info(chat_id, contact_data)
         save_message(chat_id, f"Contact information submitted: {contact_data.get('name', 'Unknown')} - {contact_data.get('email', 'No email')} - {contact_data.get('phone', 'No phone')}", is_user=True)
         save_message(chat_id, "Thank you! Our customer support team will contact you shortly.", is_user=False)
@@ -391,24 +891,29 @@ def health():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
-        'firebase_connected': db is not None,
-        'gemini_available': model is not None
+        'firebase_connected': db.initialized,
+        'gemini_available': model is not None,
+        'llm_pool': llm_pool.stats,
+        'gemini_circuit': gemini_breaker.state,
+        'data_version': data_store.current.version,
+        'worker': startup.stats()
     }), 200
 
 @app.route('/reset', methods=['POST'])
 def reset():
     """Reset chat session"""
     old_chat_id = session.get('chat_id')
-    print(f"Resetting chat session. Old ID: {old_chat_id}")
+    logger.info("Resetting chat session. Old ID: %s", old_chat_id)
     
     # Clear session
     session.pop('chat_id', None)
+    session.pop('chat_pending', None)
+    session.pop('menu_path', None)
     
-    # Create new chat session
-    new_chat_id = create_chat_session()
-    session['chat_id'] = new_chat_id
+    # Create new chat session; nothing is written until its first message
+    new_chat_id = start_chat_session()
     
-    print(f"New chat session created: {new_chat_id}")
+    logger.info("New chat session created: %s", new_chat_id)
     
     return jsonify({
         'success': True,
@@ -423,13 +928,70 @@ def debug_chat_history():
     if not chat_id:
         return jsonify({'error': 'No active chat session'})
     
-    history = get_chat_history(chat_id, max_messages=50)
+    history = format_history(get_chat_messages(chat_id, max_messages=50))
     return jsonify({
         'chat_id': chat_id,
         'history': history,
-        'memory_chats': list(chat_memory.keys()) if chat_memory else []
+        'context': get_chat_history(chat_id),
+        'summary': conversation.summary(chat_id)[0],
+        'spool': dict(write_spool.stats, pending=write_spool.pending(), outage=write_spool.outage),
+        'history_cache': dict(history_cache.stats, chats=len(history_cache.chats), bytes=history_cache.bytes)
     })
 
+@app.route('/debug/faq_stats')
+def debug_faq_stats():
+    """Debug endpoint to view FAQ short-circuit hit rate"""
+    return jsonify(current_data().faq_matcher.stats())
+
+@app.route('/debug/write_stats')
+def debug_write_stats():
+    """Debug endpoint to view background Firebase writer counters"""
+    return jsonify(dict(firestore_writer.stats, pending=firestore_writer.queue.unfinished_tasks))
+
+@app.route('/debug/cache_stats')
+def debug_cache_stats():
+    """Debug endpoint to view response cache counters"""
+    if not response_cache:
+        return jsonify({'enabled': False})
+    return jsonify(dict(response_cache.stats(), enabled=True))
+
+def is_admin():
+    """Whether the request carries the admin token (never, when no token is configured)"""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+@app.route('/admin/reload_data', methods=['POST'])
+def reload_data():
+    """Reload Data/*.json in this worker now; other workers pick the change up on their next check"""
+    if not is_admin():
+        return jsonify({'error': 'Endpoint not found'}), 404
+    try:
+        reloaded = data_store.reload(force=request.args.get('force') == '1')
+    except Exception as e:
+        logger.error("Data reload failed, keeping version %s: %s", data_store.current.version, e)
+        return jsonify({'success': False, 'error': str(e), 'version': data_store.current.version}), 500
+    return jsonify({'success': True, 'reloaded': reloaded, 'version': data_store.current.version})
+
+@app.route('/admin/chats')
+def admin_chats():
+    """Chats by last activity, one page per request: ?limit=50&cursor=<next_cursor>&has_contact=1"""
+    if not is_admin():
+        return jsonify({'error': 'Endpoint not found'}), 404
+    has_contact = request.args.get('has_contact')
+    try:
+        chats, next_cursor = list_chats(db, limit=request.args.get('limit', 50, type=int),
+                                        cursor=request.args.get('cursor'),
+                                        has_contact=None if has_contact is None else has_contact == '1')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'chats': chats, 'next_cursor': next_cursor})
+
+def warm_up():
+    """Create this worker's clients and start its background threads before it takes traffic (run by gunicorn's post_worker_init)"""
+    startup.warm_up(db.get, write_spool.start, data_store.start)
+
+startup.loaded()
+startup.install(app)
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -441,7 +1003,8 @@ def internal_error(error):
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    print(f"Starting Flask app on port {port}")
-    print(f"Firebase initialized: {db is not None}")
-    print(f"Gemini model available: {model is not None}")
+    logger.info("Starting Flask app on port %d", port)
+    warm_up()
+    logger.info("Firebase initialized: %s", db.initialized)
+    logger.info("Gemini model available: %s", model is not None)
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,36 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'benchmarks'))
+
+
+@pytest.fixture(scope='session')
+def load_app(tmp_path_factory):
+    """Import main or test against the in-memory stand-ins in benchmarks/fakes.py, once per run"""
+    from fakes import FakeFirestore, FakeModel, install_fake_firebase
+
+    scratch = tmp_path_factory.mktemp('apps')
+
+    def load(name):
+        if name not in sys.modules:
+            os.environ.pop('GEMINI_API_KEY', None)
+            os.environ.update({
+                'LOG_LEVEL': 'CRITICAL',
+                'DATA_RELOAD_INTERVAL': '0',
+                'ANSWER_BANK_PATH': '',
+                'LLM_LIMITS_PATH': '',
+                'RESPONSE_CACHE_PATH': str(scratch / f"{name}_cache.sqlite3"),
+                'SPOOL_PATH': str(scratch / f"{name}_spool.sqlite3"),
+                'HISTORY_VERSIONS_PATH': str(scratch / f"{name}_versions.sqlite3"),
+            })
+            install_fake_firebase(FakeFirestore())
+            module = importlib.import_module(name)
+            module.model = FakeModel(chunks=2, chunk_ms=0)
+        return sys.modules[name]
+
+    return load
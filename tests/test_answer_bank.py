@@ -0,0 +1,59 @@
+"""Loading and reviewing ahead-of-time answers"""
+import json
+
+from answer_bank import FORMAT, AnswerBank, review, save
+
+ENTRIES = [
+    {'question': "Do you offer refunds?", 'scope': [], 'answer': "Partial refunds.", 'approved': True},
+    {'question': "What does branding cost?", 'scope': ['Services', 'Branding'], 'answer': "It depends.",
+     'approved': True},
+    {'question': "Is it fast?", 'scope': [], 'answer': "Very.", 'approved': False},
+]
+
+
+def bank_file(tmp_path, **meta):
+    path = str(tmp_path / 'bank.json')
+    save(path, ENTRIES, 'abc', **dict({'app': 'main'}, **meta))
+    return path
+
+
+def test_load_serves_approved_answers_only(tmp_path):
+    bank = AnswerBank.load(bank_file(tmp_path), 'abc', app='main')
+    assert bank.answer("do you offer REFUNDS") == "Partial refunds."
+    assert bank.answer("Is it fast?") is None
+    assert len(bank.answers) == 2
+
+
+def test_scoped_answers_are_served_in_their_branch(tmp_path):
+    bank = AnswerBank.load(bank_file(tmp_path), 'abc', app='main')
+    assert bank.answer("What does branding cost?") is None
+    assert bank.answer("What does branding cost?", ('Services', 'Branding')) == "It depends."
+    # Unscoped answers hold in every branch
+    assert bank.answer("Do you offer refunds?", ('Services', 'Branding')) == "Partial refunds."
+
+
+def test_load_rejects_other_data(tmp_path):
+    assert not AnswerBank.load(bank_file(tmp_path), 'other', app='main').answers
+
+
+def test_load_rejects_the_other_apps_bank(tmp_path):
+    assert not AnswerBank.load(bank_file(tmp_path, app='test'), 'abc', app='main').answers
+
+
+def test_load_survives_missing_and_broken_files(tmp_path):
+    assert not AnswerBank.load(str(tmp_path / 'missing.json'), 'abc').answers
+    broken = tmp_path / 'broken.json'
+    broken.write_text("{")
+    assert not AnswerBank.load(str(broken), 'abc').answers
+    old = tmp_path / 'old.json'
+    old.write_text(json.dumps({'format': FORMAT + 1, 'data_hash': 'abc', 'entries': ENTRIES}))
+    assert not AnswerBank.load(str(old), 'abc').answers
+
+
+def test_review():
+    reference = "A SWOT analysis lists a business's strengths, weaknesses, opportunities and threats."
+    assert review("It covers strengths, weaknesses, opportunities and threats of your business.", reference) is None
+    assert review("", reference) == 'empty'
+    assert review("Sorry, I can't answer this question.", reference) == 'refusal'
+    assert review("strengths " * 400, reference) == 'too long'
+    assert review("Our office is open on weekdays from nine to five.", reference) == 'ungrounded'
@@ -0,0 +1,38 @@
+"""Paging through the chat listing"""
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fakes import FakeFirestore
+from chat_index import decode_cursor, list_chats
+
+NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def test_pages_do_not_skip_chats_active_at_the_same_instant():
+    db = FakeFirestore()
+    for n in range(7):
+        # Chats in pairs with identical last_activity, split across page boundaries
+        db.collection('chats').document(f"chat{n}").set({'last_activity': NOW - timedelta(seconds=n // 2)})
+    seen, cursor = [], None
+    while True:
+        chats, cursor = list_chats(db, limit=3, cursor=cursor)
+        seen += [chat['chat_id'] for chat in chats]
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"chat{n}" for n in range(7)]
+    assert len(seen) == len(set(seen))
+
+
+def encoded(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', encoded({'a': 1}), encoded(5), encoded([None, 'x']),
+                                    encoded(['2025-01-01T00:00:00']), encoded(['2025-01-01T00:00:00', 7]),
+                                    encoded(['yesterday', 'x'])])
+def test_malformed_cursors_are_value_errors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,84 @@
+"""The circuit breaker in front of Gemini"""
+import pytest
+
+import circuit
+from circuit import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit.time, 'monotonic', clock)
+    return clock
+
+
+def opened(clock, failure_threshold=3, reset_timeout=30.0):
+    breaker = CircuitBreaker('test', failure_threshold, reset_timeout)
+    for _ in range(failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_consecutive_failures_open_the_breaker(clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=30.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    # A success in between resets the count
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot()['short_circuited'] == 1
+
+
+def test_probe_success_closes_the_breaker(clock):
+    breaker = opened(clock)
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only the one probe goes through while it is out
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+    stats = breaker.snapshot()
+    assert (stats['opened'], stats['closed'], stats['consecutive_failures']) == (1, 1, 0)
+
+
+def test_probe_failure_reopens_the_breaker(clock):
+    breaker = opened(clock)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    # The reset timeout starts again from the failed probe
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.snapshot()['opened'] == 2
+
+
+def test_lost_probe_is_replaced(clock):
+    breaker = opened(clock)
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
@@ -0,0 +1,59 @@
+"""Rolling conversation summaries"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conversation import ConversationContext
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def exchange(n):
+    at = START + timedelta(minutes=n)
+    return [{'content': f"question {n}", 'sender': 'user', 'timestamp': at},
+            {'content': f"answer {n}", 'sender': 'bot', 'timestamp': at + timedelta(seconds=1)}]
+
+
+def test_summary_is_updated_every_few_exchanges():
+    messages = []
+    calls = []
+
+    def summarize(previous, older, max_tokens):
+        calls.append(len(older))
+        return f"summary of {len(older)}"
+
+    context = ConversationContext(summarize, lambda chat_id: messages[-10:], recent_messages=4, summarize_every=6)
+    for n in range(10):
+        messages.extend(exchange(n))
+        context._update('chat')
+    # 20 messages, 4 kept verbatim: two updates of 6 rather than one per exchange
+    assert calls == [6, 6]
+
+
+def test_unsummarized_messages_stay_in_context():
+    messages = exchange(0) + exchange(1) + exchange(2)
+    context = ConversationContext(lambda *args: "never", lambda chat_id: messages, recent_messages=4,
+                                  summarize_every=6)
+    context._update('chat')
+    prompt = context.build('chat', messages)
+    assert "User: question 0" in prompt and "Assistant: answer 2" in prompt
+
+
+def test_summarize_every_fits_inside_the_message_window():
+    context = ConversationContext(lambda *args: "", lambda chat_id: [], recent_messages=4, summarize_every=20,
+                                  max_messages=10)
+    assert context.summarize_every == 6
+    with pytest.raises(ValueError):
+        ConversationContext(lambda *args: "", lambda chat_id: [], recent_messages=10, max_messages=10)
+
+
+def test_newer_stored_summary_replaces_the_held_one():
+    context = ConversationContext(lambda *args: "", lambda chat_id: [])
+    context.load('chat', "first", START)
+    context.refresh('chat', "stale", START - timedelta(minutes=1))
+    assert context.summary('chat') == ("first", START)
+    # Another worker summarized further
+    context.refresh('chat', "second", START + timedelta(minutes=5))
+    assert context.summary('chat') == ("second", START + timedelta(minutes=5))
+    context.refresh('chat', None, None)
+    assert context.summary('chat')[0] == "second"
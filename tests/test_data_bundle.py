@@ -0,0 +1,66 @@
+"""The compiled msgpack bundle against loading Data/*.json directly"""
+import json
+import os
+import shutil
+
+import pytest
+
+from data_bundle import BundleMenuIndex, DataBundle, compile_bundle, open_bundle
+from fingerprint import compact_json, directory_fingerprint
+from menu_index import MenuIndex
+from retrieval import MENU_FILE, PRIMARY_FILE, load_passages
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data')
+
+
+@pytest.fixture(scope='module')
+def bundle(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('bundle') / 'data.msgpack')
+    compile_bundle(DATA_DIR, path, 'v1')
+    return DataBundle(path)
+
+
+def test_passages_and_company_match_the_json(bundle):
+    assert bundle.version == 'v1'
+    assert bundle.passages() == load_passages(DATA_DIR)
+    with open(os.path.join(DATA_DIR, PRIMARY_FILE)) as f:
+        assert bundle.company_json() == compact_json(json.load(f))
+
+
+def test_menu_matches_the_json(bundle):
+    with open(os.path.join(DATA_DIR, MENU_FILE)) as f:
+        expected = MenuIndex(json.load(f))
+    menu = BundleMenuIndex(bundle)
+    assert menu.version == expected.version
+    assert menu.tree_json == expected.tree_json.encode()
+    assert menu.initial_options() == expected.initial_options()
+    assert set(menu.nodes) == set(expected.nodes)
+    for path in expected.nodes:
+        assert menu.lookup(path) == expected.lookup(path)
+        assert menu.response_json(path) == expected.response_json(path)
+    assert menu.lookup(['No such option']) == expected.lookup(['No such option'])
+    assert menu.response_json(['No such option']) == expected.response_json(['No such option'])
+
+
+def test_open_bundle_recompiles_for_other_data(tmp_path):
+    data_dir = tmp_path / 'Data'
+    shutil.copytree(DATA_DIR, data_dir)
+    path = str(tmp_path / 'data.msgpack')
+    version = directory_fingerprint(str(data_dir))
+    assert open_bundle(str(data_dir), path, version).version == version
+
+    with open(data_dir / PRIMARY_FILE) as f:
+        company = json.load(f)
+    company['bundle_test'] = "added after the first compile"
+    (data_dir / PRIMARY_FILE).write_text(json.dumps(company))
+    changed = directory_fingerprint(str(data_dir))
+    bundle = open_bundle(str(data_dir), path, changed)
+    assert bundle.version == changed
+    assert json.loads(bundle.company_json())['bundle_test'] == "added after the first compile"
+
+
+def test_file_that_is_not_a_bundle_is_rejected(tmp_path):
+    path = tmp_path / 'data.msgpack'
+    path.write_bytes(b'NOTABUNDLE' + b'\0' * 16)
+    with pytest.raises(ValueError):
+        DataBundle(str(path))
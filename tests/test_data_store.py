@@ -0,0 +1,110 @@
+"""Hot reload of the data files behind an atomically swapped snapshot"""
+import json
+import threading
+
+import pytest
+
+from data_store import DataSnapshot, DataStore
+
+
+def snapshot(version, content):
+    return DataSnapshot(version=version, menu_index=content, passages=[content], knowledge_index=None,
+                        faq_matcher=None, intent_router=None, shards=None, answer_bank=None,
+                        static_prompt=json.dumps(content))
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    write(tmp_path, {'company': 'v0'})
+    return tmp_path
+
+
+def write(data_dir, content):
+    (data_dir / 'data.json').write_text(json.dumps(content))
+
+
+def reader(data_dir, builds=None):
+    def build(version):
+        with open(data_dir / 'data.json') as f:
+            content = json.load(f)
+        if builds is not None:
+            builds.append(version)
+        return snapshot(version, content)
+    return build
+
+
+def test_reload_publishes_a_new_snapshot_and_calls_on_reload(data_dir):
+    published = []
+    store = DataStore(str(data_dir), reader(data_dir), interval=0,
+                      on_reload=lambda snap: published.append((snap, store.current)))
+    first = store.current
+    assert first.menu_index == {'company': 'v0'}
+    assert not store.reload()
+
+    write(data_dir, {'company': 'version one'})
+    assert store.reload()
+    assert store.current is not first and store.current.menu_index == {'company': 'version one'}
+    assert store.current.version != first.version
+    # on_reload sees the snapshot already in service
+    assert published == [(store.current, store.current)]
+    # The old snapshot is untouched for requests still holding it
+    assert first.menu_index == {'company': 'v0'}
+    assert store.stats == {'reloads': 1, 'reload_failures': 0}
+
+
+def test_readers_never_see_a_mixed_snapshot(data_dir):
+    store = DataStore(str(data_dir), reader(data_dir), interval=0)
+    done = threading.Event()
+    mixed = []
+
+    def read():
+        while not done.is_set():
+            snap = store.current
+            if snap.passages[0] is not snap.menu_index or snap.static_prompt != json.dumps(snap.menu_index):
+                mixed.append(snap)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for n in range(50):
+            write(data_dir, {'company': 'x' * (n + 1)})
+            assert store.reload()
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+    assert not mixed
+    assert store.current.menu_index == {'company': 'x' * 50}
+
+
+def test_failed_build_keeps_the_previous_snapshot(data_dir):
+    builds = []
+    store = DataStore(str(data_dir), reader(data_dir, builds), interval=0)
+    before = store.current
+    (data_dir / 'data.json').write_text('{"company": ')
+    with pytest.raises(ValueError):
+        store.reload()
+    assert store.current is before
+    # The broken version is not rebuilt on every tick
+    assert not store.reload()
+    assert store.stats['reload_failures'] == 1
+
+    write(data_dir, {'company': 'fixed'})
+    assert store.reload()
+    assert store.current.menu_index == {'company': 'fixed'}
+
+
+def test_files_changing_during_a_load_are_loaded_again(data_dir):
+    builds = []
+    build = reader(data_dir, builds)
+
+    def build_while_editing(version):
+        snap = build(version)
+        if len(builds) == 1:
+            write(data_dir, {'company': 'edited during the load'})
+        return snap
+
+    store = DataStore(str(data_dir), build_while_editing, interval=0)
+    assert len(builds) == 2
+    assert store.current.menu_index == {'company': 'edited during the load'}
@@ -0,0 +1,86 @@
+"""Resuming an interrupted chat export"""
+from collections import Counter
+
+import pytest
+
+from bench_export import synthetic_db
+from export_chats import ChatExporter, read_export
+
+CHATS, MESSAGES = 60, 3
+
+
+class Crash(Exception):
+    pass
+
+
+class InterruptedExporter(ChatExporter):
+    """Stops after writing its Nth page, or dies before checkpointing it like a killed process"""
+
+    def __init__(self, *args, interrupt_after, crash=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interrupt_after = interrupt_after
+        self.crash = crash
+        self.pages_written = 0
+
+    def _write_page(self, f, page):
+        result = super()._write_page(f, page)
+        self.pages_written += 1
+        if self.pages_written == self.interrupt_after:
+            if self.crash:
+                raise Crash()
+            self.stop.set()
+        return result
+
+
+@pytest.fixture(scope='module')
+def db():
+    return synthetic_db(CHATS, MESSAGES)
+
+
+def exported(out_dir):
+    return Counter((doc['kind'], doc.get('chat_id'), doc['id']) for doc in read_export(out_dir))
+
+
+def assert_complete(out_dir):
+    documents = exported(out_dir)
+    assert max(documents.values()) == 1
+    assert len(documents) == CHATS * (MESSAGES + 1)
+
+
+def test_export_holds_every_document_once(db, tmp_path):
+    exporter = ChatExporter(db, str(tmp_path), workers=4, shards=4, page_size=7)
+    assert exporter.run()
+    assert exporter.stats['chats'] == CHATS and exporter.stats['messages'] == CHATS * MESSAGES
+    assert_complete(str(tmp_path))
+
+
+def test_resume_after_a_crash_writes_no_duplicates(db, tmp_path):
+    crashing = InterruptedExporter(db, str(tmp_path), workers=1, shards=4, page_size=7, interrupt_after=3,
+                                   crash=True)
+    with pytest.raises(Crash):
+        crashing.run(fresh=True)
+    # The crashed page reached the file but not the checkpoint
+    assert crashing.stats['pages'] == 2
+
+    resumed = ChatExporter(db, str(tmp_path), workers=1, shards=4, page_size=7)
+    assert resumed.run()
+    assert crashing.stats['chats'] + resumed.stats['chats'] == CHATS
+    assert_complete(str(tmp_path))
+
+
+def test_stop_between_pages_then_resume(db, tmp_path):
+    stopped = InterruptedExporter(db, str(tmp_path), workers=2, shards=4, page_size=7, interrupt_after=3)
+    assert not stopped.run(fresh=True)
+    assert 0 < stopped.stats['chats'] < CHATS
+    assert ChatExporter(db, str(tmp_path), workers=2, shards=4, page_size=7).run()
+    assert_complete(str(tmp_path))
+    # A finished export run again exports nothing more
+    again = ChatExporter(db, str(tmp_path), workers=2, shards=4, page_size=7)
+    assert again.run() and again.stats['chats'] == 0
+    assert_complete(str(tmp_path))
+
+
+def test_resume_with_another_shard_count_is_refused(db, tmp_path):
+    InterruptedExporter(db, str(tmp_path), workers=1, shards=4, page_size=7, interrupt_after=1).run(fresh=True)
+    with pytest.raises(ValueError):
+        ChatExporter(db, str(tmp_path), shards=8).run()
@@ -0,0 +1,59 @@
+"""Serving stored FAQ answers without the model"""
+from faq_match import FAQMatcher
+from retrieval import Passage
+
+
+def passage(n, question, answer, topic="", has_extra=False, source='faq.json'):
+    return Passage(n, source, 'faq', f"Q: {question}\nA: {answer}", question, answer, has_extra, topic)
+
+
+PASSAGES = [
+    passage(0, "What is a SWOT analysis?", "A structured look at strengths and weaknesses."),
+    passage(1, "How long does a logo design take?", "About two weeks."),
+    passage(2, "What are the pricing options?", "Branding starts at 500.", topic="business branding"),
+    passage(3, "What are the pricing options?", "Websites start at 900.", topic="website development"),
+    passage(4, "What are the package details?", "See the table.", has_extra=True),
+]
+
+
+def test_verbatim_and_reworded_copies_are_served():
+    matcher = FAQMatcher(PASSAGES)
+    assert matcher.answer("what is a swot analysis") == "A structured look at strengths and weaknesses."
+    assert matcher.answer("How long does logo design take?") == "About two weeks."
+
+
+def test_threshold_decides_near_misses():
+    query = "How long does a logo take?"
+    score, best = FAQMatcher(PASSAGES).best_match(query)
+    assert best is PASSAGES[1] and 0.8 < score < 0.9
+    assert FAQMatcher(PASSAGES, threshold=0.9).answer(query) is None
+    assert FAQMatcher(PASSAGES, threshold=0.8).answer(query) == "About two weeks."
+
+
+def test_question_sharing_words_is_not_a_hit():
+    matcher = FAQMatcher(PASSAGES)
+    assert matcher.answer("What is a logo?") is None
+    assert matcher.answer("How long does shipping take to Pune?") is None
+    assert not matcher.matches("Tell me about SWOT")
+
+
+def test_generic_and_structured_questions_are_never_served():
+    matcher = FAQMatcher(PASSAGES)
+    assert matcher.answer("What are the pricing options?") is None
+    assert matcher.answer("What are the package details?") is None
+
+
+def test_generic_question_naming_its_service_is_served():
+    branding = passage(0, "What are the business branding pricing options?", "Branding starts at 500.",
+                       topic="business branding")
+    other = passage(1, "What are the business branding pricing options?", "Ask sales.", topic="website development")
+    assert FAQMatcher([branding, other]).answer("What are the business branding pricing options?") == \
+        "Branding starts at 500."
+
+
+def test_stats_count_lookups_not_matches():
+    matcher = FAQMatcher(PASSAGES)
+    matcher.matches("What is a SWOT analysis?")
+    matcher.answer("What is a SWOT analysis?")
+    matcher.answer("Where is your office?")
+    assert matcher.stats() == {'lookups': 2, 'hits': 1, 'hit_rate': 0.5, 'threshold': 0.9}
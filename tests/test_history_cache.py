@@ -0,0 +1,55 @@
+"""History cache completeness across workers sharing a chat"""
+import time
+
+from history_cache import ChatVersions, HistoryCache
+
+
+def message(n):
+    return {'content': f"message {n}", 'sender': 'user', 'timestamp': None}
+
+
+def workers(tmp_path, **kwargs):
+    path = str(tmp_path / 'versions.sqlite3')
+    return (HistoryCache(versions=ChatVersions(path), settle=0, **kwargs),
+            HistoryCache(versions=ChatVersions(path), settle=0, **kwargs))
+
+
+def test_write_by_another_worker_invalidates_cache(tmp_path):
+    a, b = workers(tmp_path)
+    a.seed('chat')
+    a.append('chat', message(1))
+    assert a.get('chat') == [message(1)]
+
+    # The next turn lands on the other worker
+    b.append('chat', message(2))
+    assert a.get('chat') is None
+    assert a.stats['stale'] == 1
+
+    version = a.version('chat')
+    assert a.fill('chat', [message(1), message(2)], version) == [message(1), message(2)]
+    assert a.get('chat') == [message(1), message(2)]
+
+
+def test_own_writes_keep_cache_complete(tmp_path):
+    a, _ = workers(tmp_path)
+    a.seed('chat')
+    for n in range(3):
+        a.append('chat', message(n))
+    assert a.get('chat') == [message(n) for n in range(3)]
+
+
+def test_fill_right_after_a_foreign_write_stays_incomplete(tmp_path):
+    a, b = workers(tmp_path)
+    a.settle = 60
+    b.append('chat', message(1))
+    # b's write may still be in its write-behind queue, so this load cannot be trusted for long
+    a.fill('chat', [], a.version('chat'))
+    assert a.get('chat') is None
+
+
+def test_completeness_expires(tmp_path):
+    cache = HistoryCache(ttl=0.05)
+    cache.seed('chat')
+    assert cache.get('chat') == []
+    time.sleep(0.1)
+    assert cache.get('chat') is None
@@ -0,0 +1,33 @@
+"""Routing free text onto the menu in Data/temp_data.json"""
+import os
+import json
+
+import pytest
+
+from intent_router import IntentRouter
+from menu_index import MenuIndex
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STRATEGY = ('Services', 'Business Planning & Strategy')
+SWOT = STRATEGY + ('SWOT Analysis',)
+
+
+@pytest.fixture(scope='module')
+def router():
+    with open(os.path.join(BASE_DIR, 'Data', 'temp_data.json')) as f:
+        return IntentRouter(MenuIndex(json.load(f)))
+
+
+def test_topic_requests_are_routed(router):
+    assert router.route("I want a website") == ['Services', 'Web Development', 'Website Development']
+    assert router.route("swot") == list(SWOT)
+
+
+@pytest.mark.parametrize('query', ["How much does a SWOT analysis cost?", "Why do I need a SWOT analysis?"])
+def test_specific_questions_go_to_the_model(router, query):
+    assert router.route(query) is None
+
+
+def test_routing_stays_inside_the_current_branch(router):
+    assert router.route("I want a website", within=SWOT) is None
+    assert router.route("swot", within=STRATEGY) == list(SWOT)
@@ -0,0 +1,76 @@
+"""Queue bounds and model call limits in the LLM pool"""
+import time
+import threading
+
+import pytest
+
+from llm_pool import LLMPool, LLMOverloaded
+from rate_limit import RateLimiter
+
+
+class Limits:
+    """Limiter stand-in with scripted waits that records refunds"""
+
+    def __init__(self, session_waits=(), budget_wait=0.0):
+        self.session_waits = list(session_waits)
+        self.budget = budget_wait
+        self.budget_gate = None
+        self.refunds = []
+
+    def session_wait(self, session):
+        return self.session_waits.pop(0) if self.session_waits else 0.0
+
+    def budget_wait(self, tokens):
+        if self.budget_gate is not None:
+            self.budget_gate.wait(5)
+        return self.budget
+
+    def refund(self, session=None, tokens=None):
+        self.refunds.append((session, tokens))
+
+
+def test_session_throttled_calls_count_against_the_queue():
+    pool = LLMPool(max_workers=1, max_queue=0, limiter=Limits(session_waits=[0.3]), max_wait=1)
+    slow = threading.Thread(target=pool.call, args=(lambda: None,), kwargs={'session': 'a'})
+    slow.start()
+    try:
+        while not pool.throttled:
+            time.sleep(0.01)
+        with pytest.raises(LLMOverloaded):
+            pool.call(lambda: None, session='b')
+    finally:
+        slow.join()
+
+
+def test_budget_is_checked_without_holding_the_lock():
+    limits = Limits()
+    limits.budget_gate = threading.Event()
+    pool = LLMPool(max_workers=1, max_queue=1, limiter=limits, max_wait=5)
+    caller = threading.Thread(target=pool.call, args=(lambda: None,))
+    caller.start()
+    try:
+        while pool._checking is None:
+            time.sleep(0.01)
+        assert pool._cond.acquire(timeout=1)
+        pool._cond.release()
+    finally:
+        limits.budget_gate.set()
+        caller.join()
+    assert pool.stats['submitted'] == 1
+
+
+def test_shed_call_gives_back_its_session_token():
+    limits = Limits(budget_wait=60)
+    pool = LLMPool(max_workers=1, max_queue=1, limiter=limits, max_wait=0.1)
+    with pytest.raises(LLMOverloaded):
+        pool.call(lambda: None, session='a', cost=100)
+    assert limits.refunds == [('a', None)]
+
+
+def test_refund_restores_a_session_call(tmp_path):
+    limiter = RateLimiter(str(tmp_path / 'limits.sqlite3'), session_rate=1, session_burst=1, qps=0,
+                          tokens_per_minute=0)
+    assert limiter.session_wait('a') == 0
+    assert limiter.session_wait('a') > 0
+    limiter.refund('a')
+    assert limiter.session_wait('a') == 0
@@ -0,0 +1,72 @@
+"""The Prometheus text exposition served at /metrics"""
+import pytest
+
+from metrics import Registry, stats_collector
+
+
+def test_counter_and_histogram_exposition():
+    registry = Registry()
+    requests = registry.counter('app_requests_total', 'Requests by route', ('route', 'status'))
+    latency = registry.histogram('app_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+    requests.inc(route='/chat', status=200)
+    requests.inc(2, route='/chat', status=200)
+    latency.observe(0.05, route='/chat')
+    latency.observe(0.5, route='/chat')
+    latency.observe(3.0, route='/chat')
+    assert registry.render().splitlines() == [
+        "# HELP app_requests_total Requests by route",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{route="/chat",status="200"} 3',
+        "# HELP app_seconds Latency",
+        "# TYPE app_seconds histogram",
+        'app_seconds_bucket{route="/chat",le="0.1"} 1',
+        'app_seconds_bucket{route="/chat",le="1.0"} 2',
+        'app_seconds_bucket{route="/chat",le="+Inf"} 3',
+        'app_seconds_sum{route="/chat"} 3.55',
+        'app_seconds_count{route="/chat"} 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter('app_errors_total', 'Errors', ('stage',)).inc(stage='say "hi"\\\n')
+    assert r'app_errors_total{stage="say \"hi\"\\\n"} 1' in registry.render().splitlines()
+
+
+def test_stats_collector_exports_selected_keys():
+    registry = Registry()
+    stats = {'hits': 4, 'entries': 2, 'hit_rate': 0.5}
+    registry.collector(stats_collector('app_cache', 'Cache', lambda: stats, counters=('hits', 'missing'),
+                                       gauges=('entries',)))
+    assert registry.render().splitlines() == [
+        "# HELP app_cache_hits_total Cache: hits",
+        "# TYPE app_cache_hits_total counter",
+        "app_cache_hits_total 4",
+        "# HELP app_cache_entries Cache: entries",
+        "# TYPE app_cache_entries gauge",
+        "app_cache_entries 2",
+    ]
+
+
+def test_failing_collector_is_skipped():
+    registry = Registry()
+
+    @registry.collector
+    def broken():
+        raise RuntimeError("store unavailable")
+
+    registry.collector(lambda: [('app_up', 'gauge', 'Up', [({'worker': '1'}, 1)])])
+    assert registry.render() == '# HELP app_up Up\n# TYPE app_up gauge\napp_up{worker="1"} 1\n'
+
+
+@pytest.mark.parametrize('name', ['main', 'test'])
+def test_metrics_route_records_requests(load_app, name):
+    client = load_app(name).app.test_client()
+    client.get('/')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    assert "# TYPE bizowl_http_requests_total counter" in lines
+    assert any(line.startswith('bizowl_http_requests_total{route="/",method="GET",status="200"} ') for line in lines)
+    assert "# TYPE bizowl_gemini_circuit_state gauge" in lines
@@ -0,0 +1,51 @@
+"""Scoping prompt context to the menu branch a user is in"""
+import json
+import os
+
+import pytest
+
+from menu_index import MenuIndex
+from prompt_shards import BranchShards
+from retrieval import MENU_FILE, BM25Index, load_passages
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data')
+SWOT = ('Services', 'Business Planning & Strategy', 'SWOT Analysis')
+WEB = ('Services', 'Web Development')
+
+
+@pytest.fixture(scope='module')
+def index():
+    return BM25Index(load_passages(DATA_DIR))
+
+
+@pytest.fixture
+def shards(index):
+    with open(os.path.join(DATA_DIR, MENU_FILE)) as f:
+        return BranchShards(MenuIndex(json.load(f)), index.passages)
+
+
+def test_branches_match_their_service_only(shards):
+    assert sorted(shards.shards[SWOT].topics) == ['SWOT', 'SWOT Analysis Service']
+    assert sorted(shards.shards[WEB].topics) == ['Web dev', 'Website Development Service']
+    # "Business Planning & Strategy" names no single service
+    assert ('Services', 'Business Planning & Strategy') not in shards.shards
+
+
+def test_deeper_paths_use_their_nearest_branch(shards):
+    assert shards.branch(SWOT + ('What is included?', 'Pricing')) == SWOT
+    assert shards.branch(('Services', 'Business Planning & Strategy')) is None
+    assert shards.branch(('No such menu',)) is None
+    assert shards.branch(None) is None
+
+
+def test_search_stays_inside_the_branch(shards, index):
+    found = shards.search(index, "What does the analysis include and how long does it take?", SWOT, 5)
+    assert len(found) == 5
+    assert {passage.topic for passage in found} <= set(shards.shards[SWOT].topics)
+    assert shards.stats()['scoped'] == 1
+
+
+def test_question_about_another_service_escapes_the_branch(shards, index):
+    assert shards.search(index, "How much does website development cost?", SWOT, 5) is None
+    assert shards.search(index, "What is a SWOT analysis?", ('No such menu',), 5) is None
+    assert shards.stats() == {'branches': len(shards.shards), 'scoped': 0, 'escaped': 1}
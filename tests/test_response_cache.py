@@ -0,0 +1,89 @@
+"""The SQLite response cache shared by workers"""
+import os
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, make_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, 'time', clock)
+    return clock
+
+
+def cache_at(tmp_path, **kwargs):
+    return ResponseCache(str(tmp_path / 'cache.sqlite3'), **kwargs)
+
+
+def test_hit_and_miss(tmp_path, clock):
+    cache = cache_at(tmp_path)
+    key = make_key("What is SWOT?", "", 'v1')
+    assert cache.get(key, 'v1') is None
+    cache.set(key, "An analysis.", 'v1')
+    # Keys ignore case and punctuation in the message
+    assert cache.get(make_key("what is swot", "", 'v1'), 'v1') == "An analysis."
+    assert cache.get(make_key("What is SWOT?", "User: hi", 'v1'), 'v1') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 1)
+
+
+def test_entries_expire(tmp_path, clock):
+    cache = cache_at(tmp_path, ttl=60)
+    cache.set('k', "answer", 'v1')
+    clock.now += 59
+    assert cache.get('k', 'v1') == "answer"
+    clock.now += 2
+    assert cache.get('k', 'v1') is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = cache_at(tmp_path, max_entries=2)
+    for key in ('a', 'b'):
+        cache.set(key, key.upper(), 'v1')
+        clock.now += 1
+    assert cache.get('a', 'v1') == "A"
+    clock.now += 1
+    cache.set('c', "C", 'v1')
+    assert cache.get('b', 'v1') is None
+    assert cache.get('a', 'v1') == "A" and cache.get('c', 'v1') == "C"
+    assert cache.stats()['evictions'] == 1
+
+
+def test_new_data_version_purges_old_entries(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite3')
+    old_worker, new_worker = ResponseCache(path), ResponseCache(path)
+    old_worker.set('k', "old answer", 'v1')
+    assert old_worker.get('k', 'v1') == "old answer"
+    # Another worker reloads the data
+    assert new_worker.get('k', 'v2') is None
+    assert new_worker.stats()['entries'] == 0
+    assert old_worker.get('k', 'v1') is None
+
+
+def test_forked_worker_opens_its_own_connection(tmp_path):
+    cache = cache_at(tmp_path)
+    cache.set('parent', "from the master", 'v1')
+    parent_conn = cache._connect()
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = (cache._connect() is not parent_conn and cache.get('parent', 'v1') == "from the master")
+            cache.set('child', "from a worker", 'v1')
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert cache._connect() is parent_conn
+    assert cache.get('child', 'v1') == "from a worker"
@@ -0,0 +1,27 @@
+"""Scoring retrieved passages against the question that found them"""
+from retrieval import BM25Index, Passage
+
+
+def passage(n, question, answer):
+    return Passage(n, 'faq.json', 'faq', f"Q: {question}\nA: {answer}", question, answer)
+
+
+INDEX = BM25Index([
+    passage(0, "What is a SWOT analysis?", "A structured look at strengths and weaknesses."),
+    passage(1, "Can I focus on one part, like competitor analysis?", "Yes, pick the parts you need."),
+    passage(2, "How much does branding cost?", "Pricing depends on the package."),
+])
+
+
+def test_coverage_is_one_when_every_term_is_present():
+    assert INDEX.coverage("What is a SWOT analysis?", INDEX.passages[0]) == 1.0
+
+
+def test_one_shared_common_word_scores_low():
+    _, best = INDEX.search("What is the weather like today?", 1)[0]
+    assert best is INDEX.passages[1]
+    assert INDEX.coverage("What is the weather like today?", best) < 0.5
+
+
+def test_query_without_index_terms_scores_zero():
+    assert INDEX.coverage("is it", INDEX.passages[0]) == 0.0
@@ -0,0 +1,97 @@
+"""The chat routes of both apps, against the in-memory stand-ins"""
+import pytest
+
+from circuit import CircuitBreaker
+from llm_pool import LLMPool
+from rate_limit import RateLimiter
+
+APPS = ['main', 'test']
+
+
+@pytest.mark.parametrize('name', APPS)
+def test_cookieless_burst_is_rate_limited(load_app, monkeypatch, tmp_path, name):
+    module = load_app(name)
+    limiter = RateLimiter(str(tmp_path / 'limits.sqlite3'), session_rate=1, session_burst=2, qps=0,
+                          tokens_per_minute=0)
+    monkeypatch.setattr(module, 'llm_pool', LLMPool(limiter=limiter, max_wait=0.5))
+    statuses = []
+    for n in range(5):
+        # A new client each time: no cookie, so a new chat every request
+        client = module.app.test_client()
+        response = client.post('/process_custom_input', json={'input': f"Tell me a story about falcons {n}"})
+        statuses.append(response.status_code)
+    assert statuses[:2] == [200, 200]
+    assert statuses[2:] == [429, 429, 429]
+
+
+@pytest.mark.parametrize('name', APPS)
+@pytest.mark.parametrize('body', [{'option': 'Services', 'path': 'Services'}, {'option': 'Services', 'path': [{}]},
+                                  {'option': ['Services'], 'path': []}, {'option': 'Services', 'path': [['a']]},
+                                  ['Services']])
+def test_malformed_menu_path_gets_the_empty_reply(load_app, name, body):
+    client = load_app(name).app.test_client()
+    response = client.post('/get_menu_options', json=body)
+    assert response.status_code == 200
+    assert response.get_json() == {'options': [], 'bot_response': '', 'path': []}
+
+
+@pytest.mark.parametrize('name', APPS)
+def test_menu_click_is_answered(load_app, name):
+    client = load_app(name).app.test_client()
+    reply = client.post('/get_menu_options', json={'option': 'Services', 'path': []}).get_json()
+    assert reply['path'] == ['Services'] and reply['options']
+
+
+class BlockedChunk:
+    @property
+    def text(self):
+        # What google.generativeai raises for a candidate stopped for safety
+        raise ValueError("Invalid operation: The `response.text` quick accessor requires the response to contain a "
+                         "valid `Part`, but none were returned.")
+
+
+class BlockingModel:
+    model_name = 'models/blocking'
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        return iter([BlockedChunk()]) if stream else BlockedChunk()
+
+
+@pytest.mark.parametrize('name', APPS)
+def test_blocked_answers_do_not_open_the_breaker(load_app, monkeypatch, name):
+    module = load_app(name)
+    breaker = CircuitBreaker('gemini', failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(module, 'gemini_breaker', breaker)
+    monkeypatch.setattr(module, 'model', BlockingModel())
+    client = module.app.test_client()
+    for n in range(4):
+        response = client.post('/process_custom_input', json={'input': f"Write something unpleasant about owls {n}"})
+        assert response.status_code == 200
+        assert response.get_data(as_text=True)
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()['failures'] == 0
+
+
+def chat_docs(module, chat_id):
+    module.firestore_writer.flush(timeout=5)
+    return {path: doc for path, doc in module.db.get().docs.items() if path[:2] == ('chats', chat_id)}
+
+
+@pytest.mark.parametrize('name', APPS)
+def test_chat_document_is_written_with_the_first_message(load_app, name):
+    module = load_app(name)
+    client = module.app.test_client()
+    client.get('/')
+    client.post('/reset')
+    with client.session_transaction() as stored:
+        chat_id = stored['chat_id']
+    # Opening the page and starting over write nothing
+    assert chat_docs(module, chat_id) == {}
+
+    client.post('/get_menu_options', json={'option': 'Services', 'path': []})
+    docs = chat_docs(module, chat_id)
+    assert docs[('chats', chat_id)]['status'] == 'active'
+    messages = [doc for path, doc in docs.items() if len(path) == 4 and path[2] == 'messages']
+    assert any(m['sender'] == 'user' and 'Services' in m['content'] for m in messages)
+    with client.session_transaction() as stored:
+        assert 'chat_pending' not in stored
@@ -0,0 +1,85 @@
+"""Coalescing identical generations: handover, retries and the follower cap"""
+import pytest
+
+from singleflight import SingleFlight
+
+
+class RateLimited(Exception):
+    pass
+
+
+def test_follower_takes_over_when_the_leader_disconnects():
+    group = SingleFlight()
+    produce = lambda: iter(['a', 'b', 'c'])
+    flight, leader = group.join('key')
+    assert leader
+    lead = flight.run(produce)
+    assert next(lead) == 'a'
+    follower, leader = group.join('key')
+    assert not leader
+    follow = follower.follow(produce)
+    assert next(follow) == 'a'
+
+    lead.close()
+    assert list(follow) == ['b', 'c']
+    assert group.stats['promoted'] == 1
+    assert flight.done and flight.error is None
+    assert group.in_flight() == 0
+
+
+def test_generation_stops_once_nobody_is_reading():
+    group = SingleFlight()
+    closed = []
+
+    def produce():
+        try:
+            yield 'a'
+            yield 'b'
+        finally:
+            closed.append(True)
+
+    flight, _ = group.join('key')
+    lead = flight.run(produce)
+    next(lead)
+    lead.close()
+    assert closed and flight.done and group.in_flight() == 0
+
+
+def test_follower_retries_when_the_leader_was_rate_limited():
+    group = SingleFlight(private_errors=(RateLimited,))
+    flight, _ = group.join('key')
+    follower, _ = group.join('key')
+
+    def limited():
+        raise RateLimited()
+        yield
+
+    with pytest.raises(RateLimited):
+        list(flight.run(limited))
+    assert list(follower.follow(lambda: iter(['own', 'answer']))) == ['own', 'answer']
+    assert group.stats['retried'] == 1
+
+
+def test_other_failures_reach_followers():
+    group = SingleFlight(private_errors=(RateLimited,))
+    flight, _ = group.join('key')
+    follower, _ = group.join('key')
+
+    def broken():
+        raise ValueError("upstream")
+        yield
+
+    with pytest.raises(ValueError):
+        list(flight.run(broken))
+    with pytest.raises(ValueError):
+        list(follower.follow(lambda: iter(['never'])))
+
+
+def test_followers_are_capped():
+    group = SingleFlight(max_followers=1)
+    flight, _ = group.join('key')
+    assert group.join('key') == (flight, False)
+    extra, leader = group.join('key')
+    assert leader and extra is not flight
+    assert group.flights['key'] is flight
+    assert group.stats['overflow'] == 1
@@ -0,0 +1,93 @@
+"""Per-process clients and startup timings for preloaded workers"""
+import os
+import threading
+
+from flask import Flask
+
+from worker import LazyClient, WorkerStartup
+
+
+class Client:
+    def __init__(self):
+        self.pid = os.getpid()
+
+    def ping(self):
+        return 'pong'
+
+
+def test_client_is_created_on_first_use_only():
+    made = []
+
+    def factory():
+        made.append(Client())
+        return made[-1]
+
+    client = LazyClient(factory, 'test')
+    assert not client.initialized and not made
+    assert client.ping() == 'pong'
+    assert client.pid == os.getpid()
+    assert client.get() is made[0]
+    assert client.initialized and len(made) == 1
+
+
+def test_concurrent_first_use_creates_one_client():
+    made = []
+    start = threading.Barrier(8)
+
+    def factory():
+        made.append(Client())
+        return made[-1]
+
+    client = LazyClient(factory, 'test')
+
+    def use():
+        start.wait()
+        client.get()
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(made) == 1
+
+
+def test_forked_worker_creates_its_own_client():
+    client = LazyClient(Client, 'test')
+    parent = client.get()
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = (not client.initialized and client.get() is not parent and client.pid == os.getpid()
+                  and client.get() is client.get())
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert client.get() is parent
+
+
+def test_startup_records_load_ready_and_first_request():
+    startup = WorkerStartup()
+    app = Flask(__name__)
+    startup.install(app)
+    app.add_url_rule('/', 'index', lambda: 'ok')
+    steps = []
+    startup.loaded()
+
+    def failing():
+        raise RuntimeError("model unreachable")
+
+    # A failing warm-up step is logged and the worker still becomes ready
+    startup.warm_up(failing, lambda: steps.append('warm'))
+    assert steps == ['warm']
+    assert startup.stats()['first_request_ms'] is None
+    client = app.test_client()
+    client.get('/')
+    first = startup.first_request_seconds
+    client.get('/')
+    stats = startup.stats()
+    assert startup.first_request_seconds == first
+    assert stats['pid'] == os.getpid()
+    assert None not in (stats['load_ms'], stats['ready_ms'], stats['first_request_ms'])
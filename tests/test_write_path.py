@@ -0,0 +1,108 @@
+"""Write-behind batching and the SQLite spool against the in-memory Firestore stand-in"""
+import threading
+
+import pytest
+
+from fakes import FakeFirestore, Latency
+from chat_index import clean_contact
+from spool import WriteSpool
+from write_behind import PendingWrite, WriteBehindQueue
+
+BAD = {'contact_info': {'': 'x'}}
+
+
+def message(chat_id, n):
+    return PendingWrite('set', ('chats', chat_id, 'messages', f"m{n}"), {'content': f"message {n}"}, chat_id)
+
+
+@pytest.fixture
+def db():
+    return FakeFirestore()
+
+
+@pytest.fixture
+def spool(tmp_path, db):
+    spool = WriteSpool(str(tmp_path / 'spool.sqlite3'), retry_interval=3600)
+    writer = WriteBehindQueue(db, flush_interval=0.01, on_error=spool.add, healthy=spool.healthy,
+                              on_reject=spool.dead_letter)
+    spool.commit = writer.commit
+    spool.writer = writer
+    yield spool
+    spool._closing.set()
+    writer.close()
+
+
+def test_bad_write_does_not_fail_other_chats(db, spool):
+    writer = spool.writer
+    writer.enqueue('set', ('chats', 'a', 'messages', 'm1'), {'content': 'hello'}, chat_id='a')
+    writer.enqueue('merge', ('chats', 'b'), BAD, chat_id='b')
+    writer.enqueue('set', ('chats', 'c', 'messages', 'm1'), {'content': 'hi'}, chat_id='c')
+    writer.flush(timeout=5)
+
+    assert ('chats', 'a', 'messages', 'm1') in db.docs
+    assert ('chats', 'c', 'messages', 'm1') in db.docs
+    assert writer.stats['rejected'] == 1 and writer.stats['failed'] == 0
+    assert not spool.outage
+    assert spool.pending() == 0
+    assert spool.dead_letters() == 1
+
+
+def test_outage_spools_and_replays(db, spool):
+    db.latency = Latency(failure_rate=1.0)
+    spool.writer.enqueue('set', ('chats', 'a', 'messages', 'm1'), {'content': 'hello'}, chat_id='a')
+    spool.writer.flush(timeout=5)
+    assert spool.outage and spool.pending() == 1
+
+    with pytest.raises(Exception):
+        spool.replay(spool.commit)
+    assert spool.outage and spool.pending() == 1
+
+    db.latency = Latency()
+    assert spool.replay(spool.commit) == 1
+    assert not spool.outage
+    assert ('chats', 'a', 'messages', 'm1') in db.docs
+
+
+def test_replay_dead_letters_a_bad_row_instead_of_blocking(db, spool):
+    spool.add([PendingWrite('merge', ('chats', 'b'), BAD, 'b'), message('a', 1), message('a', 2)])
+    assert spool.outage
+
+    assert spool.replay(spool.commit) == 2
+    assert not spool.outage
+    assert spool.pending() == 0
+    assert spool.dead_letters() == 1
+    assert ('chats', 'a', 'messages', 'm2') in db.docs
+
+
+def test_replay_keeps_rows_that_fail_transiently(db, spool):
+    spool.add([PendingWrite('merge', ('chats', 'b'), BAD, 'b'), message('a', 1)])
+    db.latency = Latency(failure_rate=1.0)
+    with pytest.raises(Exception):
+        spool.replay(spool.commit)
+    # The bad row never gets as far as a commit, so it is dead-lettered even during the outage
+    assert spool.pending() == 1 and spool.dead_letters() == 1
+    assert spool.outage
+
+
+def test_counters_add_up_under_concurrent_writes(db, spool):
+    writer = spool.writer
+
+    def write(chat_id):
+        for n in range(200):
+            writer.enqueue('set', ('chats', chat_id, 'messages', f"m{n}"), {'content': f"message {n}"}, chat_id)
+
+    threads = [threading.Thread(target=write, args=(f"c{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.flush(timeout=10)
+    assert writer.stats['queued'] == writer.stats['committed'] == 1600
+
+
+def test_clean_contact_keeps_known_fields_only():
+    assert clean_contact({'': 'x', 'name': ' Ada ', 'email': '', 'phone': 12345, 'admin': True}) == \
+        {'name': 'Ada', 'phone': '12345'}
+    assert clean_contact({'': 'x'}) is None
+    assert clean_contact(['name']) is None
+    assert clean_contact({'issue': 'x' * 1000})['issue'] == 'x' * 500
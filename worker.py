@@ -0,0 +1,116 @@
+import os
+import time
+import logging
+import threading
+
+from flask import g, request
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class LazyClient:
+    """Proxy that builds its client on first use in each process.
+
+    gRPC channels must not cross a fork(), so with gunicorn's preload_app the
+    master imports the app (its data is then shared copy-on-write) and each
+    worker creates its own client, once, the first time it is touched.
+    Attribute access is forwarded, so callers use it like the client itself.
+    """
+
+    def __init__(self, factory, name):
+        self._factory = factory
+        self._name = name
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    start = time.perf_counter()
+                    self._client = self._factory()
+                    self._pid = pid
+                    logger.info("Created %s client for pid %d in %.0fms", self._name, pid,
+                                (time.perf_counter() - start) * 1000)
+        return self._client
+
+    @property
+    def initialized(self):
+        return self._pid == os.getpid()
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+
+class WorkerStartup:
+    """Cold-start and first-request timings for the current process.
+
+    The clock starts when the app module creates this object and restarts in
+    a forked child, so for a preloaded gunicorn worker "ready" is the time
+    from fork to the end of warm_up().
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.load_seconds = None
+        self.ready_seconds = None
+        self.first_request_seconds = None
+        self._first_request_pid = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        self.started = time.perf_counter()
+        self.ready_seconds = None
+        self.first_request_seconds = None
+        self._lock = threading.Lock()
+
+    def loaded(self):
+        """Mark the end of module-level loading (data files, indexes, caches)"""
+        self.load_seconds = time.perf_counter() - self.started
+        logger.info("App loaded in %.0fms", self.load_seconds * 1000)
+
+    def warm_up(self, *steps):
+        """Run warm-up steps, then record this process as ready"""
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                logger.warning("Warm-up step %s failed: %s", getattr(step, '__qualname__', step), e)
+        self.ready_seconds = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(self.ready_seconds, stage='worker_cold_start')
+        logger.info("Worker %d ready in %.0fms", os.getpid(), self.ready_seconds * 1000)
+
+    def install(self, app):
+        """Log and record the latency of the first request each process serves"""
+        @app.before_request
+        def _first_request_started():
+            if self._first_request_pid != os.getpid():
+                g.first_request_started = time.perf_counter()
+
+        @app.after_request
+        def _first_request_finished(response):
+            started = g.get('first_request_started')
+            if started is not None:
+                with self._lock:
+                    if self._first_request_pid != os.getpid():
+                        self._first_request_pid = os.getpid()
+                        self.first_request_seconds = time.perf_counter() - started
+                        STAGE_SECONDS.observe(self.first_request_seconds, stage='first_request')
+                        logger.info("Worker %d first request %s took %.0fms", os.getpid(), request.path,
+                                    self.first_request_seconds * 1000)
+            return response
+
+    def stats(self):
+        def ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+        return {
+            'pid': os.getpid(),
+            'load_ms': ms(self.load_seconds),
+            'ready_ms': ms(self.ready_seconds),
+            'first_request_ms': ms(self.first_request_seconds)
+        }
@@ -0,0 +1,208 @@
+import os
+import logging
+import time
+import queue
+import atexit
+import threading
+from dataclasses import dataclass, field
+
+from google.api_core.exceptions import InvalidArgument, NotFound
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+# Errors a write gets again however often it is retried (bad field names or values, updates of missing
+# documents); anything else is taken for an outage
+PERMANENT_ERRORS = (ValueError, TypeError, InvalidArgument, NotFound)
+
+
+def is_permanent(error):
+    return isinstance(error, PERMANENT_ERRORS)
+
+
+@dataclass
+class PendingWrite:
+    op: str
+    path: tuple
+    data: dict
+    chat_id: str = None
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class WriteBehindQueue:
+    """Background writer that groups Firestore writes into WriteBatch commits.
+
+    Writes are committed from a single thread in the order they were queued,
+    which keeps every chat's messages in order. A batch is committed once it
+    holds `max_batch` writes or `flush_interval` seconds after its first write,
+    whichever comes first. A batch that fails twice is handed to `on_error`,
+    as is every batch while `healthy()` returns False, so an outage does not
+    hold the queue up behind commit timeouts. Pending writes are flushed when
+    the process exits.
+
+    A batch mixes writes from many chats, so a batch that fails with a
+    permanent error (one bad write) is committed again one write at a time:
+    the bad write goes to `on_reject(writes, error)` and the others go
+    through, or to `on_error` if Firestore fails them for other reasons.
+    """
+
+    def __init__(self, db, max_batch=50, flush_interval=0.2, on_error=None, commit_timeout=30, healthy=None,
+                 on_reject=None):
+        self.db = db
+        self.max_batch = min(max_batch, MAX_BATCH_WRITES)
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.on_reject = on_reject
+        self.commit_timeout = commit_timeout
+        self.healthy = healthy
+        self.queue = queue.Queue()
+        self.stats = {'queued': 0, 'committed': 0, 'failed': 0, 'rejected': 0, 'batches': 0}
+        # Counters are bumped by request threads and the writer thread alike
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._closing = threading.Event()
+        atexit.register(self.close)
+        os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        # The writer thread may have held the lock at fork() and does not exist in the child
+        self._lock = threading.Lock()
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self.stats[key] += n
+
+    def _ensure_started(self):
+        # Started lazily so that each forked worker gets its own writer thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='firestore-write-behind', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, op, path, data, chat_id=None):
+        """Queue a 'set', 'merge' or 'update' of the document at path"""
+        self._ensure_started()
+        self.queue.put(PendingWrite(op, tuple(path), data, chat_id))
+        self._count(queued=1)
+
+    def add(self, collection_path, data, chat_id=None):
+        """Queue the equivalent of collection.add(data) with a client-generated ID"""
+        doc_id = self._ref(collection_path).document().id
+        self.enqueue('set', tuple(collection_path) + (doc_id,), data, chat_id)
+
+    def _ref(self, path):
+        """Resolve ('chats', id, 'messages', ...) to a collection or document reference"""
+        ref = self.db.collection(path[0])
+        for i, part in enumerate(path[1:]):
+            ref = ref.document(part) if i % 2 == 0 else ref.collection(part)
+        return ref
+
+    def commit(self, writes):
+        """Commit writes as one WriteBatch, now, on the calling thread"""
+        batch = self.db.batch()
+        for write in writes:
+            ref = self._ref(write.path)
+            if write.op == 'update':
+                batch.update(ref, write.data)
+            else:
+                batch.set(ref, write.data, merge=write.op == 'merge')
+        with span('firestore_write'):
+            batch.commit(timeout=self.commit_timeout)
+
+    def _flush(self, writes):
+        attempts = (1, 2) if self.healthy is None or self.healthy() else ()
+        for attempt in attempts:
+            try:
+                self.commit(writes)
+                self._count(committed=len(writes), batches=1)
+                return
+            except Exception as e:
+                logger.warning("Firestore batch commit of %d writes failed (attempt %d): %s", len(writes), attempt, e)
+                if is_permanent(e):
+                    self._fail(self.commit_each(writes))
+                    return
+        self._fail(writes)
+
+    def commit_each(self, writes):
+        """Commit writes one at a time, rejecting the ones Firestore never accepts; returns those that failed otherwise"""
+        failed = []
+        for write in writes:
+            try:
+                self.commit([write])
+                self._count(committed=1, batches=1)
+            except Exception as e:
+                if not is_permanent(e):
+                    failed.append(write)
+                    continue
+                logger.error("Firestore rejected a %s of %s: %s", write.op, '/'.join(write.path), e)
+                self._count(rejected=1)
+                if self.on_reject:
+                    try:
+                        self.on_reject([write], e)
+                    except Exception as e:
+                        logger.exception("Write-behind reject handler failed: %s", e)
+        return failed
+
+    def _fail(self, writes):
+        if not writes:
+            return
+        self._count(failed=len(writes))
+        if self.on_error:
+            try:
+                self.on_error(writes)
+            except Exception as e:
+                logger.exception("Write-behind error handler failed: %s", e)
+
+    def _drain(self, first):
+        writes = [first]
+        deadline = first.enqueued_at + self.flush_interval
+        while len(writes) < self.max_batch:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0 and not self._closing.is_set():
+                    writes.append(self.queue.get(timeout=remaining))
+                else:
+                    writes.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return writes
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._closing.is_set():
+                    return
+                continue
+            writes = self._drain(first)
+            self._flush(writes)
+            for _ in writes:
+                self.queue.task_done()
+
+    def flush(self, timeout=None):
+        """Block until every queued write has been committed or handed to on_error"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.time() + timeout if timeout else None
+        while self.queue.unfinished_tasks:
+            if deadline and time.time() > deadline:
+                logger.warning("Write-behind flush timed out with %d writes pending", self.queue.unfinished_tasks)
+                return
+            time.sleep(0.01)
+
+    def close(self, timeout=10):
+        """Flush pending writes and stop the writer thread"""
+        self._closing.set()
+        if self._pid == os.getpid():
+            self.flush(timeout)